@@ -0,0 +1,206 @@
+#Checks that the hot endpoints (listings, lookups, ownership checks, writes) never fetch learnings.embedding.
+#Every request below is sent through the app with the database swapped for a recorder, so no postgres is needed:
+#each query is inspected before it would run. Exits 1 (and prints the SQL) if one of them selects the embedding.
+
+#run before deploying / in CI:
+#python -m app.audit_queries
+#python -m app.audit_queries --verbose   (prints every query per endpoint)
+import os
+import re
+import sys
+import argparse
+from contextlib import asynccontextmanager
+
+os.environ.setdefault("JWT_SECRET_KEY", "audit")
+os.environ.setdefault("OPENAI_API_KEY", "audit")
+
+from fastapi.testclient import TestClient
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import ClauseElement
+from sqlalchemy.dialects import postgresql
+from app.db import database
+from app.models.learnings import learnings
+from app.auth.jwt import create_access_token
+
+USER_ID = 1
+PROJECT_ID = 1
+LEARNING_ID = 1
+LEARNING = {"file_path": "src/app.py", "function_name": "main", "library_name": "fastapi", "description": "audit", "code_snippet": "pass"}
+
+#(method, path, json body) -> every request the extension / cli / dashboard sends on a normal day
+HOT_ENDPOINTS = [
+    ("GET", f"/users/{USER_ID}/learnings", None),
+    ("GET", f"/users/{USER_ID}/learnings?summary=true", None),
+    ("GET", f"/users/{USER_ID}/learnings/export", None),
+    ("GET", f"/projects/{PROJECT_ID}/learnings", None),
+    ("GET", f"/users/{USER_ID}/learnings/library/fastapi", None),
+    ("GET", f"/users/{USER_ID}/learnings/function/main", None),
+    ("GET", f"/users/{USER_ID}/learnings/grouped?by=project", None),
+    ("GET", f"/users/{USER_ID}/libraries", None),
+    ("GET", f"/users/{USER_ID}/functions", None),
+    ("GET", f"/users/{USER_ID}/favorites", None),
+    ("GET", f"/users/{USER_ID}/projects", None),
+    ("GET", f"/projects/{PROJECT_ID}", None),
+    ("POST", f"/projects/{PROJECT_ID}/learnings", LEARNING),
+    ("POST", f"/projects/{PROJECT_ID}/learnings/bulk", [LEARNING]),
+    ("POST", f"/users/{USER_ID}/favorites", {"learning_id": LEARNING_ID}),
+    ("DELETE", f"/users/{USER_ID}/favorites?learning_id={LEARNING_ID}", None),
+    ("DELETE", f"/learnings/{LEARNING_ID}", None),
+]
+
+#endpoints that stream their body from database.iterate
+STREAMING_ENDPOINTS = [
+    f"/users/{USER_ID}/learnings/export",
+    f"/users/{USER_ID}/learnings/library/fastapi",
+    f"/users/{USER_ID}/learnings/function/main",
+    f"/users/{USER_ID}/learnings/grouped?by=project",
+]
+
+
+class AnyRecord(dict):
+    #row where every column exists: ids / owners are USER_ID, so ownership checks pass and the handler goes on.
+    #positional row[0] is the single text column of a query postgres builds JSON in (grouped listings) -> "{}"
+    def __init__(self):
+        super().__init__(id=USER_ID)
+
+    def __missing__(self, key):
+        return "{}" if key == 0 else USER_ID
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def install(self):
+        recorder = self
+
+        async def fetch_one(query, values=None):
+            recorder.queries.append(query)
+            return AnyRecord()
+
+        async def fetch_all(query, values=None):
+            recorder.queries.append(query)
+            return [AnyRecord()]
+
+        async def execute(query, values=None):
+            recorder.queries.append(query)
+            return USER_ID
+
+        async def iterate(query, values=None):
+            recorder.queries.append(query)
+            yield AnyRecord()
+
+        @asynccontextmanager
+        async def transaction(*args, **kwargs):
+            yield
+
+        database.fetch_one = fetch_one
+        database.fetch_all = fetch_all
+        database.fetch_val = fetch_one
+        database.execute = execute
+        database.iterate = iterate
+        database.transaction = transaction
+
+
+def install_failing_iterate(after_rows: int):
+    #database.iterate that raises after yielding `after_rows` rows
+    async def iterate(query, values=None):
+        for _ in range(after_rows):
+            yield AnyRecord()
+        raise ConnectionError(f"audit: database failed after {after_rows} rows")
+
+    database.iterate = iterate
+
+
+def check_stream_failures(app, headers) -> int:
+    #-> endpoints that hid a database failure from the client
+    failures = 0
+    #not raising -> the status code the client gets is visible
+    client = TestClient(app, raise_server_exceptions=False)
+    for path in STREAMING_ENDPOINTS:
+        #before anything is sent: must be a real error status
+        install_failing_iterate(0)
+        status_code = client.get(path, headers=headers).status_code
+        early = "ok" if status_code >= 500 else "FAIL"
+        #after the 200 went out: the body must break (the test client raises), not end as if it were complete
+        install_failing_iterate(1)
+        try:
+            TestClient(app, raise_server_exceptions=True).get(path, headers=headers)
+            late = "FAIL"
+        except Exception:
+            late = "ok"
+        status = "FAIL" if "FAIL" in (early, late) else "ok"
+        print(f"{status:<5}{'GET':<7}{path:<52}database fails on first row: HTTP {status_code}, mid-stream: {'broken body' if late == 'ok' else 'complete body'}")
+        failures += status == "FAIL"
+    return failures
+
+
+def selects_embedding(query) -> bool:
+    if isinstance(query, str):
+        #raw SQL: the embedding named anywhere in a select list
+        return any(re.search(r"\bembedding\b", part) for part in re.findall(r"select(.*?)\bfrom\b", query, re.I | re.S))
+    for column in getattr(query, "selected_columns", None) or []:
+        for element in visitors.iterate(column):
+            if element is learnings.c.embedding:
+                return True
+    return False
+
+
+def render(query) -> str:
+    if isinstance(query, ClauseElement):
+        return str(query.compile(dialect=postgresql.dialect())).replace("\n", " ")
+    return str(query)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m app.audit_queries", description="Fail if a hot endpoint selects learnings.embedding")
+    parser.add_argument("--verbose", action="store_true", help="print every query")
+    return parser.parse_args(argv)
+
+
+def main(argv) -> int:
+    args = parse_args(argv)
+    from app.main import app
+
+    recorder = QueryRecorder()
+    recorder.install()
+    #no `with`: startup (database.connect, background workers) must not run.
+    #server exceptions are raised here -> a streamed body that fails after its 200 was sent counts too
+    client = TestClient(app, raise_server_exceptions=True)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(USER_ID)})}"}
+
+    failures = 0
+    for method, path, body in HOT_ENDPOINTS:
+        recorder.queries = []
+        error = None
+        try:
+            #reads the whole body, so every query of a streaming endpoint is recorded as well
+            response = client.request(method, path, json=body, headers=headers)
+            outcome = f"HTTP {response.status_code}"
+            if response.status_code >= 500:
+                error = outcome
+        except Exception as e:
+            error = outcome = f"{type(e).__name__}: {e}"
+        offending = [q for q in recorder.queries if selects_embedding(q)]
+        #a handler that crashed may not have sent all of its queries -> can't vouch for it
+        status = "FAIL" if offending or error else "ok"
+        print(f"{status:<5}{method:<7}{path:<52}{len(recorder.queries)} queries, {outcome}")
+        for query in (recorder.queries if args.verbose else offending):
+            print(f"       {render(query)}")
+        failures += status == "FAIL"
+
+    if failures:
+        print(f"{failures} endpoint(s) failed: selecting learnings.embedding (use the column sets in app/services/queries.py) or erroring")
+        return 1
+    print(f"No hot endpoint selects learnings.embedding ({len(HOT_ENDPOINTS)} checked)")
+
+    hidden = check_stream_failures(app, headers)
+    if hidden:
+        print(f"{hidden} streaming endpoint(s) hide a database failure from the client")
+        return 1
+    print(f"Streaming endpoints report database failures ({len(STREAMING_ENDPOINTS)} checked)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
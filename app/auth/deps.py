@@ -3,8 +3,9 @@ from jose import JWTError, jwt
 import os
 from app.db import database, execute_with_reconnect
 from app.models.api_keys import api_keys
-from sqlalchemy import select, join
-from app.models.users import users
+from sqlalchemy import select
+from app.services.api_key_cache import api_key_cache, token_digest
+from app.services.project_ownership import project_ownership
 from dotenv import load_dotenv
 
 #GOAL: get the user_id from the auth token or api key
@@ -15,11 +16,24 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 ALGORITHM = "HS256"
 
 
-async def get_user_from_api_key(api_key: str) -> int:
-    #join API keys and users to find all user ids with that api key
-    query = select(users.c.id).select_from(
-        join(api_keys, users, api_keys.c.user_id == users.c.id)
-    ).where(api_keys.c.token == api_key)
+class AuthContext:
+    #who is calling, and for api keys the project the key was issued for (None for dashboard / extension tokens)
+    def __init__(self, user_id: int, project_id: int = None):
+        self.user_id = user_id
+        self.project_id = project_id
+
+
+async def get_user_from_api_key(api_key: str) -> AuthContext:
+    #resolved keys (and unknown ones) are cached in process -> steady state cli requests skip the database
+    digest = token_digest(api_key)
+    if api_key_cache.is_invalid(digest):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    cached = api_key_cache.get(digest)
+    if cached is not None:
+        return AuthContext(cached.user_id, cached.project_id)
+
+    #users.id is guaranteed by the foreign key (ON DELETE CASCADE) -> no join needed
+    query = select(api_keys.c.user_id, api_keys.c.project_id).where(api_keys.c.token_digest == digest)
     
     try:
         # Use the simple reconnection wrapper
@@ -27,22 +41,20 @@ async def get_user_from_api_key(api_key: str) -> int:
             database.fetch_one, 
             query
         )
-        
-        if not result:
-            raise HTTPException(status_code=401, detail="Invalid API key")
-        return result['id']
-        
-    except Exception as e:
-        # If it's an auth error, re-raise it
-        if "Invalid API key" in str(e):
-            raise e
-        # Otherwise, it's a connection error
+    except Exception:
+        # it's a connection error
         raise HTTPException(status_code=500, detail="Database connection error")
 
-async def get_current_user_id(
+    if not result:
+        api_key_cache.put_invalid(digest)
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    api_key_cache.put(digest, result["user_id"], result["project_id"])
+    return AuthContext(result["user_id"], result["project_id"])
+
+async def get_auth_context(
     #gets the authorization header from the HTTP request
     authorization: str = Header(None)
-) -> int:
+) -> AuthContext:
     #if no authorization header, throw error
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header missing")
@@ -61,7 +73,7 @@ async def get_current_user_id(
             if user_id is None:
                 raise HTTPException(status_code=401, detail="Invalid token")
             #return the user_id
-            return int(user_id)
+            return AuthContext(int(user_id))
         except JWTError:
             raise HTTPException(status_code=401, detail="Invalid token")
     
@@ -71,3 +83,14 @@ async def get_current_user_id(
     
     
     raise HTTPException(status_code=401, detail="Invalid authorization type")
+
+async def get_current_user_id(auth: AuthContext = Depends(get_auth_context)) -> int:
+    return auth.user_id
+
+async def require_project_owner(project_id: int, auth: AuthContext = Depends(get_auth_context)) -> int:
+    #for routes with {project_id} in the path -> the caller's user_id, or 403.
+    #an api key is only ever issued for a project its user owns (and keeps the project from being deleted), so a cli
+    #request for the key's own project needs no lookup at all; everything else is answered from project_ownership
+    if auth.project_id != project_id and not await project_ownership.owns(auth.user_id, project_id):
+        raise HTTPException(status_code=403, detail="Project not found or not owned by you")
+    return auth.user_id
@@ -0,0 +1,8 @@
+# app/benchmarks
+#offline benchmarks: openAI is replaced by deterministic local stand-ins (fakes.py) and a local postgres is
+#seeded with synthetic users / learnings (seed.py). Run with python -m app.benchmarks.<name>:
+#  retrieval -> /rag/query stage latencies + recall@3 against exact search, written as JSON
+#  load      -> whole-API traffic mix (JWT + API key auth) against a stub openAI server (stub_openai.py):
+#               per-endpoint throughput / errors / latency histograms + db pool saturation
+#  listing   -> bytes / time per request of listings + ownership checks with and without learnings.embedding
+#  login_burst -> p50 / p95 / p99 of background traffic before / during / after a burst of logins (bcrypt cost)
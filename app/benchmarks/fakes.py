@@ -0,0 +1,113 @@
+# app/benchmarks/fakes.py
+
+import asyncio
+import hashlib
+from typing import Optional
+import numpy as np
+from app.models.vector import EMBEDDING_DIMENSIONS
+
+
+def _seed_for(text: str) -> int:
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class FakeEmbedder:
+    #stands in for app.services.embedder: same text -> same unit vector, after a configurable delay.
+    #benchmarks register the vector a text should map to (e.g. a query near a known learning), any
+    #other text gets a pseudo-random vector seeded by its hash
+    def __init__(self, latency_ms: float = 80.0, jitter_ms: float = 0.0, dimensions: int = EMBEDDING_DIMENSIONS, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.dimensions = dimensions
+        self._rng = np.random.default_rng(seed)
+        self._registered: dict[str, np.ndarray] = {}
+        self.calls = 0
+        self.inputs = 0
+
+    def _delay(self) -> float:
+        jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def register(self, text: str, vector):
+        self._registered[text] = np.asarray(vector, dtype=np.float32)
+
+    def vector_for(self, text: str) -> np.ndarray:
+        vector = self._registered.get(text)
+        if vector is None:
+            vector = np.random.default_rng(_seed_for(text)).standard_normal(self.dimensions).astype(np.float32)
+            vector /= np.linalg.norm(vector)
+        return vector
+
+    async def embed(self, text: str) -> np.ndarray:
+        self.calls += 1
+        self.inputs += 1
+        await asyncio.sleep(self._delay())
+        return self.vector_for(text)
+
+    async def embed_many(self, texts: list[str], batch_size: int = 100, concurrency: int = 4, return_exceptions: bool = False, rate_limiter=None, use_cache: bool = True) -> list:
+        #one delay per api call, `concurrency` calls at a time (like the real embed_many)
+        batches = (len(texts) + batch_size - 1) // batch_size
+        self.calls += batches
+        self.inputs += len(texts)
+        rounds = (batches + concurrency - 1) // max(concurrency, 1)
+        await asyncio.sleep(self._delay() * rounds)
+        return [self.vector_for(t) for t in texts]
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "inputs": self.inputs}
+
+
+class FakeLLM:
+    #stands in for app.services.llm: deterministic answer per prompt after a time-to-first-token delay,
+    #streamed in `chunks` pieces `chunk_ms` apart
+    def __init__(self, latency_ms: float = 800.0, chunk_ms: float = 20.0, chunks: int = 20):
+        self.latency_ms = latency_ms
+        self.chunk_ms = chunk_ms
+        self.chunks = chunks
+        self.calls = 0
+
+    def answer_for(self, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return " ".join(f"token{digest[i % 64]}{i}" for i in range(self.chunks))
+
+    async def call(self, prompt: str) -> str:
+        self.calls += 1
+        await asyncio.sleep((self.latency_ms + self.chunk_ms * self.chunks) / 1000)
+        return self.answer_for(prompt)
+
+    async def stream(self, prompt: str):
+        self.calls += 1
+        await asyncio.sleep(self.latency_ms / 1000)
+        for i, token in enumerate(self.answer_for(prompt).split(" ")):
+            if i:
+                await asyncio.sleep(self.chunk_ms / 1000)
+            yield token + " "
+
+    async def summarize(self, previous_summary: str, transcript: str, max_tokens: int) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency_ms / 1000)
+        return f"summary of {len(transcript)} chars"
+
+    def stats(self) -> dict:
+        return {"calls": self.calls}
+
+
+def install(embedder: FakeEmbedder, llm: Optional[FakeLLM] = None):
+    #patches every module that imported the real functions by name (rag, embedding worker, prompt budget)
+    import app.services.embedder as embedder_module
+    import app.services.llm as llm_module
+    import app.services.embedding_queue as embedding_queue
+    import app.services.prompt_budget as prompt_budget
+    import app.routers.rag as rag
+
+    embedder_module.embed = embedder.embed
+    embedder_module.embed_many = embedder.embed_many
+    rag.embed = embedder.embed
+    embedding_queue.embed_many = embedder.embed_many
+    if llm is not None:
+        llm_module.call_gpt4_llm = llm.call
+        llm_module.stream_gpt4_llm = llm.stream
+        llm_module.summarize_conversation = llm.summarize
+        rag.call_gpt4_llm = llm.call
+        rag.stream_gpt4_llm = llm.stream
+        prompt_budget.summarize_conversation = llm.summarize
@@ -0,0 +1,147 @@
+#What leaving learnings.embedding out of listings / ownership checks saves, per request.
+
+#Seeds N users x K learnings into the configured (local) postgres and runs each hot query two ways:
+#"full" (select(learnings), as the endpoints used to) and "light" (the column sets in app/services/queries.py).
+#Reports rows, bytes per request (sum of pg_column_size over the result rows, ~ what goes over the wire) and
+#fetch time (send + decode in this process) p50/p95. Results go to bench-results/listing-<commit>-<time>.json.
+
+#python -m app.benchmarks.listing --users 5 --per-user 1000 --repeat 50
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from sqlalchemy import select, join, func
+from app.db import database
+from app.models.learnings import learnings
+from app.models.project import projects
+from app.services.queries import LEARNING_OWNER_COLUMNS
+from app.services.learning_pages import learning_columns, LEARNINGS_PAGE_SIZE
+from app.benchmarks.seed import seed, cleanup
+from app.benchmarks.retrieval import git_commit, summarize
+
+USER_FIELDS = ["id", "file_path", "function_name", "library_name", "description", "code_snippet"]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m app.benchmarks.listing", description="Bytes / time saved by not selecting the embedding")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--per-user", type=int, default=1000, help="learnings per user")
+    parser.add_argument("--repeat", type=int, default=30, help="runs of every query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="listing")
+    parser.add_argument("--keep", action="store_true", help="leave the seeded rows in the database")
+    parser.add_argument("--out", help="JSON output (default: bench-results/listing-<commit>-<time>.json)")
+    return parser.parse_args(argv)
+
+
+def cases(user_id: int, project_id: int, learning_id: int) -> dict:
+    #name -> (full query, light query)
+    owner_join = join(learnings, projects, learnings.c.project_id == projects.c.id)
+    return {
+        #before pagination the endpoint returned everything -> compare whole corpus and one page
+        "user_learnings_all": (
+            select(learnings).where(learnings.c.user_id == user_id),
+            select(*learning_columns(USER_FIELDS, False)).where(learnings.c.user_id == user_id)
+        ),
+        "user_learnings_page": (
+            select(learnings).where(learnings.c.user_id == user_id).order_by(learnings.c.id).limit(LEARNINGS_PAGE_SIZE),
+            select(*learning_columns(USER_FIELDS, False)).where(learnings.c.user_id == user_id).order_by(learnings.c.id).limit(LEARNINGS_PAGE_SIZE)
+        ),
+        "user_learnings_summary_page": (
+            select(learnings).where(learnings.c.user_id == user_id).order_by(learnings.c.id).limit(LEARNINGS_PAGE_SIZE),
+            select(*learning_columns(USER_FIELDS, True)).where(learnings.c.user_id == user_id).order_by(learnings.c.id).limit(LEARNINGS_PAGE_SIZE)
+        ),
+        "project_learnings": (
+            select(learnings).where(learnings.c.project_id == project_id),
+            select(*learning_columns(USER_FIELDS + ["project_id", "user_id"], False)).where(learnings.c.project_id == project_id)
+        ),
+        "learning_ownership": (
+            select(learnings, projects.c.user_id).select_from(owner_join).where(learnings.c.id == learning_id),
+            select(*LEARNING_OWNER_COLUMNS).select_from(owner_join).where(learnings.c.id == learning_id)
+        ),
+    }
+
+
+async def result_bytes(query) -> int:
+    subquery = query.subquery()
+    row = await database.fetch_one(select(func.coalesce(func.sum(func.pg_column_size(subquery.table_valued())), 0)))
+    return int(row[0])
+
+
+async def measure(query, repeat: int) -> dict:
+    timings = []
+    rows = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = await database.fetch_all(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"rows": len(rows), "bytes": await result_bytes(query), "time": summarize(timings)}
+
+
+async def run(args) -> dict:
+    await cleanup(args.prefix)
+    print(f"Seeding {args.users} users x {args.per_user} learnings...")
+    corpus = await seed(args.prefix, args.users, args.per_user, 8, args.seed)
+    results = {}
+    try:
+        by_user = corpus.by_user()
+        for user_id in corpus.user_ids:
+            ids, _ = by_user[user_id]
+            for name, (full, light) in cases(user_id, corpus.project_ids[user_id], int(ids[len(ids) // 2])).items():
+                #warm both (plans, buffers) before timing
+                await database.fetch_all(full)
+                await database.fetch_all(light)
+                results.setdefault(name, []).append((await measure(full, args.repeat), await measure(light, args.repeat)))
+    finally:
+        if not args.keep:
+            await cleanup(args.prefix)
+
+    report = {}
+    for name, pairs in results.items():
+        full_bytes = sum(f["bytes"] for f, _ in pairs) / len(pairs)
+        light_bytes = sum(l["bytes"] for _, l in pairs) / len(pairs)
+        full_ms = sum(f["time"]["p50_ms"] for f, _ in pairs) / len(pairs)
+        light_ms = sum(l["time"]["p50_ms"] for _, l in pairs) / len(pairs)
+        report[name] = {
+            "rows": pairs[0][0]["rows"],
+            "full": {"bytes": round(full_bytes), "p50_ms": round(full_ms, 3), "p95_ms": round(sum(f["time"]["p95_ms"] for f, _ in pairs) / len(pairs), 3)},
+            "light": {"bytes": round(light_bytes), "p50_ms": round(light_ms, 3), "p95_ms": round(sum(l["time"]["p95_ms"] for _, l in pairs) / len(pairs), 3)},
+            "bytes_saved": round(full_bytes - light_bytes),
+            "bytes_saved_share": round(1 - light_bytes / full_bytes, 4) if full_bytes else 0.0,
+            "ms_saved": round(full_ms - light_ms, 3),
+            "speedup": round(full_ms / light_ms, 2) if light_ms else None
+        }
+        print(f"  {name:<28} {report[name]['rows']:>6} rows  {round(full_bytes):>10} -> {round(light_bytes):>9} bytes  {full_ms:>8.2f} -> {light_ms:>7.2f} ms p50")
+
+    return {
+        "benchmark": "listing",
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "args": {key: value for key, value in vars(args).items() if key != "out"},
+        "cases": report
+    }
+
+
+async def main(argv) -> int:
+    args = parse_args(argv)
+    logging.getLogger("app").setLevel(logging.WARNING)
+    await database.connect()
+    try:
+        results = await run(args)
+    finally:
+        await database.disconnect()
+
+    out = args.out or os.path.join("bench-results", f"listing-{results['commit']}-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
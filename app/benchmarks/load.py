@@ -0,0 +1,389 @@
+#Load test for the whole API: a weighted mix of learning creation, listing, library / function lookups,
+#favorites and rag queries, authenticated with JWTs and API keys, against a local postgres.
+#openAI is replaced by the stub server (app/benchmarks/stub_openai.py), so embeddings (worker) and
+#powered answers go through the real openAI client code.
+
+#Reports per endpoint: throughput, errors by status, latency percentiles + histogram, and how saturated
+#the database connection pool was. Results are written as JSON like app.benchmarks.retrieval.
+
+#in process (app + stub + load generator in one process, pool stats come straight from asyncpg):
+#python -m app.benchmarks.load --duration 60 --rate 50 --concurrency 32
+#against a running server (start it with OPENAI_BASE_URL=http://127.0.0.1:9100/v1 and run the stub separately):
+#python -m app.benchmarks.load --base-url http://localhost:8000 --no-stub
+import os
+import sys
+import json
+import time
+import random
+import secrets
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+import httpx
+
+#endpoint label -> default weight in the traffic mix
+DEFAULT_MIX = {
+    "create_learning": 5,
+    "list_learnings": 15,
+    "list_project_learnings": 10,
+    "by_library": 12,
+    "by_function": 12,
+    "libraries": 6,
+    "functions": 6,
+    "favorite_add": 4,
+    "favorites": 10,
+    "rag_simple": 16,
+    "rag_powered": 3,
+    "rag_stream": 1,
+}
+
+#latency histogram bucket upper bounds (ms)
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m app.benchmarks.load", description="Load test the API with a realistic traffic mix")
+    parser.add_argument("--base-url", help="test a running server instead of the app in this process")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--rate", type=float, default=50.0, help="requests started per second (poisson arrivals), 0 = as fast as --concurrency allows")
+    parser.add_argument("--concurrency", type=int, default=32, help="max requests in flight")
+    parser.add_argument("--mix", help="comma separated label=weight overrides, e.g. rag_powered=0,create_learning=10")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--per-user", type=int, default=200, help="learnings seeded per user")
+    parser.add_argument("--clusters", type=int, default=8)
+    parser.add_argument("--api-key-share", type=float, default=0.3, help="fraction of requests authenticated with an API key")
+    parser.add_argument("--no-stub", action="store_true", help="don't start the stub openAI server (already running)")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--embed-latency-ms", type=float, default=80.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="load")
+    parser.add_argument("--keep", action="store_true", help="leave the seeded rows in the database")
+    parser.add_argument("--out", help="JSON output (default: bench-results/load-<commit>-<time>.json)")
+    args = parser.parse_args(argv)
+
+    args.weights = dict(DEFAULT_MIX)
+    for item in (args.mix or "").split(","):
+        if item.strip():
+            label, weight = item.split("=")
+            if label.strip() not in DEFAULT_MIX:
+                parser.error(f"unknown endpoint {label!r}, expected one of {', '.join(DEFAULT_MIX)}")
+            args.weights[label.strip()] = float(weight)
+    return args
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.statuses: dict[str, int] = {}
+        self.errors = 0
+
+    def record(self, status: str, ms: float):
+        self.latencies.append(ms)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if not status.startswith("2") and status != "304":
+            self.errors += 1
+
+    def report(self, seconds: float) -> dict:
+        values = np.asarray(self.latencies) if self.latencies else np.zeros(1)
+        counts, _ = np.histogram(values, bins=[0] + BUCKETS_MS + [float("inf")])
+        return {
+            "requests": len(self.latencies),
+            "throughput_rps": round(len(self.latencies) / seconds, 2) if seconds else 0.0,
+            "errors": self.errors,
+            "error_rate": round(self.errors / len(self.latencies), 4) if self.latencies else 0.0,
+            "status_codes": self.statuses,
+            "p50_ms": round(float(np.percentile(values, 50)), 2),
+            "p95_ms": round(float(np.percentile(values, 95)), 2),
+            "p99_ms": round(float(np.percentile(values, 99)), 2),
+            "max_ms": round(float(values.max()), 2),
+            "histogram_ms": {f"<={b}" if b != float("inf") else ">10000": int(c) for b, c in zip(BUCKETS_MS + [float("inf")], counts)}
+        }
+
+
+class PoolSampler:
+    #samples database connection use every `interval` seconds: asyncpg pool of this process, or
+    #(remote server) the server's connections to the database from pg_stat_activity
+    def __init__(self, in_process: bool, interval: float = 0.1):
+        self.in_process = in_process
+        self.interval = interval
+        self.samples: list[tuple[int, int]] = []  #(in use, max)
+        self._task = None
+
+    async def _sample(self) -> tuple[int, int]:
+        from app.db import database
+        if self.in_process:
+            pool = database._backend._pool
+            return pool.get_size() - pool.get_idle_size(), pool.get_max_size()
+        row = await database.fetch_one(
+            "SELECT count(*) FILTER (WHERE state <> 'idle') AS busy, "
+            "(SELECT setting::int FROM pg_settings WHERE name = 'max_connections') AS max "
+            "FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"
+        )
+        return row["busy"], row["max"]
+
+    async def _run(self):
+        while True:
+            try:
+                self.samples.append(await self._sample())
+            except Exception:
+                pass
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def report(self) -> dict:
+        if not self.samples:
+            return {"samples": 0}
+        in_use = np.asarray([s[0] for s in self.samples])
+        limit = max(s[1] for s in self.samples)
+        return {
+            "source": "asyncpg pool" if self.in_process else "pg_stat_activity",
+            "samples": len(self.samples),
+            "max_size": limit,
+            "in_use_mean": round(float(in_use.mean()), 2),
+            "in_use_p95": round(float(np.percentile(in_use, 95)), 2),
+            "in_use_max": int(in_use.max()),
+            #share of samples where every connection was taken -> requests were queueing for one
+            "saturated_share": round(float(np.mean(in_use >= limit)), 4)
+        }
+
+
+class LoadUser:
+    def __init__(self, user_id: int, project_id: int, jwt: str, api_key: str, learning_ids: list[int], libraries: list[str], functions: list[str]):
+        self.user_id = user_id
+        self.project_id = project_id
+        self.jwt = jwt
+        self.api_key = api_key
+        self.learning_ids = learning_ids
+        self.libraries = libraries
+        self.functions = functions
+
+
+async def prepare_users(args) -> list[LoadUser]:
+    from app.db import database
+    from app.auth.jwt import create_access_token
+    from app.models.api_keys import api_keys
+    from app.services.api_key_cache import token_digest
+    from app.benchmarks.seed import seed, cleanup
+
+    await cleanup(args.prefix)
+    print(f"Seeding {args.users} users x {args.per_user} learnings...")
+    corpus = await seed(args.prefix, args.users, args.per_user, args.clusters, args.seed)
+    load_users = []
+    for user_id in corpus.user_ids:
+        #api keys are inserted directly, /generate-key is rate limited to 5/minute
+        token = f"ak_{secrets.token_hex(32)}"
+        await database.execute(api_keys.insert().values(
+            token_digest=token_digest(token), user_id=user_id, project_id=corpus.project_ids[user_id], created_at=datetime.utcnow()
+        ))
+        ids = [i for i, owner in zip(corpus.learning_ids, corpus.learning_users) if owner == user_id]
+        load_users.append(LoadUser(
+            user_id=user_id,
+            project_id=corpus.project_ids[user_id],
+            #long enough for any run
+            jwt=create_access_token({"sub": str(user_id)}, expires_delta=timedelta(hours=6)),
+            api_key=token,
+            learning_ids=ids,
+            libraries=[f"lib{c}" for c in range(args.clusters)],
+            functions=[f"fn{c}_{n}" for c in range(args.clusters) for n in range(3)]
+        ))
+    print(f"  seeded in {corpus.seconds:.1f}s")
+    return load_users
+
+
+def build_request(label: str, user: LoadUser, rng: random.Random) -> tuple[str, str, dict]:
+    #-> (method, path, kwargs for httpx)
+    if label == "create_learning":
+        cluster = rng.randrange(8)
+        return "POST", f"/projects/{user.project_id}/learnings", {"json": {
+            "file_path": f"src/lib{cluster}/load_{rng.randrange(1000)}.py",
+            "function_name": f"fn{cluster}_{rng.randrange(25)}",
+            "library_name": f"lib{cluster}",
+            "description": f"Load test learning {rng.randrange(10 ** 9)}",
+            "code_snippet": "\n".join(f"value_{i} = step_{i}(value_{i - 1})" for i in range(rng.randrange(3, 30)))
+        }}
+    if label == "list_learnings":
+        return "GET", f"/users/{user.user_id}/learnings", {}
+    if label == "list_project_learnings":
+        return "GET", f"/projects/{user.project_id}/learnings", {}
+    if label == "by_library":
+        return "GET", f"/users/{user.user_id}/learnings/library/{rng.choice(user.libraries)}", {}
+    if label == "by_function":
+        return "GET", f"/users/{user.user_id}/learnings/function/{rng.choice(user.functions)}", {}
+    if label == "libraries":
+        return "GET", f"/users/{user.user_id}/libraries", {}
+    if label == "functions":
+        return "GET", f"/users/{user.user_id}/functions", {}
+    if label == "favorite_add":
+        return "POST", f"/users/{user.user_id}/favorites", {"json": {"learning_id": rng.choice(user.learning_ids)}}
+    if label == "favorites":
+        return "GET", f"/users/{user.user_id}/favorites", {}
+    if label in ("rag_simple", "rag_powered", "rag_stream"):
+        words = ["how", "to", "parse", "fetch", "cache", "retry", "stream", "query", "render", "validate", "paginate"]
+        return "POST", "/rag/query/stream" if label == "rag_stream" else "/rag/query", {"json": {
+            "query": " ".join(rng.choice(words) for _ in range(6)),
+            "mode": "simple" if label == "rag_simple" else "powered"
+        }}
+    raise ValueError(label)
+
+
+async def generate_load(client: httpx.AsyncClient, load_users: list[LoadUser], args) -> tuple[dict, float, int]:
+    rng = random.Random(args.seed)
+    labels = [label for label, weight in args.weights.items() if weight > 0]
+    weights = [args.weights[label] for label in labels]
+    stats = {label: EndpointStats() for label in labels}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    in_flight = set()
+    #arrivals that found every slot taken (open loop only): the server couldn't keep up with --rate
+    backlog_peak = 0
+
+    async def one(label: str):
+        user = rng.choice(load_users)
+        method, path, kwargs = build_request(label, user, rng)
+        auth = f"ApiKey {user.api_key}" if rng.random() < args.api_key_share else f"Bearer {user.jwt}"
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                #latency includes reading the whole body (the full answer for streamed rag queries)
+                response = await client.request(method, path, headers={"Authorization": auth}, **kwargs)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            stats[label].record(status, (time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+    next_arrival = started
+    while time.perf_counter() < deadline:
+        if args.rate > 0:
+            next_arrival += rng.expovariate(args.rate)
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif len(in_flight) >= args.concurrency:
+            await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        task = asyncio.create_task(one(rng.choices(labels, weights)[0]))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        backlog_peak = max(backlog_peak, len(in_flight) - args.concurrency)
+    if in_flight:
+        await asyncio.wait(in_flight)
+    return stats, time.perf_counter() - started, backlog_peak
+
+
+def git_commit() -> str:
+    from app.benchmarks.retrieval import git_commit as commit
+    return commit()
+
+
+async def run(args) -> dict:
+    stub, stub_settings = None, None
+    if not args.no_stub:
+        from app.benchmarks.stub_openai import StubSettings, serve
+        stub_settings = StubSettings(args.embed_latency_ms, args.llm_latency_ms)
+        stub = await serve(stub_settings, "127.0.0.1", args.stub_port)
+
+    #imported only now: the openAI clients pick up OPENAI_BASE_URL when they are created
+    from app.db import database
+    from app.benchmarks.seed import cleanup
+
+    await database.connect()
+    in_process = not args.base_url
+    worker = None
+    try:
+        load_users = await prepare_users(args)
+        if in_process:
+            from app.main import app as api
+            from app.services.usage import usage_meter
+            from app.services.embedding_queue import embedding_worker
+            #load users would hit the monthly powered query limit after 15 queries
+            usage_meter.limit = 10 ** 9
+            #startup events don't run under ASGITransport -> start the background work the app would run
+            embedding_worker.start()
+            usage_meter.start()
+            worker = embedding_worker
+            transport = httpx.ASGITransport(app=api)
+            client = httpx.AsyncClient(transport=transport, base_url="http://load", timeout=60)
+        else:
+            client = httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=httpx.Limits(max_connections=args.concurrency))
+
+        sampler = PoolSampler(in_process)
+        sampler.start()
+        print(f"Running {args.duration:.0f}s of load, rate {args.rate or 'max'}/s, {args.concurrency} in flight...")
+        try:
+            async with client:
+                stats, seconds, backlog_peak = await generate_load(client, load_users, args)
+        finally:
+            await sampler.stop()
+        if worker is not None:
+            await worker.stop()
+            from app.services.usage import usage_meter
+            await usage_meter.stop()
+    finally:
+        if not args.keep:
+            await cleanup(args.prefix)
+        await database.disconnect()
+        if stub is not None:
+            stub.should_exit = True
+
+    endpoints = {label: s.report(seconds) for label, s in stats.items()}
+    total = sum(e["requests"] for e in endpoints.values())
+    errors = sum(e["errors"] for e in endpoints.values())
+    return {
+        "benchmark": "load",
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "target": args.base_url or "in-process",
+        "args": {key: value for key, value in vars(args).items() if key not in ("out", "mix")},
+        "seconds": round(seconds, 3),
+        "requests": total,
+        "throughput_rps": round(total / seconds, 2) if seconds else 0.0,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "backlog_peak": backlog_peak,
+        "db_pool": sampler.report(),
+        "stub_openai": stub_settings.requests if stub_settings is not None else None,
+        "endpoints": endpoints
+    }
+
+
+def print_report(results: dict):
+    print(f"{results['requests']} requests in {results['seconds']}s -> {results['throughput_rps']} req/s, error rate {results['error_rate']}")
+    print(f"{'endpoint':<24}{'req/s':>8}{'errors':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for label, e in results["endpoints"].items():
+        print(f"{label:<24}{e['throughput_rps']:>8}{e['errors']:>8}{e['p50_ms']:>10}{e['p95_ms']:>10}{e['p99_ms']:>10}")
+    pool = results["db_pool"]
+    if pool.get("samples"):
+        print(f"db connections ({pool['source']}): mean {pool['in_use_mean']} / p95 {pool['in_use_p95']} / max {pool['in_use_max']} of {pool['max_size']}, saturated {pool['saturated_share'] * 100:.1f}% of the time")
+
+
+async def main(argv) -> int:
+    args = parse_args(argv)
+    if not args.no_stub:
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.stub_port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    results = await run(args)
+    print_report(results)
+    out = args.out or os.path.join("bench-results", f"load-{results['commit']}-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
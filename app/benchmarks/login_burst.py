@@ -0,0 +1,204 @@
+#What a burst of logins does to everyone else: steady background traffic (listings, lookups, favorites, rag) runs
+#the whole time, and after --warmup seconds --logins logins for the seeded users are fired at once.
+#Background latency is reported per phase: "baseline" (before the burst), "burst" (while any login is in flight)
+#and "after". With bcrypt on the event loop (--workers 0, the old behaviour) every login stalls all of them for a
+#full hash; on the password hasher's threads only the logins wait (their queue time is in password_hasher stats).
+
+#in process (app + openAI stub + traffic in one process), against a local postgres:
+#python -m app.benchmarks.login_burst --logins 50 --rate 40
+#python -m app.benchmarks.login_burst --logins 50 --rate 40 --workers 0   (before: bcrypt on the event loop)
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+import httpx
+
+#background endpoints (labels from app.benchmarks.load)
+BACKGROUND = ["list_learnings", "by_library", "libraries", "favorites", "rag_simple"]
+PHASES = ("baseline", "burst", "after")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m app.benchmarks.login_burst", description="Latency of other endpoints during a login burst")
+    parser.add_argument("--logins", type=int, default=50, help="logins fired at once")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of background traffic before the burst")
+    parser.add_argument("--after", type=float, default=5.0, help="seconds of background traffic after the burst")
+    parser.add_argument("--rate", type=float, default=40.0, help="background requests started per second (poisson arrivals)")
+    parser.add_argument("--workers", type=int, help="PASSWORD_HASH_WORKERS for this run (0 = bcrypt on the event loop)")
+    parser.add_argument("--rounds", type=int, help="BCRYPT_ROUNDS for this run")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--per-user", type=int, default=200, help="learnings seeded per user")
+    parser.add_argument("--clusters", type=int, default=8)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--embed-latency-ms", type=float, default=80.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="loginburst")
+    parser.add_argument("--keep", action="store_true", help="leave the seeded rows in the database")
+    parser.add_argument("--out", help="JSON output (default: bench-results/login-burst-<commit>-<time>.json)")
+    return parser.parse_args(argv)
+
+
+class Phases:
+    #which phase a request started in: the burst lasts from the first login sent until the last one answered
+    def __init__(self):
+        self.burst_started = None
+        self.burst_finished = None
+
+    def current(self) -> str:
+        if self.burst_started is None:
+            return "baseline"
+        return "burst" if self.burst_finished is None else "after"
+
+
+async def background_traffic(client: httpx.AsyncClient, load_users, phases: Phases, stop: asyncio.Event, args) -> dict:
+    from app.benchmarks.load import EndpointStats, build_request
+    rng = random.Random(args.seed)
+    stats = {phase: {label: EndpointStats() for label in BACKGROUND} for phase in PHASES}
+    in_flight = set()
+
+    async def one(label: str):
+        user = rng.choice(load_users)
+        method, path, kwargs = build_request(label, user, rng)
+        phase = phases.current()
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, headers={"Authorization": f"Bearer {user.jwt}"}, **kwargs)
+            status = str(response.status_code)
+        except Exception as e:
+            status = type(e).__name__
+        stats[phase][label].record(status, (time.perf_counter() - start) * 1000)
+
+    next_arrival = time.perf_counter()
+    while not stop.is_set():
+        next_arrival += rng.expovariate(args.rate)
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(one(rng.choice(BACKGROUND)))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.wait(in_flight)
+    return stats
+
+
+async def login_burst(client: httpx.AsyncClient, emails: list[str], phases: Phases):
+    from app.benchmarks.load import EndpointStats
+    from app.benchmarks.seed import BENCH_PASSWORD
+    stats = EndpointStats()
+
+    async def one(email: str):
+        start = time.perf_counter()
+        try:
+            response = await client.post("/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+            status = str(response.status_code)
+        except Exception as e:
+            status = type(e).__name__
+        stats.record(status, (time.perf_counter() - start) * 1000)
+
+    phases.burst_started = time.perf_counter()
+    await asyncio.gather(*(one(email) for email in emails))
+    phases.burst_finished = time.perf_counter()
+    return stats
+
+
+async def run(args) -> dict:
+    from app.benchmarks.stub_openai import StubSettings, serve
+    stub_settings = StubSettings(args.embed_latency_ms, 0.0)
+    stub = await serve(stub_settings, "127.0.0.1", args.stub_port)
+
+    #imported only now: the openAI clients / password hasher read their settings when they are created
+    from app.db import database
+    from app.main import app as api
+    from app.benchmarks.load import EndpointStats, prepare_users, git_commit
+    from app.benchmarks.seed import cleanup, EMAIL_DOMAIN
+    from app.services.passwords import password_hasher
+
+    await database.connect()
+    try:
+        load_users = await prepare_users(args)
+        emails = [f"{args.prefix}-{n % args.users}@{EMAIL_DOMAIN}" for n in range(args.logins)]
+        phases = Phases()
+        stop = asyncio.Event()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api), base_url="http://burst", timeout=120)
+        print(f"Background traffic at {args.rate}/s, {args.logins} logins after {args.warmup:.0f}s "
+              f"(bcrypt rounds {password_hasher.rounds}, {password_hasher.workers or 'no'} hasher threads)...")
+        async with client:
+            traffic = asyncio.create_task(background_traffic(client, load_users, phases, stop, args))
+            await asyncio.sleep(args.warmup)
+            logins = await login_burst(client, emails, phases)
+            await asyncio.sleep(args.after)
+            stop.set()
+            stats = await traffic
+        hasher = password_hasher.stats()
+    finally:
+        if not args.keep:
+            await cleanup(args.prefix)
+        await database.disconnect()
+        stub.should_exit = True
+
+    durations = {"baseline": args.warmup, "burst": phases.burst_finished - phases.burst_started, "after": args.after}
+    background = {}
+    for phase in PHASES:
+        combined = EndpointStats()
+        for endpoint_stats in stats[phase].values():
+            combined.latencies += endpoint_stats.latencies
+            combined.errors += endpoint_stats.errors
+            for status, count in endpoint_stats.statuses.items():
+                combined.statuses[status] = combined.statuses.get(status, 0) + count
+        background[phase] = {
+            "all": combined.report(durations[phase]),
+            "endpoints": {label: s.report(durations[phase]) for label, s in stats[phase].items()}
+        }
+    return {
+        "benchmark": "login_burst",
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "args": {key: value for key, value in vars(args).items() if key != "out"},
+        "burst_seconds": round(durations["burst"], 3),
+        "logins": logins.report(durations["burst"]),
+        "password_hasher": hasher,
+        "background": background
+    }
+
+
+def print_report(results: dict):
+    logins = results["logins"]
+    print(f"{logins['requests']} logins in {results['burst_seconds']}s: p50 {logins['p50_ms']} ms, p99 {logins['p99_ms']} ms, status {logins['status_codes']}")
+    queue = results["password_hasher"]["queue_time"]
+    print(f"hasher queue time: p50 {queue['p50_ms']} ms, p99 {queue['p99_ms']} ms, rejected {results['password_hasher']['rejected']}")
+    print(f"{'background':<12}{'requests':>10}{'errors':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for phase, report in results["background"].items():
+        e = report["all"]
+        print(f"{phase:<12}{e['requests']:>10}{e['errors']:>8}{e['p50_ms']:>10}{e['p95_ms']:>10}{e['p99_ms']:>10}{e['max_ms']:>10}")
+
+
+async def main(argv) -> int:
+    args = parse_args(argv)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.stub_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    if args.workers is not None:
+        os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    if args.rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    #every login of the burst may queue: the benchmark measures the stall, 503s would hide it
+    os.environ.setdefault("PASSWORD_HASH_MAX_WAITING", str(max(args.logins, 32)))
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    results = await run(args)
+    print_report(results)
+    out = args.out or os.path.join("bench-results", f"login-burst-{results['commit']}-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,235 @@
+#/rag/query latency per stage + retrieval quality, without openAI.
+
+#Seeds N users x K learnings with clustered vectors into the configured (local) postgres, swaps embedding +
+#llm for deterministic fakes (app/benchmarks/fakes.py), then:
+#1. recall@3 of search_learnings (ANN index / in-memory index) against exact brute force per user
+#2. drives /rag/query through the app (JWT auth, `--concurrency` in flight) and reports p50/p95/p99 per stage
+#results go to a JSON file named after the commit so runs can be diffed across commits.
+
+#python -m app.benchmarks.retrieval --users 20 --per-user 500 --queries 400
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import subprocess
+from datetime import datetime
+import numpy as np
+import httpx
+from app.db import database
+from app.auth.jwt import create_access_token
+from app.models.vector import EMBEDDING_DIMENSIONS, EMBEDDING_PRECISION
+from app.services import retrieval
+from app.services.retrieval import search_learnings
+from app.services.vector_index import vector_index
+from app.services.usage import usage_meter
+from app.services.response_cache import response_cache
+from app.benchmarks.fakes import FakeEmbedder, FakeLLM, install
+from app.benchmarks.seed import seed, cleanup
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m app.benchmarks.retrieval", description="Offline /rag/query benchmark")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--per-user", type=int, default=500, help="learnings per user")
+    parser.add_argument("--clusters", type=int, default=10, help="topics per user")
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8, help="/rag/query requests in flight")
+    parser.add_argument("--powered-share", type=float, default=0.2, help="fraction of queries in powered mode")
+    parser.add_argument("--embed-latency-ms", type=float, default=80.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=600.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--query-noise", type=float, default=0.6, help="how far a query vector is from the learning it is about")
+    parser.add_argument("--in-memory-index", action="store_true", help="serve search from the in-process vector index")
+    parser.add_argument("--response-cache", action="store_true", help="leave the powered response cache on")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="bench", help="seeded users are <prefix>-<n>@bench.local")
+    parser.add_argument("--keep", action="store_true", help="leave the seeded rows in the database")
+    parser.add_argument("--out", help="JSON output (default: bench-results/retrieval-<commit>-<time>.json)")
+    return parser.parse_args(argv)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def summarize(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3)
+    }
+
+
+def exact_top_k(matrix: np.ndarray, ids: np.ndarray, query: np.ndarray, k: int = 3) -> list[int]:
+    #vectors are unit length -> cosine, l2 and inner product rank the same
+    scores = matrix @ query
+    order = np.argsort(-scores)[:k]
+    return [int(ids[i]) for i in order]
+
+
+def make_queries(corpus, count: int, noise: float, rng) -> list[dict]:
+    #a query is "about" one learning: its vector plus noise, registered with the fake embedder under a text
+    #that shares no words with the seeded learnings (so the keyword fast path doesn't short-circuit it)
+    by_user = corpus.by_user()
+    queries = []
+    for n in range(count):
+        user_id = corpus.user_ids[int(rng.integers(0, len(corpus.user_ids)))]
+        ids, matrix = by_user[user_id]
+        source = matrix[int(rng.integers(0, len(ids)))]
+        vector = source + noise * rng.standard_normal(EMBEDDING_DIMENSIONS).astype(np.float32) / np.sqrt(EMBEDDING_DIMENSIONS)
+        vector = (vector / np.linalg.norm(vector)).astype(np.float32)
+        queries.append({
+            "user_id": user_id,
+            "text": f"benchq{n} zq{rng.integers(1 << 30)}",
+            "vector": vector,
+            "expected": exact_top_k(matrix, ids, vector)
+        })
+    return queries
+
+
+async def measure_recall(queries: list[dict]) -> dict:
+    recalls, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        rows = await search_learnings(q["user_id"], q["vector"], limit=3)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len({r["id"] for r in rows} & set(q["expected"])) / len(q["expected"]))
+    return {
+        "recall_at_3": round(float(np.mean(recalls)), 4),
+        "recall_at_3_min": round(float(np.min(recalls)), 4),
+        "perfect_share": round(float(np.mean([r == 1.0 for r in recalls])), 4),
+        "search": summarize(latencies)
+    }
+
+
+async def drive_queries(queries: list[dict], concurrency: int, powered_share: float, rng) -> dict:
+    from app.main import app as api
+    import app.routers.rag as rag
+
+    stages: dict[str, list[float]] = {}
+
+    def observe(mode: str, timings: dict):
+        for stage, ms in timings.items():
+            stages.setdefault(f"{mode}.{stage}", []).append(ms)
+
+    rag.timing_observers.append(observe)
+    tokens = {user_id: create_access_token({"sub": str(user_id)}) for user_id in {q["user_id"] for q in queries}}
+    modes = ["powered" if rng.random() < powered_share else "simple" for _ in queries]
+    http_latencies: dict[str, list[float]] = {"simple": [], "powered": []}
+    statuses: dict[str, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(client, q, mode):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/rag/query",
+                json={"query": q["text"], "mode": mode},
+                headers={"Authorization": f"Bearer {tokens[q['user_id']]}"}
+            )
+            http_latencies[mode].append((time.perf_counter() - start) * 1000)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    started = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api), base_url="http://bench") as client:
+            await asyncio.gather(*(one(client, q, mode) for q, mode in zip(queries, modes)))
+    finally:
+        rag.timing_observers.remove(observe)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(queries),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(queries) / elapsed, 2) if elapsed else 0.0,
+        "status_codes": statuses,
+        "http": {mode: summarize(samples) for mode, samples in http_latencies.items()},
+        "stages": {stage: summarize(samples) for stage, samples in sorted(stages.items())}
+    }
+
+
+async def run(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    embedder = FakeEmbedder(latency_ms=args.embed_latency_ms, jitter_ms=args.jitter_ms, seed=args.seed)
+    llm = FakeLLM(latency_ms=args.llm_latency_ms)
+    install(embedder, llm)
+    vector_index.enabled = args.in_memory_index
+    response_cache.enabled = args.response_cache
+    #benchmark users would hit the monthly powered query limit after 15 queries
+    usage_meter.limit = 10 ** 9
+
+    await cleanup(args.prefix)
+    print(f"Seeding {args.users} users x {args.per_user} learnings ({args.clusters} clusters, {EMBEDDING_DIMENSIONS}-d {EMBEDDING_PRECISION})...")
+    corpus = await seed(args.prefix, args.users, args.per_user, args.clusters, args.seed)
+    print(f"  seeded in {corpus.seconds:.1f}s")
+    try:
+        queries = make_queries(corpus, args.queries, args.query_noise, rng)
+        for q in queries:
+            embedder.register(q["text"], q["vector"])
+
+        print("Measuring recall@3 against exact search...")
+        quality = await measure_recall(queries)
+        print(f"  recall@3 {quality['recall_at_3']} (min {quality['recall_at_3_min']}), search p50 {quality['search']['p50_ms']}ms p95 {quality['search']['p95_ms']}ms")
+
+        print(f"Driving {len(queries)} /rag/query requests, {args.concurrency} in flight...")
+        load = await drive_queries(queries, args.concurrency, args.powered_share, rng)
+        print(f"  {load['throughput_rps']} req/s, status codes {load['status_codes']}")
+        for stage, summary in load["stages"].items():
+            print(f"  {stage:<24} p50 {summary['p50_ms']:>9}ms  p95 {summary['p95_ms']:>9}ms  p99 {summary['p99_ms']:>9}ms")
+    finally:
+        if not args.keep:
+            await cleanup(args.prefix)
+
+    return {
+        "benchmark": "retrieval",
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "args": {key: value for key, value in vars(args).items() if key != "out"},
+        "config": {
+            "vector_index_type": retrieval.VECTOR_INDEX_TYPE,
+            "distance_metric": retrieval.VECTOR_DISTANCE_METRIC,
+            "hnsw_ef_search": retrieval.HNSW_EF_SEARCH,
+            "hybrid_search": retrieval.HYBRID_SEARCH_ENABLED,
+            "embedding_dimensions": EMBEDDING_DIMENSIONS,
+            "embedding_precision": EMBEDDING_PRECISION,
+            "in_memory_index": vector_index.enabled
+        },
+        "seed_seconds": round(corpus.seconds, 3),
+        "quality": quality,
+        "load": load,
+        "fakes": {"embedder": embedder.stats(), "llm": llm.stats()}
+    }
+
+
+async def main(argv) -> int:
+    args = parse_args(argv)
+    #per-request INFO logs would drown the report
+    logging.getLogger("app").setLevel(logging.WARNING)
+    await database.connect()
+    try:
+        results = await run(args)
+    finally:
+        await database.disconnect()
+
+    out = args.out or os.path.join("bench-results", f"retrieval-{results['commit']}-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
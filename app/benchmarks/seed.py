@@ -0,0 +1,120 @@
+# app/benchmarks/seed.py
+
+import time
+import numpy as np
+from app.services.passwords import password_hasher
+from sqlalchemy import select, delete
+from app.db import database
+from app.models.users import users
+from app.models.project import projects
+from app.models.learnings import learnings
+from app.models.favorites import favorites
+from app.models.api_keys import api_keys
+from app.models.vector import EMBEDDING_DIMENSIONS
+from app.services.facets import add_facets
+from app.services.queries import allocate_learning_ids
+
+#every seeded user is <prefix>-<n>@bench.local -> cleanup() finds them again
+EMAIL_DOMAIN = "bench.local"
+BENCH_PASSWORD = "bench-password"
+INSERT_CHUNK = 500
+
+WORDS = (
+    "parse fetch render cache retry stream token async await route query index hook state effect "
+    "context reducer schema model validate serialize encode decode upload download paginate sort "
+    "filter merge join group batch queue worker timeout socket request response header cookie"
+).split()
+
+
+class SeededCorpus:
+    #what was inserted, kept in memory for ground truth (exact search) and for picking queries
+    def __init__(self):
+        self.user_ids: list[int] = []
+        self.project_ids: dict[int, int] = {}
+        self.learning_ids: list[int] = []
+        self.learning_users: list[int] = []
+        self.vectors: list[np.ndarray] = []
+        self.seconds = 0.0
+
+    def by_user(self) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+        #user_id -> (learning ids, float32 matrix)
+        ids = np.array(self.learning_ids, dtype=np.int64)
+        owners = np.array(self.learning_users, dtype=np.int64)
+        matrix = np.vstack(self.vectors) if self.vectors else np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        return {user_id: (ids[owners == user_id], matrix[owners == user_id]) for user_id in self.user_ids}
+
+
+def clustered_vectors(rng, count: int, clusters: int, dimensions: int = EMBEDDING_DIMENSIONS, spread: float = 0.5) -> tuple[np.ndarray, np.ndarray]:
+    #unit vectors grouped around `clusters` centers (one user's learnings cluster by library / topic)
+    #-> (vectors, cluster of each vector)
+    centers = rng.standard_normal((clusters, dimensions))
+    assignment = rng.integers(0, clusters, count)
+    vectors = centers[assignment] + spread * rng.standard_normal((count, dimensions))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32), assignment
+
+
+def synthetic_learning(rng, cluster: int, n: int) -> dict:
+    words = " ".join(rng.choice(WORDS, size=8))
+    return {
+        "file_path": f"src/lib{cluster}/module{n % 7}.py",
+        "function_name": f"fn{cluster}_{n % 25}",
+        "library_name": f"lib{cluster}",
+        "description": f"How to {words}",
+        "code_snippet": "\n".join(f"result_{i} = {rng.choice(WORDS)}_{cluster}(value_{i})" for i in range(int(rng.integers(3, 30))))
+    }
+
+
+async def seed(prefix: str, user_count: int, per_user: int, clusters: int, seed_value: int = 0) -> SeededCorpus:
+    rng = np.random.default_rng(seed_value)
+    corpus = SeededCorpus()
+    started = time.perf_counter()
+    password = password_hasher.hash_blocking(BENCH_PASSWORD)
+
+    for n in range(user_count):
+        user_id = await database.execute(users.insert().values(email=f"{prefix}-{n}@{EMAIL_DOMAIN}", password=password))
+        project_id = await database.execute(projects.insert().values(name=f"{prefix} project {n}", user_id=user_id))
+        corpus.user_ids.append(user_id)
+        corpus.project_ids[user_id] = project_id
+
+        vectors, assignment = clustered_vectors(rng, per_user, clusters)
+        for start in range(0, per_user, INSERT_CHUNK):
+            chunk = range(start, min(start + INSERT_CHUNK, per_user))
+            values = [
+                {
+                    **synthetic_learning(rng, int(assignment[i]), i),
+                    "project_id": project_id,
+                    "user_id": user_id,
+                    "embedding": vectors[i]
+                }
+                for i in chunk
+            ]
+            async with database.transaction():
+                #ids must line up with `vectors` (exact search ground truth)
+                ids = await allocate_learning_ids(len(values))
+                for value, learning_id in zip(values, ids):
+                    value["id"] = learning_id
+                await database.execute(learnings.insert().values(values))
+                #/libraries + /functions read the facet table
+                await add_facets(user_id, values)
+            corpus.learning_ids.extend(ids)
+            corpus.learning_users.extend([user_id] * len(ids))
+        corpus.vectors.append(vectors)
+
+    corpus.seconds = time.perf_counter() - started
+    return corpus
+
+
+async def cleanup(prefix: str) -> int:
+    #removes everything seeded under prefix (learnings.user_id / favorites have no ON DELETE CASCADE)
+    rows = await database.fetch_all(select(users.c.id).where(users.c.email.like(f"{prefix}-%@{EMAIL_DOMAIN}")))
+    user_ids = [r["id"] for r in rows]
+    if not user_ids:
+        return 0
+    async with database.transaction():
+        await database.execute(delete(favorites).where(favorites.c.user_id.in_(user_ids)))
+        await database.execute(delete(api_keys).where(api_keys.c.user_id.in_(user_ids)))
+        await database.execute(delete(learnings).where(learnings.c.user_id.in_(user_ids)))
+        await database.execute(delete(projects).where(projects.c.user_id.in_(user_ids)))
+        await database.execute(delete(users).where(users.c.id.in_(user_ids)))
+    return len(user_ids)
@@ -0,0 +1,124 @@
+#Stand-in for the openAI HTTP API (embeddings + chat completions, streamed or not) for load tests.
+#Answers are deterministic and arrive after a configurable delay. Point the app at it with
+#OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 (the openAI client reads it when it is created).
+
+#python -m app.benchmarks.stub_openai --port 9100 --embed-latency-ms 80 --llm-latency-ms 600
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+import hashlib
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from app.models.vector import EMBEDDING_DIMENSIONS
+
+
+class StubSettings:
+    def __init__(self, embed_latency_ms: float = 80.0, llm_latency_ms: float = 600.0, chunk_ms: float = 20.0, chunks: int = 20, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.embed_latency_ms = embed_latency_ms
+        self.llm_latency_ms = llm_latency_ms
+        self.chunk_ms = chunk_ms
+        self.chunks = chunks
+        self.dimensions = dimensions
+        self.requests = {"embeddings": 0, "chat": 0}
+
+
+def stub_vector(text: str, dimensions: int) -> np.ndarray:
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_stub_app(settings: StubSettings) -> Starlette:
+    async def embeddings(request: Request):
+        body = await request.json()
+        settings.requests["embeddings"] += 1
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        dimensions = body.get("dimensions") or settings.dimensions
+        await asyncio.sleep(settings.embed_latency_ms / 1000)
+        data = []
+        for index, text in enumerate(inputs):
+            vector = stub_vector(str(text), dimensions)
+            #the python client asks for base64 (packed float32) unless told otherwise
+            embedding = base64.b64encode(vector.tobytes()).decode() if body.get("encoding_format") == "base64" else vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(str(t)) // 4 for t in inputs)
+        return JSONResponse({
+            "object": "list",
+            "data": data,
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+
+    def answer_tokens(body: dict) -> list[str]:
+        digest = hashlib.sha256(json.dumps(body.get("messages", [])).encode("utf-8")).hexdigest()
+        return [f"stub{digest[i % 64]}{i} " for i in range(settings.chunks)]
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        settings.requests["chat"] += 1
+        tokens = answer_tokens(body)
+        created = int(time.time())
+        if not body.get("stream"):
+            await asyncio.sleep((settings.llm_latency_ms + settings.chunk_ms * len(tokens)) / 1000)
+            return JSONResponse({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}
+            })
+
+        async def events():
+            await asyncio.sleep(settings.llm_latency_ms / 1000)
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(settings.chunk_ms / 1000)
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return Starlette(routes=[
+        Route("/v1/embeddings", embeddings, methods=["POST"]),
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+    ])
+
+
+async def serve(settings: StubSettings, host: str, port: int) -> uvicorn.Server:
+    #starts the stub in the running event loop -> stop with `server.should_exit = True`
+    server = uvicorn.Server(uvicorn.Config(create_stub_app(settings), host=host, port=port, log_level="warning"))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m app.benchmarks.stub_openai", description="Local stand-in for the openAI API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--embed-latency-ms", type=float, default=80.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=600.0)
+    parser.add_argument("--chunk-ms", type=float, default=20.0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    settings = StubSettings(args.embed_latency_ms, args.llm_latency_ms, args.chunk_ms)
+    uvicorn.run(create_stub_app(settings), host=args.host, port=args.port, log_level="warning")
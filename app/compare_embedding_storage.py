@@ -0,0 +1,224 @@
+#Compares embedding storage settings (EMBEDDING_DIMENSIONS x EMBEDDING_PRECISION) on recall and latency
+#before switching with python -m app.migrate --apply-embedding-storage.
+
+#Ground truth is the exact top-k with full 1536-d float32 vectors, per user (rag only ever searches one user's
+#learnings). Every setting is scored by how much of that top-k it keeps, plus bytes per row and query latency:
+#in numpy (exact search, like VECTOR_INDEX_IN_MEMORY) and optionally in postgres (--postgres: temp table + the
+#configured ANN index, like the real /rag/query search).
+
+#synthetic corpus shaped like ours (users with a few hundred learnings, grouped by library):
+#python -m app.compare_embedding_storage
+#the real learnings (needs them stored at full dimensions), with postgres timings:
+#railway run python -m app.compare_embedding_storage --source db --postgres
+import sys
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+import asyncpg
+from pgvector.asyncpg import register_vector
+from app.db import DATABASE_URL
+from app.services.retrieval import METRICS, VECTOR_INDEX_TYPE, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, IVFFLAT_LISTS, IVFFLAT_PROBES
+
+FULL_DIMENSIONS = 1536
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m app.compare_embedding_storage", description="Recall / latency of embedding storage settings")
+    parser.add_argument("--source", choices=["synthetic", "db"], default="synthetic")
+    parser.add_argument("--users", type=int, default=50, help="synthetic: number of users")
+    parser.add_argument("--per-user", type=int, default=300, help="synthetic: learnings per user")
+    parser.add_argument("--clusters", type=int, default=8, help="synthetic: libraries / topics per user")
+    parser.add_argument("--max-rows", type=int, default=50000, help="db: learnings read at most")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--dimensions", default="1536,1024,768,512,256")
+    parser.add_argument("--precisions", default="float32,float16")
+    parser.add_argument("--min-recall", type=float, default=0.97, help="recall the recommended setting must keep")
+    parser.add_argument("--postgres", action="store_true", help="also time the search in postgres with the ANN index")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args(argv)
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=-1, keepdims=True), 1e-12)
+
+
+def synthetic_corpus(args, rng) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    #text-embedding-3 vectors are trained so the leading dimensions carry most of the signal (that's why
+    #shortening them works) -> decaying per-dimension scale instead of isotropic noise
+    scale = (1.0 + np.arange(FULL_DIMENSIONS) / 64.0) ** -0.5
+    ids, users, vectors = [], [], []
+    next_id = 1
+    for user_id in range(1, args.users + 1):
+        centers = rng.standard_normal((args.clusters, FULL_DIMENSIONS)) * scale
+        assignment = rng.integers(0, args.clusters, args.per_user)
+        rows = centers[assignment] + 0.6 * rng.standard_normal((args.per_user, FULL_DIMENSIONS)) * scale
+        vectors.append(normalize(rows).astype(np.float32))
+        ids.extend(range(next_id, next_id + args.per_user))
+        users.extend([user_id] * args.per_user)
+        next_id += args.per_user
+    return np.array(ids, dtype=np.int64), np.array(users, dtype=np.int64), np.vstack(vectors)
+
+
+async def db_corpus(args) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        await register_vector(conn)
+        rows = await conn.fetch(
+            "SELECT id, user_id, embedding::vector AS embedding FROM learnings WHERE embedding IS NOT NULL ORDER BY id LIMIT $1",
+            args.max_rows
+        )
+    finally:
+        await conn.close()
+    if not rows:
+        raise SystemExit("No embedded learnings found")
+    matrix = np.vstack([np.asarray(r["embedding"], dtype=np.float32) for r in rows])
+    if matrix.shape[1] != FULL_DIMENSIONS:
+        raise SystemExit(f"learnings are stored with {matrix.shape[1]} dimensions, the comparison needs the full {FULL_DIMENSIONS}")
+    return np.array([r["id"] for r in rows], dtype=np.int64), np.array([r["user_id"] for r in rows], dtype=np.int64), normalize(matrix)
+
+
+def make_queries(users: np.ndarray, vectors: np.ndarray, count: int, rng) -> list[tuple[int, np.ndarray]]:
+    #a question about a learning is close to it but far from identical (cosine ~0.75)
+    picks = rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)
+    noise = normalize(rng.standard_normal((len(picks), vectors.shape[1]))).astype(np.float32)
+    queries = normalize(vectors[picks] + 0.85 * noise)
+    return [(int(users[i]), queries[n]) for n, i in enumerate(picks)]
+
+
+def reduce(matrix: np.ndarray, dimensions: int, precision: str) -> np.ndarray:
+    #what the api returns for `dimensions` (shortened + renormalized), stored as halfvec or vector
+    reduced = normalize(matrix[..., :dimensions])
+    if precision == "float16":
+        reduced = reduced.astype(np.float16)
+    return reduced.astype(np.float32)
+
+
+def top_k(matrix: np.ndarray, ids: np.ndarray, query: np.ndarray, k: int) -> list[int]:
+    scores = matrix @ query
+    k = min(k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k]
+    return [int(ids[i]) for i in best[np.argsort(-scores[best])]]
+
+
+def percentile(samples: list[float], p: float) -> float:
+    return round(float(np.percentile(samples, p)), 3) if samples else 0.0
+
+
+def recall(found: list[int], expected: list[int]) -> float:
+    return len(set(found) & set(expected)) / max(len(expected), 1)
+
+
+def per_user(ids: np.ndarray, users: np.ndarray, vectors: np.ndarray) -> dict:
+    return {int(u): (ids[users == u], vectors[users == u]) for u in np.unique(users)}
+
+
+def numpy_run(groups: dict, queries, truth, dimensions: int, precision: str, k: int) -> dict:
+    reduced = {u: (ids, reduce(matrix, dimensions, precision)) for u, (ids, matrix) in groups.items()}
+    latencies, recalls = [], []
+    for (user_id, query), expected in zip(queries, truth):
+        ids, matrix = reduced[user_id]
+        start = time.perf_counter()
+        found = top_k(matrix, ids, reduce(query, dimensions, precision), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(recall(found, expected))
+    return {"recall": round(float(np.mean(recalls)), 4), "numpy_p50_ms": percentile(latencies, 50), "numpy_p95_ms": percentile(latencies, 95)}
+
+
+async def postgres_run(ids, users, vectors, queries, truth, dimensions: int, precision: str, k: int) -> dict:
+    #same search as app.services.retrieval.search_learnings, against a temp copy with the candidate column type
+    type_name = "halfvec" if precision == "float16" else "vector"
+    opclass = METRICS["cosine"][0].replace("vector_", f"{type_name}_")
+    options = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}" if VECTOR_INDEX_TYPE == "hnsw" else f"lists = {IVFFLAT_LISTS}"
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        await register_vector(conn)
+        await conn.execute(f"CREATE TEMP TABLE storage_bench (id integer PRIMARY KEY, user_id integer NOT NULL, embedding {type_name}({dimensions}))")
+        reduced = reduce(vectors, dimensions, "float32")
+        await conn.copy_records_to_table(
+            "storage_bench",
+            records=[(int(i), int(u), v) for i, u, v in zip(ids, users, reduced)],
+            columns=["id", "user_id", "embedding"]
+        )
+        await conn.execute("CREATE INDEX ON storage_bench (user_id)")
+        build_started = time.perf_counter()
+        await conn.execute(f"CREATE INDEX storage_bench_embedding ON storage_bench USING {VECTOR_INDEX_TYPE} (embedding {opclass}) WITH ({options})")
+        build_seconds = time.perf_counter() - build_started
+        await conn.execute("ANALYZE storage_bench")
+        if VECTOR_INDEX_TYPE == "hnsw":
+            await conn.execute(f"SET hnsw.ef_search = {HNSW_EF_SEARCH}")
+        else:
+            await conn.execute(f"SET ivfflat.probes = {IVFFLAT_PROBES}")
+
+        statement = await conn.prepare(
+            f"SELECT id FROM storage_bench WHERE user_id = $1 ORDER BY embedding <=> $2::{type_name} LIMIT {int(k)}"
+        )
+        latencies, recalls = [], []
+        for (user_id, query), expected in zip(queries, truth):
+            vector = reduce(query, dimensions, "float32")
+            start = time.perf_counter()
+            rows = await statement.fetch(user_id, vector)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(recall([r["id"] for r in rows], expected))
+        sizes = await conn.fetchrow(
+            "SELECT pg_total_relation_size('storage_bench') AS table_bytes, pg_relation_size('storage_bench_embedding') AS index_bytes"
+        )
+        await conn.execute("DROP TABLE storage_bench")
+    finally:
+        await conn.close()
+    return {
+        "pg_recall": round(float(np.mean(recalls)), 4),
+        "pg_p50_ms": percentile(latencies, 50),
+        "pg_p95_ms": percentile(latencies, 95),
+        "pg_table_bytes": sizes["table_bytes"],
+        "pg_index_bytes": sizes["index_bytes"],
+        "pg_index_build_s": round(build_seconds, 2)
+    }
+
+
+async def main(argv) -> int:
+    args = parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+    if args.source == "db":
+        ids, users, vectors = await db_corpus(args)
+    else:
+        ids, users, vectors = synthetic_corpus(args, rng)
+    groups = per_user(ids, users, vectors)
+    queries = make_queries(users, vectors, args.queries, rng)
+    truth = [top_k(groups[u][1], groups[u][0], q, args.k) for u, q in queries]
+    print(f"{len(ids)} learnings, {len(groups)} users, {len(queries)} queries, recall@{args.k} against full {FULL_DIMENSIONS}-d float32")
+
+    results = []
+    for precision in args.precisions.split(","):
+        for dimensions in [int(d) for d in args.dimensions.split(",")]:
+            result = {
+                "dimensions": dimensions,
+                "precision": precision,
+                #pgvector stores 2 (halfvec) or 4 (vector) bytes per dimension + an 8 byte header
+                "bytes_per_row": dimensions * (2 if precision == "float16" else 4) + 8,
+                **numpy_run(groups, queries, truth, dimensions, precision, args.k)
+            }
+            if args.postgres:
+                result.update(await postgres_run(ids, users, vectors, queries, truth, dimensions, precision, args.k))
+            results.append(result)
+            print("  " + " ".join(f"{key}={value}" for key, value in result.items()))
+
+    recall_key = "pg_recall" if args.postgres else "recall"
+    keeps = [r for r in results if r[recall_key] >= args.min_recall]
+    if keeps:
+        best = min(keeps, key=lambda r: r["bytes_per_row"])
+        print(f"Smallest setting with recall >= {args.min_recall}: EMBEDDING_DIMENSIONS={best['dimensions']} EMBEDDING_PRECISION={best['precision']} ({best['bytes_per_row']} bytes/row)")
+    else:
+        print(f"No setting keeps recall >= {args.min_recall}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"rows": len(ids), "users": len(groups), "queries": len(queries), "k": args.k, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -5,9 +5,11 @@ from sqlalchemy import create_engine, text
 from app.models import metadata
 from app.models.project import projects
 from app.models.learnings import learnings
+from app.models.vector import EMBEDDING_DIMENSIONS
 from app.models.users import users
 from app.db import database
-from passlib.hash import bcrypt
+from app.services.facets import add_facets
+from app.services.passwords import password_hasher
 from dotenv import load_dotenv
 import getpass
 import numpy as np
@@ -175,7 +177,7 @@ async def create_test_data():
         # Create test user
         test_user_email = "test@example.com"
         test_user_password = "testpassword123"
-        hashed_password = bcrypt.hash(test_user_password)
+        hashed_password = password_hasher.hash_blocking(test_user_password)
         
         # Check if test user already exists
         existing_user = await database.fetch_one(
@@ -232,8 +234,8 @@ async def create_test_data():
             )
             
             if not existing_learning:
-                # Generate a random embedding (1536 dimensions for OpenAI embeddings)
-                embedding = np.random.rand(1536).tolist()
+                # Generate a random embedding (as many dimensions as learnings.embedding stores)
+                embedding = np.random.rand(EMBEDDING_DIMENSIONS).tolist()
                 
                 learning_query = learnings.insert().values(
                     project_id=project_id,
@@ -245,7 +247,9 @@ async def create_test_data():
                     user_id=user_id,
                     embedding=embedding
                 )
-                await database.execute(learning_query)
+                async with database.transaction():
+                    await database.execute(learning_query)
+                    await add_facets(user_id, [{"library_name": learning['library'], "function_name": learning['function']}])
                 learning_count += 1
 
         print(f"Created {learning_count} new test learnings")
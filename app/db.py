@@ -3,6 +3,8 @@
 import os
 from databases import Database
 from urllib.parse import urlparse
+from pgvector.asyncpg import register_vector
+from app.models.vector import vector_session_settings
 
 # Get DATABASE_URL from Railway or fallback to local
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://localhost/arsenal_db")
@@ -17,8 +19,15 @@ if "localhost" not in DATABASE_URL:
     #removes query params that might cause issues
     DATABASE_URL = f"{url.scheme}://{url.netloc}{url.path}"
 
+#runs on every new connection in the pool
+async def init_connection(conn):
+    #binary codec for the vector type: embeddings are sent/received as packed float32 and decode to numpy arrays
+    await register_vector(conn)
+
 # Create the database connection
-database = Database(DATABASE_URL)
+#server_settings: ann search settings (ef_search, iterative scan, probes) sent when each connection opens.
+#a SET in init would be undone by the RESET ALL asyncpg runs each time a connection is released to the pool
+database = Database(DATABASE_URL, init=init_connection, server_settings=vector_session_settings())
 
 async def ensure_connected():
     """Simple function to check if connected and reconnect if needed"""
@@ -8,6 +8,12 @@ from app.models.favorites import favorites
 from app.models.users import users
 from app.models.api_keys import api_keys
 from app.models.usage_limits import usage_limits
+from app.models.cached_embeddings import cached_embeddings
+from app.models.embedding_jobs import embedding_jobs
+from app.models.reembed_checkpoints import reembed_checkpoints
+from app.models.corpus_versions import corpus_versions
+from app.models.learning_facets import learning_facets
+from app.services.retrieval import rebuild_vector_index
 
 from dotenv import load_dotenv
 
@@ -23,7 +29,7 @@ import getpass
 # Load env stuff
 load_dotenv()
 
-def initialize_db():   
+def create_db_engine():
     #set by railway -> same as the one from pgvector
     DATABASE_URL = os.getenv("DATABASE_URL")
     if not DATABASE_URL:
@@ -38,7 +44,7 @@ def initialize_db():
     #when app needs to run query, grabs connection from the pool
 
     # Create engine with SSL required for Railway
-    engine = create_engine(
+    return create_engine(
         DATABASE_URL,
         pool_pre_ping=True, #checks if connection is still alive before using it
         pool_size=5, #keep up to 5 connections open
@@ -48,6 +54,9 @@ def initialize_db():
         }
     )
 
+def initialize_db():   
+    engine = create_db_engine()
+
     try:
         #connect to the pool 
         with engine.connect() as conn:
@@ -64,37 +73,43 @@ def initialize_db():
         with engine.begin() as conn:
             conn.execute(text("DROP INDEX IF EXISTS idx_learnings_embedding;"))
             conn.execute(text("DROP INDEX IF EXISTS idx_api_keys_token;"))
+            conn.execute(text("DROP INDEX IF EXISTS idx_api_keys_token_digest;"))
             conn.execute(text("DROP INDEX IF EXISTS idx_learnings_project;"))
             conn.execute(text("DROP INDEX IF EXISTS idx_learnings_user;"))
+            conn.execute(text("DROP INDEX IF EXISTS idx_learnings_project_id;"))
+            conn.execute(text("DROP INDEX IF EXISTS idx_learnings_user_id;"))
+            conn.execute(text("DROP INDEX IF EXISTS idx_learnings_user_library;"))
+            conn.execute(text("DROP INDEX IF EXISTS idx_learnings_user_function;"))
             conn.execute(text("DROP INDEX IF EXISTS idx_favorites_user;"))
             conn.execute(text("DROP INDEX IF EXISTS idx_projects_user;"))
 
         print("dropping existing tables")
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS schema_migrations;"))
         metadata.drop_all(engine)
         metadata.create_all(engine)
         print("Tables created successfully!")
 
         # Rationale behind index choices...
 
-        # IMPORTANT -> every API request will use token index
-        Index('idx_api_keys_token', api_keys.c.token, unique=True).create(bind=engine)
-        # Helpful for joins (get_learning_by_library, )
-        Index('idx_learnings_project', learnings.c.project_id).create(bind=engine)
-        #learnings by user: high frequency on dashboard and for RAG queries
-        Index('idx_learnings_user', learnings.c.user_id).create(bind=engine)
+        # IMPORTANT -> every API key cache miss uses the token digest index
+        Index('idx_api_keys_token_digest', api_keys.c.token_digest, unique=True).create(bind=engine)
+        # Helpful for joins (get_learning_by_library, ) + keyset pages of a project's learnings
+        Index('idx_learnings_project_id', learnings.c.project_id, learnings.c.id).create(bind=engine)
+        #learnings by user: high frequency on dashboard and for RAG queries (+ keyset pages ordered by id)
+        Index('idx_learnings_user_id', learnings.c.user_id, learnings.c.id).create(bind=engine)
         #get favorites at high frequency
         Index('idx_favorites_user', favorites.c.user_id).create(bind=engine)
         #used whenever view dashboard and and want projects for a user (also used in project ownership verification)
         Index('idx_projects_user', projects.c.user_id).create(bind=engine)
 
-        #create vector index for similarity search
+        #create vector index for similarity search (type + metric from app/services/retrieval.py, must match the query)
         with engine.begin() as conn:
-            conn.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_learnings_embedding
-                ON learnings
-                USING ivfflat (embedding vector_cosine_ops)
-                WITH (lists = 100);
-            """))
+            rebuild_vector_index(conn)
+
+        #fresh schema -> run (and record) every migration so app.migrate has nothing left to do
+        from app.migrate import run_migrations
+        run_migrations(engine)
 
         print("Database init complete")
         
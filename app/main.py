@@ -1,18 +1,29 @@
 # main.py
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from app.db import database
 from app.routers import projects, learnings, favorites, auth, rag
 from app.middleware.security import SecurityHeadersMiddleware
 from dotenv import load_dotenv
 import os
+import hmac
+import asyncio
 from datetime import datetime
 from fastapi.responses import JSONResponse
 from fastapi import Request
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from app.limiter import limiter
+from app.services.embedding_cache import embedding_cache
+from app.services.embedding_queue import embedding_worker, EMBEDDING_WORKER_ENABLED
+from app.services.vector_index import vector_index
+from app.services.usage import usage_meter
+from app.services.response_cache import response_cache
+from app.services.prompt_budget import history_summaries, load_encoding
+from app.services.api_key_cache import api_key_cache
+from app.services.project_ownership import project_ownership
+from app.services.passwords import password_hasher
 
 # Create the FastAPI app
 app = FastAPI()
@@ -20,6 +31,10 @@ app = FastAPI()
 # Load environment variables
 load_dotenv()
 
+#internal counters of the caches / queues / meters (GET /internal/stats) are only served to requests sending this
+#in X-Stats-Token; unset -> the endpoint doesn't exist (404)
+STATS_TOKEN = os.getenv("STATS_TOKEN")
+
 # Set up rate limiter
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
@@ -41,10 +56,21 @@ app.add_middleware(SecurityHeadersMiddleware)
 @app.on_event("startup")
 async def startup():
     await database.connect()
+    #backfills embeddings for new learnings in the background
+    if EMBEDDING_WORKER_ENABLED:
+        embedding_worker.start()
+    #flushes write-behind usage counts + sweeps old months
+    usage_meter.start()
+    #exact prompt token counts once tiktoken's encoding is loaded (may download it) -> not awaited, startup never
+    #waits for / fails on the network
+    asyncio.get_running_loop().run_in_executor(None, load_encoding)
 
 #run this function when the app shuts down
 @app.on_event("shutdown")
 async def shutdown():
+    await embedding_worker.stop()
+    await usage_meter.stop()
+    password_hasher.shutdown()
     await database.disconnect()
 
 # Connect the /projects routes
@@ -78,6 +104,24 @@ async def health_check():
             "timestamp": datetime.utcnow().isoformat()
         }
 
+#INTERNAL COUNTERS (cache sizes / hit rates, queue depths...) for operators, kept out of the public /health
+@app.get("/internal/stats")
+async def internal_stats(x_stats_token: str = Header(None)):
+    if not STATS_TOKEN or x_stats_token is None or not hmac.compare_digest(x_stats_token, STATS_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "embedding_cache": embedding_cache.stats(),
+        "embedding_queue": embedding_worker.stats(),
+        "vector_index": vector_index.stats(),
+        "usage_meter": usage_meter.stats(),
+        "response_cache": response_cache.stats(),
+        "history_summaries": history_summaries.stats(),
+        "api_key_cache": api_key_cache.stats(),
+        "project_ownership": project_ownership.stats(),
+        "password_hasher": password_hasher.stats()
+    }
+
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
     return JSONResponse(
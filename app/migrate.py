@@ -0,0 +1,183 @@
+#Applies schema changes to an EXISTING database without dropping data (init_db wipes everything).
+#Every migration runs once (tracked in schema_migrations) and is written to be safe to re-run.
+
+#run MANUALLY after deploying a schema change:
+#railway login; railway link; railway run python -m app.migrate
+#after changing VECTOR_INDEX_TYPE / VECTOR_DISTANCE_METRIC: python -m app.migrate --rebuild-vector-index
+#after changing EMBEDDING_DIMENSIONS / EMBEDDING_PRECISION: python -m app.migrate --apply-embedding-storage
+#if library / function counts drifted (learnings changed outside the api): python -m app.migrate --rebuild-facets
+import re
+import sys
+from sqlalchemy import text
+from app.init_db import create_db_engine
+from app.models.cached_embeddings import cached_embeddings
+from app.models.embedding_jobs import embedding_jobs
+from app.models.reembed_checkpoints import reembed_checkpoints
+from app.models.corpus_versions import corpus_versions
+from app.models.learning_facets import learning_facets
+from app.models.vector import EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, embedding_sql_type
+from app.services.retrieval import rebuild_vector_index, create_lexical_index
+from app.services.facets import rebuild_facets
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def create_cached_embeddings(conn):
+    cached_embeddings.create(bind=conn, checkfirst=True)
+
+
+#queue every learning without an embedding so the worker backfills it
+ENQUEUE_MISSING_EMBEDDINGS_SQL = """
+    INSERT INTO embedding_jobs (learning_id)
+    SELECT id
+    FROM learnings
+    WHERE embedding IS NULL
+    ON CONFLICT (learning_id) DO NOTHING;
+"""
+
+
+def create_embedding_jobs(conn):
+    embedding_jobs.create(bind=conn, checkfirst=True)
+    conn.execute(text(ENQUEUE_MISSING_EMBEDDINGS_SQL))
+
+
+def create_reembed_checkpoints(conn):
+    reembed_checkpoints.create(bind=conn, checkfirst=True)
+
+
+def apply_embedding_storage(conn):
+    #converts learnings.embedding to the configured type (vector / halfvec + dimensions) in place, no-op if it already is
+    #cached_embeddings always keeps full float32 vectors of any dimension
+    conn.execute(text("ALTER TABLE cached_embeddings ALTER COLUMN embedding TYPE vector;"))
+
+    current = conn.execute(text("""
+        SELECT format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = 'learnings'::regclass AND attname = 'embedding';
+    """)).scalar()
+    target = embedding_sql_type()
+    if current == target:
+        return
+    current_dimensions = int(re.search(r"\((\d+)\)", current).group(1))
+    print(f"Converting learnings.embedding from {current} to {target}...")
+
+    #the index is built for the old type
+    conn.execute(text("DROP INDEX IF EXISTS idx_learnings_embedding;"))
+    if EMBEDDING_DIMENSIONS == current_dimensions:
+        using = f"embedding::{target}"
+    elif EMBEDDING_DIMENSIONS < current_dimensions and EMBEDDING_MODEL.startswith("text-embedding-3"):
+        #text-embedding-3 vectors shortened + renormalized == what the API returns for `dimensions` -> no re-embed needed
+        using = f"l2_normalize(subvector(embedding::vector, 1, {EMBEDDING_DIMENSIONS}))::{target}"
+    else:
+        #can't be derived from the stored vectors -> cleared and re-embedded by the worker (or python -m app.reembed)
+        using = "NULL"
+    conn.execute(text(f"ALTER TABLE learnings ALTER COLUMN embedding TYPE {target} USING {using};"))
+    if using == "NULL":
+        conn.execute(text(ENQUEUE_MISSING_EMBEDDINGS_SQL))
+    rebuild_vector_index(conn)
+
+
+def create_learning_keyset_indexes(conn):
+    #list endpoints page through a user's / project's learnings ordered by id -> (owner, id) serves filter + order,
+    #and replaces the single column indexes
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_learnings_user_id ON learnings (user_id, id);"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_learnings_project_id ON learnings (project_id, id);"))
+    conn.execute(text("DROP INDEX IF EXISTS idx_learnings_user;"))
+    conn.execute(text("DROP INDEX IF EXISTS idx_learnings_project;"))
+
+
+def create_corpus_versions(conn):
+    corpus_versions.create(bind=conn, checkfirst=True)
+
+
+def create_learning_facets(conn):
+    learning_facets.create(bind=conn, checkfirst=True)
+    rebuild_facets(conn)
+
+
+def create_learning_lookup_indexes(conn):
+    #/users/{id}/learnings/library/{name} + /function/{name}
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_learnings_user_library ON learnings (user_id, library_name);"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_learnings_user_function ON learnings (user_id, function_name);"))
+
+
+def hash_api_key_tokens(conn):
+    #api keys are looked up by sha256(token) (fixed width index) and the plain tokens are dropped;
+    #existing keys keep working, the cli sends the same token and it hashes to the stored digest
+    conn.execute(text("ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS token_digest BYTEA;"))
+    has_token = conn.execute(text("""
+        SELECT 1 FROM information_schema.columns WHERE table_name = 'api_keys' AND column_name = 'token';
+    """)).scalar()
+    if has_token:
+        conn.execute(text("UPDATE api_keys SET token_digest = sha256(convert_to(token, 'UTF8')) WHERE token_digest IS NULL;"))
+        conn.execute(text("ALTER TABLE api_keys DROP COLUMN token;"))
+    conn.execute(text("ALTER TABLE api_keys ALTER COLUMN token_digest SET NOT NULL;"))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_api_keys_token_digest ON api_keys (token_digest);"))
+    conn.execute(text("DROP INDEX IF EXISTS idx_api_keys_token;"))
+
+
+#(name, function(conn)) in the order they must run -> append new ones at the end
+MIGRATIONS = [
+    ("0001_cached_embeddings", create_cached_embeddings),
+    ("0002_embedding_jobs", create_embedding_jobs),
+    #old ivfflat cosine index never matched the l2 (<->) query -> rebuild with the configured metric
+    ("0003_vector_index_metric", rebuild_vector_index),
+    #GIN full-text index for the keyword half of hybrid retrieval
+    ("0004_lexical_search_index", create_lexical_index),
+    ("0005_reembed_checkpoints", create_reembed_checkpoints),
+    #EMBEDDING_DIMENSIONS / EMBEDDING_PRECISION (re-run with --apply-embedding-storage when they change)
+    ("0006_embedding_storage", apply_embedding_storage),
+    #keyset pagination of the learning list endpoints
+    ("0007_learning_keyset_indexes", create_learning_keyset_indexes),
+    #ETag / 304 on the polled read endpoints
+    ("0008_corpus_versions", create_corpus_versions),
+    #per user library / function counts for the dashboard (re-count with --rebuild-facets)
+    ("0009_learning_facets", create_learning_facets),
+    ("0010_learning_lookup_indexes", create_learning_lookup_indexes),
+    #store sha256(token) instead of api key tokens
+    ("0011_api_key_digests", hash_api_key_tokens),
+]
+
+
+def run_migrations(engine=None):
+    engine = engine or create_db_engine()
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name VARCHAR PRIMARY KEY,
+                applied_at TIMESTAMP NOT NULL DEFAULT now()
+            );
+        """))
+        applied = {row[0] for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+        print(f"Applying migration {name}...")
+        #each migration gets its own transaction so a failure leaves earlier ones applied
+        with engine.begin() as conn:
+            migration(conn)
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+
+    print("Migrations complete")
+
+
+if __name__ == "__main__":
+    run_migrations()
+    if "--rebuild-vector-index" in sys.argv:
+        engine = create_db_engine()
+        with engine.begin() as conn:
+            rebuild_vector_index(conn)
+        print("Vector index rebuilt")
+    if "--apply-embedding-storage" in sys.argv:
+        engine = create_db_engine()
+        with engine.begin() as conn:
+            apply_embedding_storage(conn)
+        print(f"learnings.embedding stored as {embedding_sql_type()}")
+    if "--rebuild-facets" in sys.argv:
+        engine = create_db_engine()
+        with engine.begin() as conn:
+            rebuild_facets(conn)
+        print("Learning facets rebuilt")
@@ -1,4 +1,4 @@
-from sqlalchemy import Table, Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Table, Column, Integer, LargeBinary, DateTime, ForeignKey
 from app.models import metadata
 from datetime import datetime
 
@@ -7,7 +7,8 @@ api_keys = Table(
     "api_keys",
     metadata,
     Column("id", Integer, primary_key=True),
-    Column("token", String, unique=True, nullable=False),
+    #sha256 of the key, never the key itself (app/services/api_key_cache.py: token_digest), unique via idx_api_keys_token_digest
+    Column("token_digest", LargeBinary, nullable=False),
     Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
     Column("project_id", Integer, ForeignKey("projects.id"), nullable=False),
     Column("created_at", DateTime, default=datetime.utcnow, nullable=False)
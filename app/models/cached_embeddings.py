@@ -0,0 +1,18 @@
+# app/models/cached_embeddings.py
+from sqlalchemy import Table, Column, String, DateTime, PrimaryKeyConstraint, text
+from app.models.vector import Vector
+from app.models import metadata  # shared!
+
+#persistent tier of the embedding cache (see app/services/embedding_cache.py)
+#keyed by model + sha256 of the normalized text, so the same text is only ever embedded once
+#full float32, no fixed dimension: entries for other EMBEDDING_DIMENSIONS live under their own model key
+cached_embeddings = Table(
+    "cached_embeddings",
+    metadata,
+    Column("model", String, nullable=False),
+    Column("text_hash", String(64), nullable=False),
+    Column("embedding", Vector(), nullable=False),
+    #server side default: the databases package doesn't apply python-side column defaults
+    Column("created_at", DateTime, server_default=text("(now() AT TIME ZONE 'utc')"), nullable=False),
+    PrimaryKeyConstraint("model", "text_hash", name="pk_cached_embeddings")
+)
@@ -0,0 +1,14 @@
+# app/models/corpus_versions.py
+from sqlalchemy import Table, Column, Integer, BigInteger, DateTime, ForeignKey, text
+from app.models import metadata  # shared!
+
+#one counter per user, bumped in the same transaction as every change to their learnings / favorites
+#-> read endpoints derive ETags from it and answer If-None-Match with 304 after a primary key lookup
+#(app/services/corpus_version.py). Users without a row are at version 0.
+corpus_versions = Table(
+    "corpus_versions",
+    metadata,
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+    Column("version", BigInteger, server_default=text("0"), nullable=False),
+    Column("updated_at", DateTime, server_default=text("(now() AT TIME ZONE 'utc')"), nullable=False)
+)
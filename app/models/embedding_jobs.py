@@ -0,0 +1,17 @@
+# app/models/embedding_jobs.py
+from sqlalchemy import Table, Column, Integer, Text, DateTime, ForeignKey, text
+from app.models import metadata  # shared!
+
+#queue of learnings waiting for their embedding (worked by app/services/embedding_queue.py)
+#a row is deleted once the embedding is written back to learnings
+#server side defaults: the databases package doesn't apply python-side column defaults
+embedding_jobs = Table(
+    "embedding_jobs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("learning_id", Integer, ForeignKey("learnings.id", ondelete="CASCADE"), unique=True, nullable=False),
+    Column("attempts", Integer, server_default=text("0"), nullable=False),
+    Column("next_attempt_at", DateTime, server_default=text("(now() AT TIME ZONE 'utc')"), nullable=False), #utc, pushed back on failures
+    Column("last_error", Text, nullable=True),
+    Column("created_at", DateTime, server_default=text("(now() AT TIME ZONE 'utc')"), nullable=False)
+)
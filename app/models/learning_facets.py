@@ -0,0 +1,17 @@
+# app/models/learning_facets.py
+from sqlalchemy import Table, Column, Integer, String, DateTime, ForeignKey, Index, text
+from app.models import metadata  # shared!
+
+#libraries / functions a user has learnings for, with how many and when one was last added
+#kept up to date on every learning insert / delete (app/services/facets.py), rebuilt with python -m app.migrate --rebuild-facets
+#no primary key: the unique index is the upsert target AND covers (count, last_used) -> facet reads are index-only scans
+learning_facets = Table(
+    "learning_facets",
+    metadata,
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    Column("kind", String, nullable=False), #"library" / "function"
+    Column("name", String, nullable=False),
+    Column("count", Integer, server_default=text("0"), nullable=False),
+    Column("last_used", DateTime, server_default=text("(now() AT TIME ZONE 'utc')"), nullable=False),
+    Index("idx_learning_facets_user", "user_id", "kind", "name", unique=True, postgresql_include=["count", "last_used"])
+)
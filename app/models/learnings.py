@@ -1,7 +1,7 @@
 # app/models/learning.py
 
 from sqlalchemy import Table, Column, Integer, String, Text, ForeignKey
-from pgvector.sqlalchemy import Vector
+from app.models.vector import embedding_type
 from app.models import metadata  # shared!
 from app.db import database
 
@@ -16,5 +16,5 @@ learnings = Table(
     Column("description", Text, nullable=False),
     Column("code_snippet", Text, nullable=False),
     Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
-    Column("embedding", Vector(1536), nullable=True),
+    Column("embedding", embedding_type(), nullable=True), #vector / halfvec, see app/models/vector.py
 )
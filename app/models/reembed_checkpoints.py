@@ -0,0 +1,16 @@
+# app/models/reembed_checkpoints.py
+from sqlalchemy import Table, Column, Integer, String, DateTime, text
+from app.models import metadata  # shared!
+
+#progress of `python -m app.reembed` runs, one row per run name -> an interrupted run resumes after last_id
+#server side defaults: the databases package doesn't apply python-side column defaults
+reembed_checkpoints = Table(
+    "reembed_checkpoints",
+    metadata,
+    Column("name", String, primary_key=True),
+    Column("model", String, nullable=False),
+    Column("last_id", Integer, server_default=text("0"), nullable=False), #learnings.id, everything <= is done
+    Column("rows_done", Integer, server_default=text("0"), nullable=False),
+    Column("completed_at", DateTime, nullable=True),
+    Column("updated_at", DateTime, server_default=text("(now() AT TIME ZONE 'utc')"), nullable=False)
+)
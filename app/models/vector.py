@@ -0,0 +1,91 @@
+# app/models/vector.py
+import os
+import numpy as np
+from pgvector.sqlalchemy import Vector as PgVector, HALFVEC
+from dotenv import load_dotenv
+
+load_dotenv()
+
+#openAI embedding model (app/services/embedder.py), changing it? re-embed with python -m app.reembed --all
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+#what the model returns without a `dimensions` parameter
+NATIVE_DIMENSIONS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+
+#how learnings.embedding is stored. text-embedding-3 models can return fewer dimensions (e.g. 512),
+#float16 -> pgvector halfvec (needs pgvector >= 0.7 on the server): half the bytes per row and in the index.
+#changing either? python -m app.migrate --apply-embedding-storage (pick values with app.compare_embedding_storage)
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", str(NATIVE_DIMENSIONS.get(EMBEDDING_MODEL, 1536))))
+EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "float32")
+
+if EMBEDDING_PRECISION not in ("float32", "float16"):
+    raise ValueError("EMBEDDING_PRECISION must be float32 or float16")
+
+#per query search effort: candidates kept while walking the hnsw graph / ivf lists scanned
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+#pgvector >= 0.8: keep scanning the index when the user_id filter removes candidates. Without it the filter runs
+#after the ef_search candidates are picked, so a user with a small share of the corpus gets fewer than k rows (or none).
+#relaxed_order | strict_order | off. Older servers drop it with a warning; search_learnings' exact fallback covers them
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN", "relaxed_order")
+
+if HNSW_ITERATIVE_SCAN not in ("relaxed_order", "strict_order", "off"):
+    raise ValueError("HNSW_ITERATIVE_SCAN must be relaxed_order, strict_order or off")
+
+
+def vector_session_settings() -> dict:
+    #sent as server_settings when a pooled connection opens (app/db.py): they become the session DEFAULTS, so the
+    #RESET ALL asyncpg runs whenever a connection goes back to the pool keeps them, and a search needs no SET of its own
+    return {
+        "hnsw.ef_search": str(HNSW_EF_SEARCH),
+        "hnsw.iterative_scan": HNSW_ITERATIVE_SCAN,
+        "ivfflat.probes": str(IVFFLAT_PROBES),
+    }
+
+
+def _bind_float32(type_):
+    #values are bound as float32 numpy arrays and packed by the binary codec registered on every
+    #pooled connection (app/db.py), so a 1536-d vector is a ~6KB bound parameter instead of a ~30KB text literal
+    def process(value):
+        if value is None:
+            return None
+        value = np.asarray(value, dtype=np.float32)
+        if value.ndim != 1:
+            raise ValueError('expected ndim to be 1')
+        if type_.dim is not None and value.shape[0] != type_.dim:
+            raise ValueError('expected %d dimensions, not %d' % (type_.dim, value.shape[0]))
+        return value
+    return process
+
+
+#pgvector column types for the async app
+class Vector(PgVector):
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        return _bind_float32(self)
+
+
+class HalfVector(HALFVEC):
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        return _bind_float32(self)
+
+
+def embedding_type():
+    #column type of learnings.embedding for the configured storage
+    if EMBEDDING_PRECISION == "float16":
+        return HalfVector(EMBEDDING_DIMENSIONS)
+    return Vector(EMBEDDING_DIMENSIONS)
+
+
+def embedding_sql_type() -> str:
+    #as postgres' format_type() prints it
+    return f"{'halfvec' if EMBEDDING_PRECISION == 'float16' else 'vector'}({EMBEDDING_DIMENSIONS})"
+
+
+def as_float32(value) -> np.ndarray:
+    #vector columns decode to float32 arrays, halfvec ones to pgvector HalfVector objects
+    if hasattr(value, "to_numpy"):
+        value = value.to_numpy()
+    return np.asarray(value, dtype=np.float32)
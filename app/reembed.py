@@ -0,0 +1,186 @@
+#Backfills / re-embeds learnings.embedding in place (no data is dropped, unlike init_db).
+#Scans learnings by id in keyset batches, embeds them with multi-input API calls (concurrency + rate capped)
+#and writes every batch back with one pipelined update. Progress is checkpointed per batch (reembed_checkpoints),
+#so an interrupted run picks up where it stopped when started again with the same arguments.
+
+#fill in embeddings that are missing (openAI failures, dead embedding jobs):
+#railway run python -m app.reembed
+#re-embed everything (after changing EMBEDDING_MODEL / raising EMBEDDING_DIMENSIONS):
+#railway run python -m app.reembed --all
+import sys
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from sqlalchemy import select, func, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.db import database
+from app.models.learnings import learnings
+from app.models.embedding_jobs import embedding_jobs
+from app.models.reembed_checkpoints import reembed_checkpoints
+from app.services.embedder import embed_many, learning_text, EMBEDDING_KEY, EMBED_BATCH_SIZE, EMBED_CONCURRENCY
+from app.services.embedding_queue import UPDATE_EMBEDDING_SQL
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class RateLimiter:
+    #at most `per_minute` acquisitions per rolling minute, spaced evenly (0 -> unlimited)
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            wait = self._next - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next = max(self._next, loop.time()) + self.interval
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m app.reembed", description="Backfill or re-embed learnings.embedding")
+    parser.add_argument("--all", action="store_true", help="re-embed every learning, not only the ones without an embedding")
+    parser.add_argument("--name", help="checkpoint name (default: derived from the mode and the embedding model)")
+    parser.add_argument("--reset", action="store_true", help="ignore the saved checkpoint and start from the first row")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows read + written per batch")
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE, help="inputs per embeddings API call")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY, help="embeddings API calls in flight")
+    parser.add_argument("--max-requests-per-minute", type=int, default=300, help="embeddings API calls per minute (0 = no cap)")
+    parser.add_argument("--retries", type=int, default=5, help="attempts per batch before giving up")
+    return parser.parse_args(argv)
+
+
+def batch_query(last_id: int, batch_size: int, only_missing: bool):
+    #keyset pagination: id > last seen id uses the primary key, cost doesn't grow with the offset
+    query = (
+        select(learnings.c.id, learnings.c.description, learnings.c.code_snippet)
+        .where(learnings.c.id > last_id)
+        .order_by(learnings.c.id)
+        .limit(batch_size)
+    )
+    if only_missing:
+        query = query.where(learnings.c.embedding.is_(None))
+    return query
+
+
+async def load_checkpoint(name: str, reset: bool) -> dict:
+    row = await database.fetch_one(select(reembed_checkpoints).where(reembed_checkpoints.c.name == name))
+    if row is None or reset:
+        query = pg_insert(reembed_checkpoints).values(name=name, model=EMBEDDING_KEY, last_id=0, rows_done=0)
+        query = query.on_conflict_do_update(
+            index_elements=[reembed_checkpoints.c.name],
+            set_={"model": EMBEDDING_KEY, "last_id": 0, "rows_done": 0, "completed_at": None, "updated_at": datetime.utcnow()}
+        )
+        await database.execute(query)
+        return {"last_id": 0, "rows_done": 0, "completed_at": None, "model": EMBEDDING_KEY}
+    return dict(row)
+
+
+async def embed_with_retries(texts: list[str], args, rate_limiter: RateLimiter) -> list:
+    for attempt in range(args.retries):
+        try:
+            return await embed_many(
+                texts,
+                batch_size=args.embed_batch_size,
+                concurrency=args.concurrency,
+                rate_limiter=rate_limiter,
+                #a re-embed must reach the api (cache entries may predate a model / dimension change)
+                use_cache=not args.all
+            )
+        except Exception as e:
+            if attempt == args.retries - 1:
+                raise
+            delay = min(2 ** attempt, 60)
+            print(f"  embedding failed ({e}), retrying in {delay}s")
+            await asyncio.sleep(delay)
+
+
+async def write_batch(name: str, rows, vectors: list, rows_done: int):
+    #vectors + checkpoint in one transaction -> a crash never skips or half-writes a batch
+    ids = [r["id"] for r in rows]
+    async with database.transaction():
+        async with database.connection() as connection:
+            #asyncpg executemany pipelines all updates in a single round trip
+            await connection.raw_connection.executemany(UPDATE_EMBEDDING_SQL, list(zip(ids, vectors)))
+        #the embedding worker doesn't need to do these anymore
+        await database.execute(delete(embedding_jobs).where(embedding_jobs.c.learning_id.in_(ids)))
+        await database.execute(
+            reembed_checkpoints.update().where(reembed_checkpoints.c.name == name).values(
+                last_id=ids[-1], rows_done=rows_done, updated_at=datetime.utcnow()
+            )
+        )
+
+
+async def reembed(args) -> int:
+    only_missing = not args.all
+    name = args.name or f"{'all' if args.all else 'missing'}:{EMBEDDING_KEY}"
+    checkpoint = await load_checkpoint(name, args.reset)
+    if checkpoint["completed_at"] is not None:
+        if args.all:
+            print(f"Run '{name}' already completed at {checkpoint['completed_at']} (use --reset to run it again)")
+            return 0
+        #only NULL embeddings are picked up anyway -> a finished backfill can simply start over
+        checkpoint = await load_checkpoint(name, True)
+    if checkpoint["model"] != EMBEDDING_KEY:
+        print(f"Checkpoint '{name}' was made with {checkpoint['model']}, not {EMBEDDING_KEY} (use --reset)")
+        return 1
+
+    last_id, rows_done = checkpoint["last_id"], checkpoint["rows_done"]
+    remaining_query = select(func.count()).select_from(learnings).where(learnings.c.id > last_id)
+    if only_missing:
+        remaining_query = remaining_query.where(learnings.c.embedding.is_(None))
+    remaining = await database.fetch_val(remaining_query)
+    print(f"Run '{name}': {remaining} learnings to embed with {EMBEDDING_KEY}" + (f", resuming after id {last_id}" if last_id else ""))
+
+    rate_limiter = RateLimiter(args.max_requests_per_minute)
+    started = time.perf_counter()
+    processed = 0
+    while True:
+        rows = await database.fetch_all(batch_query(last_id, args.batch_size, only_missing))
+        if not rows:
+            break
+        batch_started = time.perf_counter()
+        vectors = await embed_with_retries(
+            [learning_text(r["description"], r["code_snippet"]) for r in rows], args, rate_limiter
+        )
+        rows_done += len(rows)
+        await write_batch(name, rows, vectors, rows_done)
+        last_id = rows[-1]["id"]
+        processed += len(rows)
+
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed else 0.0
+        eta = (remaining - processed) / rate if rate and remaining > processed else 0.0
+        print(
+            f"  {processed}/{remaining} rows (last id {last_id}) | batch {len(rows) / (time.perf_counter() - batch_started):.1f} rows/s"
+            f" | overall {rate:.1f} rows/s | eta {eta:.0f}s"
+        )
+
+    await database.execute(
+        reembed_checkpoints.update().where(reembed_checkpoints.c.name == name).values(
+            completed_at=datetime.utcnow(), updated_at=datetime.utcnow()
+        )
+    )
+    elapsed = time.perf_counter() - started
+    print(f"Done: {processed} rows in {elapsed:.1f}s ({processed / elapsed if elapsed else 0.0:.1f} rows/s), {rows_done} total for '{name}'")
+    #app instances with VECTOR_INDEX_IN_MEMORY pick up the new vectors within VECTOR_INDEX_TTL_SECONDS
+    return 0
+
+
+async def main(argv) -> int:
+    args = parse_args(argv)
+    await database.connect()
+    try:
+        return await reembed(args)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -1,12 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends, Header, Request
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, BackgroundTasks
 from pydantic import BaseModel
-from passlib.hash import bcrypt
 from app.db import database
 from app.models.users import users
 from app.models.api_keys import api_keys
-from app.models.project import projects
 from app.auth.jwt import create_access_token
 from app.auth.deps import get_current_user_id
+from app.services.project_ownership import project_ownership
+from app.services.api_key_cache import api_key_cache, token_digest
+from app.services.passwords import password_hasher, PasswordHasherBusy
 from sqlalchemy import select, insert, delete, join
 #for generating api keys
 import secrets
@@ -27,6 +28,10 @@ class LoginRequest(BaseModel):
 class ApiKeyRequest(BaseModel):
     project_id: int
 
+#too many hashes queued (login / signup burst): tell the client to come back instead of making it wait
+def password_hasher_busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="Too many logins right now, try again", headers={"Retry-After": "1"})
+
 @router.post("/signup")
 @limiter.limit("5/minute")  # Prevent rapid account creation
 async def signup(request: Request, data: dict):
@@ -54,7 +59,8 @@ async def signup(request: Request, data: dict):
                 }
             )
 
-        hashed_password = bcrypt.hash(password)
+        #bcrypt runs on the password hasher's threads, never on the event loop
+        hashed_password = await password_hasher.hash(password)
         query = users.insert().values(email=email, password=hashed_password)
         user_id = await database.execute(query)
         #create access token for user
@@ -67,6 +73,8 @@ async def signup(request: Request, data: dict):
         }
     except HTTPException as he:
         raise he
+    except PasswordHasherBusy:
+        raise password_hasher_busy()
     except Exception as e:
         print(f"Signup error: {str(e)}")
         raise HTTPException(
@@ -79,13 +87,22 @@ async def signup(request: Request, data: dict):
 
 
 @router.post("/login")
-async def login(request: LoginRequest):
+async def login(request: LoginRequest, background_tasks: BackgroundTasks):
     user = await database.fetch_one(
         users.select().where(users.c.email == request.email)
     )
     #check if user exists and password is correct
-    if not user or not bcrypt.verify(request.password, user.password):
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    try:
+        valid = await password_hasher.verify(request.password, user.password)
+    except PasswordHasherBusy:
+        raise password_hasher_busy()
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    #hashed with another cost than BCRYPT_ROUNDS -> re-hash now that we have the password (after the response is sent)
+    if password_hasher.needs_rehash(user.password):
+        background_tasks.add_task(password_hasher.rehash, user.id, request.password, user.password)
     
     #create access token for user
     access_token = create_access_token(
@@ -111,29 +128,29 @@ async def generate_api_key_route(
 ):
     try:
         # Verify project ownership
-        project_check = await database.fetch_one(
-            select(projects).where(projects.c.id == data.project_id).where(projects.c.user_id == current_user_id)
-        )
-        
-        if not project_check:
+        if not await project_ownership.owns(current_user_id, data.project_id):
             raise HTTPException(status_code=403, detail="Project not found or not owned by you")
         
-        # Delete existing API key if it exists for THAT project
-        await database.execute(
-            delete(api_keys).where(api_keys.c.user_id == current_user_id).where(api_keys.c.project_id == data.project_id)
-        )
-        
-        # Generate and insert new API key
+        # Generate the new API key (only its sha256 is stored, the key is shown once)
         api_key = generate_api_key()
         query = insert(api_keys).values(
-            token=api_key,
+            token_digest=token_digest(api_key),
             user_id=current_user_id,
             project_id=data.project_id,
             created_at=datetime.utcnow()
         )
-        
-        await database.execute(query)
+
+        # Replace the existing API key for THAT project
+        async with database.transaction():
+            await database.execute(
+                delete(api_keys).where(api_keys.c.user_id == current_user_id).where(api_keys.c.project_id == data.project_id)
+            )
+            await database.execute(query)
+        #the old key stops working here right away, on other instances within API_KEY_CACHE_TTL_SECONDS (5s by default)
+        api_key_cache.invalidate_project(current_user_id, data.project_id)
         return {"api_key": api_key}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating API key: {str(e)}")
         raise HTTPException(
@@ -158,7 +175,7 @@ async def validate_api_key(authorization: str = Header(...)) -> dict:
         api_keys.c.project_id
     ).select_from(
         join(api_keys, users, api_keys.c.user_id == users.c.id)
-    ).where(api_keys.c.token == api_key)
+    ).where(api_keys.c.token_digest == token_digest(api_key))
     
     result = await database.fetch_one(query)
     
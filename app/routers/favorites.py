@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request, Response
 from app.db import database
 from app.models.favorites import favorites
 from app.models.learnings import learnings
 from sqlalchemy import select, insert, delete, join
 from app.auth.deps import get_current_user_id
+from app.services.corpus_version import bump_corpus_version, not_modified
 
 router = APIRouter()
 
@@ -22,7 +23,9 @@ async def add_favorite(
         raise HTTPException(status_code=400, detail="Missing learning_id")
 
     query = insert(favorites).values(user_id=current_user_id, learning_id=learning_id)
-    await database.execute(query)
+    async with database.transaction():
+        await database.execute(query)
+        await bump_corpus_version(current_user_id)
     return {"message": "Added to favorites"}
 
 #REMOVE A LEARNING FROM FAVORITES:
@@ -39,17 +42,24 @@ async def remove_favorite(
         favorites.c.user_id == current_user_id,
         favorites.c.learning_id == learning_id
     )
-    await database.execute(query)
+    async with database.transaction():
+        await database.execute(query)
+        await bump_corpus_version(current_user_id)
     return {"message": "Removed from favorites"}
 
-#GET ALL FAVORITES FOR A USER:
+#GET ALL FAVORITES FOR A USER: (ETag / If-None-Match -> 304 while nothing changed)
 @router.get("/users/{user_id}/favorites")
 async def get_favorites(
     user_id: int,
+    request: Request,
+    response: Response,
     current_user_id: int = Depends(get_current_user_id)
 ):
     if user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
+    cached = await not_modified(request, response, user_id)
+    if cached:
+        return cached
 
    # Convert to match the rest of your codebase
     j = join(favorites, learnings, favorites.c.learning_id == learnings.c.id)
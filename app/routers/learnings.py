@@ -1,10 +1,17 @@
 
-from fastapi import APIRouter, HTTPException, Request, Depends
+from typing import Optional, Literal
+from fastapi import APIRouter, HTTPException, Request, Depends, Response, Query
 from app.db import database
 from app.models.learnings import learnings
 from app.models.project import projects
 from sqlalchemy import select, join, update, delete
-from app.auth.deps import get_current_user_id
+from app.auth.deps import get_current_user_id, require_project_owner
+from app.services import learning_events
+from fastapi.responses import StreamingResponse
+from app.services.learning_pages import parse_fields, fetch_learning_page, grouped_learnings_query, open_json_groups
+from app.services.queries import learning_owner
+from app.services.corpus_version import bump_corpus_version
+from app.services.facets import remove_facets
 
 #creates router object: groups endpoints together
 router = APIRouter()
@@ -12,44 +19,29 @@ router = APIRouter()
 
 
 # RETURN ALL LEARNINGS FOR A PROJECT
+#paged with ?limit=&cursor= (cursor = X-Next-Cursor header of the previous page; neither -> everything), ?fields=a,b to pick fields,
+#?summary=true for code snippets cut to SUMMARY_SNIPPET_CHARS
 @router.get("/projects/{project_id}/learnings")
 async def get_learnings(
     project_id: int,
-    #extracts user_id from auth token
-    current_user_id: int = Depends(get_current_user_id)
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[int] = Query(None, ge=0),
+    fields: Optional[str] = None,
+    summary: bool = False,
+    #extracts user_id from auth token + makes sure the project actually belongs to that user
+    current_user_id: int = Depends(require_project_owner)
 ):
-    #Make sure the project actually belongs to the correct user
-    project = await database.fetch_one(
-        select(projects).where(
-            projects.c.id == project_id,
-            projects.c.user_id == current_user_id
-        )
-    )
-    if not project:
-        raise HTTPException(status_code=403, detail="Project not found or not owned by you")
+    selected = parse_fields(fields, ("id", "file_path", "function_name", "library_name", "description", "code_snippet", "project_id", "user_id"))
 
-    #uses index: idx_learnings_project for the filter: 
-    query = select(learnings).where(learnings.c.project_id == project_id)
-    results = await database.fetch_all(query)
-    
-    # Format results similar to other endpoints
-    formatted_learnings = []
-    for row in results:
-        learning = {
-            "id": row["id"],
-            "file_path": row["file_path"],
-            "function_name": row["function_name"],
-            "library_name": row["library_name"],
-            "description": row["description"],
-            "code_snippet": row["code_snippet"],
-            "project_id": row["project_id"],
-            "user_id": row["user_id"]
-        }
-        formatted_learnings.append(learning)
-    #return the list of learnings
-    return formatted_learnings
+    #uses index: idx_learnings_project_id (project_id, id) for the filter + keyset order
+    return await fetch_learning_page(response, [learnings.c.project_id == project_id], selected, summary, limit, cursor)
+
+#the grouped JSON is built by postgres (json_agg) and streamed through one group at a time
+GROUPED_FIELDS = ("id", "file_path", "function_name", "library_name", "description", "code_snippet")
 
-# GETS ALL LEARNINGS FOR A SPECIFC LIBRARY
+
+# GETS ALL LEARNINGS FOR A SPECIFC LIBRARY (grouped by project name)
 @router.get("/users/{user_id}/learnings/library/{library_name}")
 async def get_learnings_by_library(
     user_id: int,
@@ -59,47 +51,14 @@ async def get_learnings_by_library(
     #make sure the user is the one trying to access the learnings
     if user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
-    #join the learnings and projects tables to get all libraries grouped by project name: 
-    j = join(learnings, projects, learnings.c.project_id == projects.c.id)
-    query = (
-        select(
-            projects.c.name.label("project_name"),
-            learnings.c.id,
-            learnings.c.file_path,
-            learnings.c.function_name,
-            learnings.c.library_name,
-            learnings.c.description,
-            learnings.c.code_snippet
-        )
-        .select_from(j)
-        .where(
-            projects.c.user_id == current_user_id,
-            learnings.c.library_name == library_name
-        )
+    #uses index: idx_learnings_user_library (user_id, library_name)
+    query = grouped_learnings_query(
+        [learnings.c.user_id == current_user_id, learnings.c.library_name == library_name],
+        "project", list(GROUPED_FIELDS), with_count=False
     )
-    rows = await database.fetch_all(query)
-
-    # Group learnings by project name
-    grouped = {}
-    for row in rows:
-        project = row["project_name"]
-        learning = {
-            "id": row["id"],
-            "file_path": row["file_path"],
-            "function_name": row["function_name"],
-            "library_name": row["library_name"],
-            "description": row["description"],
-            "code_snippet": row["code_snippet"]
-        }
-        #dictionary with project name as key and list of learnings as value
-        grouped.setdefault(project, []).append(learning)
+    return StreamingResponse(await open_json_groups(query), media_type="application/json")
 
-    return [
-        {"project_name": name, "learnings": grouped[name]}
-        for name in grouped
-    ]
-
-# GETS ALL LEARNINGS FOR A SPECIFC FUNCTION: 
+# GETS ALL LEARNINGS FOR A SPECIFC FUNCTION (grouped by project name)
 @router.get("/users/{user_id}/learnings/function/{function_name}")
 async def get_learnings_by_function(
     user_id: int,
@@ -109,45 +68,29 @@ async def get_learnings_by_function(
     #make sure the user is the one trying to access the learnings
     if user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
-
-    #join the learnings and projects tables to get all functions grouped by project name: 
-    j = join(learnings, projects, learnings.c.project_id == projects.c.id)
-    query = (
-        select(
-            projects.c.name.label("project_name"),
-            learnings.c.id,
-            learnings.c.file_path,
-            learnings.c.function_name,
-            learnings.c.library_name,
-            learnings.c.description,
-            learnings.c.code_snippet
-        )
-        .select_from(j)
-        .where(
-            projects.c.user_id == current_user_id,
-            learnings.c.function_name == function_name
-        )
+    #uses index: idx_learnings_user_function (user_id, function_name)
+    query = grouped_learnings_query(
+        [learnings.c.user_id == current_user_id, learnings.c.function_name == function_name],
+        "project", list(GROUPED_FIELDS), with_count=False
     )
-    rows = await database.fetch_all(query)
+    return StreamingResponse(await open_json_groups(query), media_type="application/json")
 
-    # Group by project_name
-    grouped = {}
-    for row in rows:
-        project = row["project_name"]
-        learning = {
-            "id": row["id"],
-            "file_path": row["file_path"],
-            "function_name": row["function_name"],
-            "library_name": row["library_name"],
-            "description": row["description"],
-            "code_snippet": row["code_snippet"]
-        }
-        grouped.setdefault(project, []).append(learning)
-
-    return [
-        {"project_name": name, "learnings": grouped[name]}
-        for name in grouped
-    ]
+# GETS ALL LEARNINGS OF A USER GROUPED BY LIBRARY / FUNCTION / PROJECT
+#-> [{"library_name": ..., "count": n, "learnings": [...]}, ...] ordered by name (learnings without one -> null group, last)
+#?fields= / ?summary=true as on /users/{id}/learnings
+@router.get("/users/{user_id}/learnings/grouped")
+async def get_grouped_learnings(
+    user_id: int,
+    by: Literal["library", "function", "project"] = "library",
+    fields: Optional[str] = None,
+    summary: bool = False,
+    current_user_id: int = Depends(get_current_user_id)
+):
+    if user_id != current_user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    selected = parse_fields(fields, GROUPED_FIELDS)
+    query = grouped_learnings_query([learnings.c.user_id == current_user_id], by, selected, summary)
+    return StreamingResponse(await open_json_groups(query), media_type="application/json")
 
 
 @router.delete("/learnings/{learning_id}")
@@ -155,23 +98,21 @@ async def delete_learning(
     learning_id: int,
     current_user_id: int = Depends(get_current_user_id)
 ):
-    # First verify learning ownership through project
-    learning = await database.fetch_one(
-        select(learnings, projects.c.user_id)
-        .select_from(
-            join(learnings, projects, learnings.c.project_id == projects.c.id)
-        )
-        .where(learnings.c.id == learning_id)
-    )
+    # First verify learning ownership through project (id + owner only, not the whole row)
+    learning = await learning_owner(learning_id)
     
     if not learning:
         raise HTTPException(status_code=404, detail="Learning not found")
     
     #check if the user owns the learning
-    if learning['user_id'] != current_user_id:
+    if learning['owner_id'] != current_user_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this learning")
 
     #delete the learning
-    query = delete(learnings).where(learnings.c.id == learning_id)
-    await database.execute(query)
+    query = delete(learnings).where(learnings.c.id == learning_id).returning(learnings.c.library_name, learnings.c.function_name)
+    async with database.transaction():
+        deleted = await database.fetch_all(query)
+        await remove_facets(current_user_id, deleted)
+        await bump_corpus_version(current_user_id)
+    learning_events.learnings_deleted(current_user_id, [learning_id])
     return {"message": "Learning deleted successfully"}
@@ -1,14 +1,21 @@
-from fastapi import APIRouter, HTTPException, Request, Depends
-from pydantic import BaseModel # creates data validation schemas
-from sqlalchemy import select, distinct, join # database operations
+from fastapi import APIRouter, HTTPException, Request, Depends, Response, Query
+from pydantic import BaseModel, ValidationError # creates data validation schemas
 from app.db import database #async databse connection object 
 from app.models.project import projects
 from app.models.learnings import learnings
 #returns the user id associated with the token
-from app.auth.deps import get_current_user_id
+from app.auth.deps import get_current_user_id, require_project_owner
 #for type hinting
 from typing import Optional
-from app.services.embedder import embed #embeds text into a vector
+#embeddings are filled in by the background worker
+from app.services.embedding_queue import enqueue_embedding_jobs, embedding_worker
+from app.services.learning_pages import parse_fields, fetch_learning_page, open_learnings_export
+from app.services.project_ownership import project_ownership
+from app.services.queries import allocate_learning_ids
+from app.services.corpus_version import bump_corpus_version, not_modified
+from app.services.facets import add_facets, list_facets
+from fastapi.responses import StreamingResponse
+import json
 import logging
 logger = logging.getLogger(__name__)
 
@@ -27,15 +34,29 @@ class LearningIn(BaseModel):
     description: str
     code_snippet: str
 
+#max learnings accepted by one bulk request
+MAX_BULK_LEARNINGS = 1000
+
+
+#stores paths relative to the repo root
+def normalize_file_path(file_path: str) -> str:
+    # Convert absolute path to relative path
+    if file_path.startswith('/'):
+        # Remove leading slash
+        file_path = file_path[1:]
+    
+    # Remove any potential Windows-style absolute paths
+    if ':' in file_path:
+        file_path = '/'.join(file_path.split('/')[1:])
+    return file_path
 
 #LIST ALL PROJECTS FOR A USER: used in dashboard:
 @router.get("/users/{user_id}/projects")
 async def list_projects(user_id: int, current_user_id: int = Depends(get_current_user_id)):
     if user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
-    query = select(projects).where(projects.c.user_id == user_id)
-    results = await database.fetch_all(query)
-    return results
+    #same list the ownership checks use -> cached in process (app/services/project_ownership.py)
+    return await project_ownership.list_projects(user_id)
 
 #GET PROJECT BY ID: used by CLI to verify project ownership
 @router.get("/projects/{project_id}")
@@ -44,9 +65,7 @@ async def get_project(
     current_user_id: int = Depends(get_current_user_id)
 ):
     # Check if project exists and is owned by current user
-    project = await database.fetch_one(
-        select(projects).where(projects.c.id == project_id, projects.c.user_id == current_user_id)
-    )
+    project = await project_ownership.get_project(current_user_id, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found or not owned by you")
     return project
@@ -68,40 +87,20 @@ async def create_project(
         user_id=user_id
     )
     project_id = await database.execute(query)
+    project_ownership.invalidate_user(user_id)
     return {"id": project_id, "message": "Project created"}
 #CREATE A LEARNING: used in cli, 
 @router.post("/projects/{project_id}/learnings")
 async def create_learning(
     project_id: int,
     learning: LearningIn,
-    current_user_id: int = Depends(get_current_user_id)
+    #make sure user signed in is the one who owns the project (403 otherwise)
+    current_user_id: int = Depends(require_project_owner)
 ):
-    #make sure user signed in is the one who owns the project
-    project_check = await database.fetch_one(
-        select(projects).where(projects.c.id == project_id, projects.c.user_id == current_user_id)
-    )          
-    if not project_check:
-        raise HTTPException(status_code=403, detail="You don't own this project ://///")
-    
-    # Convert absolute path to relative path
-    file_path = learning.file_path
-    if file_path.startswith('/'):
-        # Remove leading slash
-        file_path = file_path[1:]
-    
-    # Remove any potential Windows-style absolute paths
-    if ':' in file_path:
-        file_path = '/'.join(file_path.split('/')[1:])
-    
-    # Generate embedding using both description and code
-    full_text = f"{learning.description}\n\n{learning.code_snippet}"
-    try:
-        vector = await embed(full_text)
-    except Exception as e:
-        logger.error(f"Failed to embed learning: {e}")
-        raise HTTPException(status_code=500, detail="Embedding failed")
+    file_path = normalize_file_path(learning.file_path)
 
-    # Insert learning with embedding (embedding in the learning schema)
+    # Insert learning WITHOUT embedding + queue it, so the write never waits on openAI
+    # (the embedding worker backfills it, the learning shows up in rag queries once it is embedded)
     query = learnings.insert().values(
         project_id=project_id,
         file_path=file_path,
@@ -109,69 +108,207 @@ async def create_learning(
         library_name=learning.library_name,
         description=learning.description,
         code_snippet=learning.code_snippet,
-        user_id=current_user_id,
-        embedding=vector
+        user_id=current_user_id
     )
-    learning_id = await database.execute(query)
+    async with database.transaction():
+        learning_id = await database.execute(query)
+        await enqueue_embedding_jobs([learning_id])
+        await add_facets(current_user_id, [{"library_name": learning.library_name, "function_name": learning.function_name}])
+        await bump_corpus_version(current_user_id)
+    embedding_worker.notify()
     return {"id": learning_id, "message": "Learning logged!"}
 
+#reads the bulk body: a JSON list, or NDJSON (one learning per line) parsed as it streams in
+async def read_bulk_items(request: Request) -> list:
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" not in content_type and "jsonl" not in content_type:
+        try:
+            items = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON list or NDJSON")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON list or NDJSON")
+        return items
+
+    items = []
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                items.append(line)
+        if len(items) > MAX_BULK_LEARNINGS:
+            break
+    if buffer.strip():
+        items.append(buffer)
+    return items
+
+#CREATE MANY LEARNINGS AT ONCE: used by the cli when syncing a repo
+#writes every row with a single INSERT and queues them for the embedding worker (multi-input batches); results are reported per item
+@router.post("/projects/{project_id}/learnings/bulk")
+async def create_learnings_bulk(
+    project_id: int,
+    request: Request,
+    current_user_id: int = Depends(require_project_owner)
+):
+    items = await read_bulk_items(request)
+    if len(items) > MAX_BULK_LEARNINGS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_LEARNINGS} learnings per request")
+
+    results = [None] * len(items)
+    valid = [] #(index, LearningIn)
+    for i, item in enumerate(items):
+        try:
+            #ndjson lines are still raw bytes
+            if isinstance(item, bytes):
+                item = json.loads(item)
+            if not isinstance(item, dict):
+                raise ValueError("Each learning must be a JSON object")
+            valid.append((i, LearningIn(**item)))
+        except ValidationError as e:
+            message = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            results[i] = {"index": i, "status": "error", "error": message}
+        except ValueError as e:
+            results[i] = {"index": i, "status": "error", "error": str(e)}
+
+    rows = [{
+        "project_id": project_id,
+        "file_path": normalize_file_path(learning.file_path),
+        "function_name": learning.function_name,
+        "library_name": learning.library_name,
+        "description": learning.description,
+        "code_snippet": learning.code_snippet,
+        "user_id": current_user_id
+    } for _, learning in valid]
+
+    if rows:
+        async with database.transaction():
+            #ids allocated up front -> every input index is paired with its own id
+            ids = await allocate_learning_ids(len(rows))
+            for row, learning_id in zip(rows, ids):
+                row["id"] = learning_id
+            #single multi-row INSERT
+            await database.execute(learnings.insert().values(rows))
+            await enqueue_embedding_jobs(ids)
+            await add_facets(current_user_id, rows)
+            await bump_corpus_version(current_user_id)
+        embedding_worker.notify()
+        for (i, _), learning_id in zip(valid, ids):
+            results[i] = {"index": i, "status": "created", "id": learning_id}
+
+    return {
+        "created": len(rows),
+        "failed": len(items) - len(rows),
+        "results": results
+    }
+
 
 
 #GET ALL LIBRARIES USED BY A USER:
+#read from the learning_facets table (kept up to date on every insert / delete), sorted by name
+#?counts=true -> [{"name", "count", "last_used"}] instead of just the names
+#ETag / If-None-Match -> 304 while the user's learnings haven't changed
 @router.get("/users/{user_id}/libraries")
 async def get_libraries_for_user(
     user_id: int,
+    request: Request,
+    response: Response,
+    counts: bool = False,
     current_user_id: int = Depends(get_current_user_id)
 ):
     if user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
-    j = join(learnings, projects, learnings.c.project_id == projects.c.id)
-    query = select(distinct(learnings.c.library_name)).select_from(j).where(projects.c.user_id == user_id)
-    results = await database.fetch_all(query)
-    return [row[0] for row in results if row[0] is not None]
+    cached = await not_modified(request, response, user_id)
+    if cached:
+        return cached
+    facets = await list_facets(user_id, "library")
+    if counts:
+        return [{"name": row["name"], "count": row["count"], "last_used": row["last_used"]} for row in facets]
+    return [row["name"] for row in facets]
 
 #GET ALL FUNCTIONS USED BY A USER:
+#read from the learning_facets table (kept up to date on every insert / delete), sorted by name
+#?counts=true -> [{"name", "count", "last_used"}] instead of just the names
+#ETag / If-None-Match -> 304 while the user's learnings haven't changed
 @router.get("/users/{user_id}/functions")
 async def get_functions_for_user(
     user_id: int,
+    request: Request,
+    response: Response,
+    counts: bool = False,
     current_user_id: int = Depends(get_current_user_id)
 ):
     if user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
-    j = join(learnings, projects, learnings.c.project_id == projects.c.id)
-    query = select(distinct(learnings.c.function_name)).select_from(j).where(projects.c.user_id == user_id)
-    results = await database.fetch_all(query)
-    return [row[0] for row in results if row[0] is not None]
+    cached = await not_modified(request, response, user_id)
+    if cached:
+        return cached
+    facets = await list_facets(user_id, "function")
+    if counts:
+        return [{"name": row["name"], "count": row["count"], "last_used": row["last_used"]} for row in facets]
+    return [row["name"] for row in facets]
 
 #GET ALL LEARNINGS FOR A USER: (used in extension)
+#paged like /projects/{id}/learnings: ?limit=&cursor=, ?fields=, ?summary=true
+#ETag / If-None-Match -> 304 while the user's learnings haven't changed
 @router.get("/users/{user_id}/learnings")
 async def get_all_learnings_for_user(
     user_id: int,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[int] = Query(None, ge=0),
+    fields: Optional[str] = None,
+    summary: bool = False,
     current_user_id: int = Depends(get_current_user_id)
 ):
     try:
         if user_id != current_user_id:
             raise HTTPException(status_code=403, detail="Forbidden")
-        
-        query = select(learnings).where(learnings.c.user_id == user_id)
-        results = await database.fetch_all(query)
-        
-        formatted_learnings = []
-        for row in results:
-            learning = {
-                 "id": row["id"],
-                "file_path": row["file_path"],
-                "function_name": row["function_name"],
-                "library_name": row["library_name"],
-                "description": row["description"],
-                "code_snippet": row["code_snippet"]
-            }
-            formatted_learnings.append(learning)
-        
-        return formatted_learnings
+        selected = parse_fields(fields, ("id", "file_path", "function_name", "library_name", "description", "code_snippet"))
+        cached = await not_modified(request, response, user_id)
+        if cached:
+            return cached
+
+        #uses index: idx_learnings_user_id (user_id, id)
+        return await fetch_learning_page(response, [learnings.c.user_id == user_id], selected, summary, limit, cursor)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching learnings: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error while fetching learnings: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+#EXPORT ALL LEARNINGS FOR A USER: (backups / syncing everything at once)
+#NDJSON streamed straight from a database cursor, gzip'd when the client accepts it;
+#?cursor= resumes after the last id received, ?fields= / ?summary=true as on /users/{id}/learnings
+@router.get("/users/{user_id}/learnings/export")
+async def export_learnings_for_user(
+    user_id: int,
+    request: Request,
+    cursor: Optional[int] = Query(None, ge=0),
+    fields: Optional[str] = None,
+    summary: bool = False,
+    current_user_id: int = Depends(get_current_user_id)
+):
+    if user_id != current_user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    selected = parse_fields(fields, ("id", "file_path", "function_name", "library_name", "description", "code_snippet", "project_id"))
+    compress = "gzip" in request.headers.get("accept-encoding", "")
+
+    headers = {
+        "Content-Disposition": f'attachment; filename="learnings-{user_id}.ndjson"',
+        "Vary": "Accept-Encoding",
+        #stop proxies from buffering the stream
+        "X-Accel-Buffering": "no"
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        await open_learnings_export([learnings.c.user_id == user_id], selected, summary, cursor, compress),
+        media_type="application/x-ndjson",
+        headers=headers
+    )
\ No newline at end of file
@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, validator
 from app.auth.deps import get_current_user_id
 from app.services.embedder import embed
-from app.services.llm import call_gpt4_llm
+from app.services.llm import call_gpt4_llm, stream_gpt4_llm
 from app.db import database
 import logging
-from datetime import datetime
-from app.models.usage_limits import usage_limits
-from sqlalchemy import select, insert, update, text, delete
+import time
+import asyncio
+from app.services.usage import usage_meter, current_month_key, MONTHLY_QUERY_LIMIT
+from app.services.retrieval import (
+    search_learnings, lexical_search, lexical_is_confident, lexical_results, reciprocal_rank_fusion,
+    HYBRID_SEARCH_ENABLED, LEXICAL_CANDIDATES
+)
+from app.services.response_cache import response_cache, history_hash
+from app.services.prompt_budget import fit_prompt
+from typing import Optional, Literal
 import traceback
+import json
 
 # Add logging configuration
 logging.basicConfig(
@@ -29,7 +38,8 @@ class Message(BaseModel):
 
 class QueryRequest(BaseModel):
     query: str #contains the user's query
-    mode: str = "simple"  # or "powered"
+    #anything but "simple" / "powered" is a 422: an unknown mode must not reach the llm without being metered
+    mode: Literal["simple", "powered"] = "simple"
     conversation_history: list[Message] = [] #contains the conversation history
     
     #RUNS when the user submits a query
@@ -39,69 +49,46 @@ class QueryRequest(BaseModel):
             raise ValueError("Query length cannot exceed 500 characters")
         return v
 
-MONTHLY_QUERY_LIMIT = 15
-
-#CHECKS IF THE USER HAS REACHED THE MONTHLY QUERY LIMIT
-async def check_and_update_usage(user_id: int, database) -> bool:
-    current_month_key = datetime.utcnow().strftime("%Y-%m")
-    query = select(usage_limits).where(
-        usage_limits.c.user_id == user_id,
-        usage_limits.c.month_key == current_month_key
-    )
-    result = await database.fetch_one(query)
-
-    if not result:
-        # Clean up old records only when creating new month record
-        await database.execute(
-            delete(usage_limits).where(
-                usage_limits.c.month_key != current_month_key,
-                usage_limits.c.user_id == user_id
-            )
-        )
-        
-        query = insert(usage_limits).values(
-            user_id=user_id,
-            month_key=current_month_key,
-            powered_queries_count=1
-        )
-        await database.execute(query)
-        return True
-
-    if result['powered_queries_count'] >= MONTHLY_QUERY_LIMIT:
-        return False
-
-    query = update(usage_limits).where(
-        usage_limits.c.user_id == user_id,
-        usage_limits.c.month_key == current_month_key
-    ).values(
-        powered_queries_count=usage_limits.c.powered_queries_count + 1
-    )
-    await database.execute(query)
-
-    return True
-
 #USED TO MAKE SURE THE USER CAN MAKE ANOTHER REQUEST
-async def get_current_usage(user_id: int, database) -> dict:
-    current_month_key = datetime.utcnow().strftime("%Y-%m")
-    query = select(usage_limits).where(
-        usage_limits.c.user_id == user_id,
-        usage_limits.c.month_key == current_month_key
-    )
-    result = await database.fetch_one(query)
-
+async def get_current_usage(user_id: int) -> dict:
+    #one indexed lookup of the usage_limits row (in memory with USAGE_WRITE_BEHIND)
+    current_usage = await usage_meter.current(user_id)
     return {
-        "current_usage": result['powered_queries_count'] if result else 0,
+        "current_usage": current_usage,
         "limit": MONTHLY_QUERY_LIMIT,
-        "month": current_month_key
+        "remaining": max(0, MONTHLY_QUERY_LIMIT - current_usage),
+        "month": current_month_key()
     }
 
-#RAG QUERY ENDPOINT
-@router.post("/rag/query")
-async def query_rag(request: QueryRequest, current_user_id: int = Depends(get_current_user_id)):
-
-    can_make_request = await check_and_update_usage(current_user_id, database)
-    if not can_make_request:
-        usage = await get_current_usage(current_user_id, database)
+#RECORDS HOW LONG A STAGE OF THE REQUEST TOOK (ms) INTO timings
+async def timed(timings: dict, stage: str, awaitable):
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+#callbacks(mode, timings) run for every finished query (app.benchmarks collects stage latencies through this)
+timing_observers = []
+
+def log_timings(user_id: int, mode: str, timings: dict, started: float):
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    for observer in timing_observers:
+        observer(mode, timings)
+    logger.info(f"RAG timings user={user_id} mode={mode} " + " ".join(f"{stage}={ms}ms" for stage, ms in timings.items()))
+
+#STARTS THE POWERED QUERY RESERVATION (only powered queries are charged) -> runs concurrently with the keyword search
+#and the query embedding, and is settled before the llm call
+def start_quota_reservation(request: QueryRequest, user_id: int, timings: dict) -> Optional[asyncio.Task]:
+    if request.mode != "powered":
+        return None
+    return asyncio.create_task(timed(timings, "quota", usage_meter.reserve(user_id)))
+
+#WAITS FOR THE RESERVATION, RAISES 429 IF THE USER HAS REACHED THE MONTHLY QUERY LIMIT
+async def settle_quota(quota_task: asyncio.Task, user_id: int):
+    reserved = await quota_task
+    if reserved is None:
+        usage = await get_current_usage(user_id)
         raise HTTPException(
             status_code=429,
             detail={
@@ -111,67 +98,121 @@ async def query_rag(request: QueryRequest, current_user_id: int = Depends(get_cu
                 "month": usage["month"]
             }
         )
-    #QUERY CANNOT BE EMPTY
-    if not request.query.strip():
-        raise HTTPException(status_code=400, detail="Query cannot be empty")
 
+#GIVES BACK A RESERVATION THAT WON'T BE USED (cached answer, or failure before the llm call)
+async def release_quota(quota_task: Optional[asyncio.Task], user_id: int):
+    if quota_task is None:
+        return
     try:
-        query_vector = await embed(request.query)
+        reserved = await quota_task
+    except Exception:
+        return
+    if reserved is not None:
+        await usage_meter.refund(user_id)
+
+#RETURNS (query vector or None, THE USER'S LEARNINGS CLOSE ENOUGH TO THE QUERY)
+#keyword search first: when it is confident (query is a function / library name...) no embedding is made,
+#otherwise its hits are fused with the vector search
+#quota_task (powered mode): the embedding (usually an embedding cache hit) runs alongside the reservation; when the
+#reservation is rejected the embedding task is cancelled and the 429 goes out without waiting for it
+async def retrieve_relevant_learnings(request: QueryRequest, user_id: int, timings: dict, quota_task: Optional[asyncio.Task] = None):
+    lexical_rows = []
+    if HYBRID_SEARCH_ENABLED:
+        try:
+            lexical_rows = await timed(timings, "lexical", lexical_search(user_id, request.query))
+        except Exception as e:
+            #keyword search is an optimization, the vector search still answers
+            logger.warning(f"Lexical search failed: {e}")
+        if lexical_is_confident(request.query, lexical_rows):
+            logger.info(f"Lexical fast path for user {user_id}, {len(lexical_rows)} keyword matches")
+            return None, lexical_results(lexical_rows)
+
+    embed_task = asyncio.create_task(timed(timings, "embed", embed(request.query)))
+    if quota_task is not None:
+        try:
+            await settle_quota(quota_task, user_id)
+        except BaseException:
+            embed_task.cancel()
+            raise
+
+    try:
+        query_vector = await embed_task
     except Exception as e:
         logger.error(f"Embedding generation failed: {e}")
         raise HTTPException(status_code=500, detail="Failed to process query")
 
-    #FORMAT THE QUERY VECTOR
-    vector_str = f"'[{','.join(map(str, query_vector))}]'"
-
-    #finds the cosine similarity between the query vector and the learnings vector
-    sql = f"""
-    SELECT id, description, code_snippet, function_name, library_name,
-           embedding <-> {vector_str}::vector as similarity
-    FROM learnings
-    WHERE user_id = :user_id
-    ORDER BY similarity
-    LIMIT 3
-    """
+    #the query vector is a bound parameter (binary pgvector codec) and the distance uses the same
+    #metric as idx_learnings_embedding, so the ANN index serves the search
     try:
-        rows = await database.fetch_all(sql, {"user_id": current_user_id})
+        rows = await timed(timings, "search", search_learnings(user_id, query_vector, limit=LEXICAL_CANDIDATES if lexical_rows else 3))
         logger.info(f"Database query successful, found {len(rows)} results")
     except Exception as e:
         logger.error(f"Database query failed: {e}")
         raise HTTPException(status_code=500, detail="Database query failed")
 
+    if lexical_rows:
+        rows = reciprocal_rank_fusion(rows, lexical_rows, limit=3)
+    return query_vector, [r for r in rows if r['similarity'] is not None and r['similarity'] < 1.4]
 
-    relevant_results = [r for r in rows if r['similarity'] is not None and r['similarity'] < 1.4]
-
-    if request.mode == "simple":
-        if not relevant_results:
-            return [{
-                "title": "No learnings found",
-                "details": ["Try logging some learnings to see results here."],
-                "code_snippet": ""
-            }]
-
-        formatted_results = []
-        for r in relevant_results:
-            result = {
-                "title": r['description'],
-                "details": [],
-                "code_snippet": r['code_snippet']
-            }
-            if r['function_name']:
-                result["details"].append(f" Function: {r['function_name']}")
-            if r['library_name']:
-                result["details"].append(f"Library: {r['library_name']}")
-            result["details"].append(f"Match: {max(0, min(100, (1 - r['similarity']/2) * 100)):.0f}%")
-            formatted_results.append(result)
-
-        return formatted_results
-
-    # Powered mode
-    conversation_context = "\n".join([
-        f"{'User' if msg.is_user else 'Assistant'}: {msg.content}"
-        for msg in request.conversation_history
-    ]) or "No prior conversation available."
+#RETRIEVAL + QUOTA FOR A QUERY: the reservation overlaps the keyword search and the query embedding (429 if over the
+#limit); it is released instead of charged when retrieval fails or a cached answer can be reused
+#returns (relevant results, cached answer or None, response cache key, the reservation task or None)
+async def prepare_query(request: QueryRequest, user_id: int, timings: dict):
+    quota_task = start_quota_reservation(request, user_id, timings)
+    try:
+        query_vector, relevant_results = await retrieve_relevant_learnings(request, user_id, timings, quota_task)
+    except Exception:
+        await release_quota(quota_task, user_id)
+        raise
+
+    #answers are matched by query embedding -> nothing to match a keyword fast path answer on
+    if request.mode == "simple" or query_vector is None:
+        if request.mode == "powered":
+            #keyword fast path: no embedding was made, so the reservation wasn't settled yet
+            await settle_quota(quota_task, user_id)
+        return relevant_results, None, None, quota_task
+
+    cache_key = (query_vector, [r["id"] for r in relevant_results], history_hash(request.conversation_history))
+    cached = response_cache.lookup(user_id, *cache_key)
+    if cached is not None:
+        await release_quota(quota_task, user_id)
+        timings.pop("quota", None)
+        return relevant_results, cached, cache_key, None
+
+    return relevant_results, None, cache_key, quota_task
+
+#RESULT CARDS FOR SIMPLE MODE
+def format_simple_results(relevant_results: list[dict]) -> list[dict]:
+    if not relevant_results:
+        return [{
+            "title": "No learnings found",
+            "details": ["Try logging some learnings to see results here."],
+            "code_snippet": ""
+        }]
+
+    formatted_results = []
+    for r in relevant_results:
+        result = {
+            "title": r['description'],
+            "details": [],
+            "code_snippet": r['code_snippet']
+        }
+        if r['function_name']:
+            result["details"].append(f" Function: {r['function_name']}")
+        if r['library_name']:
+            result["details"].append(f"Library: {r['library_name']}")
+        result["details"].append(f"Match: {max(0, min(100, (1 - r['similarity']/2) * 100)):.0f}%")
+        formatted_results.append(result)
+
+    return formatted_results
+
+#FINAL PROMPT FOR THE LLM (powered mode)
+#history / snippets are fitted to the token budget first (older turns -> rolling summary, long code cut)
+async def build_powered_prompt(request: QueryRequest, relevant_results: list[dict], user_id: int) -> str:
+    conversation_context, relevant_results, _ = await fit_prompt(
+        user_id, request.query, request.conversation_history, relevant_results
+    )
+    conversation_context = conversation_context or "No prior conversation available."
 
     learnings_context = (
         "Relevant code learnings that might help answer the question:\n" +
@@ -185,11 +226,9 @@ async def query_rag(request: QueryRequest, current_user_id: int = Depends(get_cu
 
 
     if not relevant_results and not request.conversation_history:
-        logger.info(f"User {current_user_id} submitted query with no learnings and no conversation. Proceeding with general LLM response.")
+        logger.info(f"User {user_id} submitted query with no learnings and no conversation. Proceeding with general LLM response.")
 
-    #FINAL PROMPT FOR THE LLM
-    try:
-        final_prompt = f"""You are a coding assistant focused on helping users understand and work with their code. You have access to their previous conversations and some of their code learnings.
+    return f"""You are a coding assistant focused on helping users understand and work with their code. You have access to their previous conversations and some of their code learnings.
 
         Previous conversation:
         {conversation_context}
@@ -210,10 +249,119 @@ async def query_rag(request: QueryRequest, current_user_id: int = Depends(get_cu
 
         Answer:"""
 
-        response = await call_gpt4_llm(final_prompt)
-        print(response)
+#CURRENT MONTH'S POWERED QUERY USAGE (cheap: one indexed lookup, no table scan)
+@router.get("/usage")
+async def get_usage(current_user_id: int = Depends(get_current_user_id)):
+    return await get_current_usage(current_user_id)
+
+#RAG QUERY ENDPOINT
+@router.post("/rag/query")
+async def query_rag(request: QueryRequest, current_user_id: int = Depends(get_current_user_id)):
+    started = time.perf_counter()
+    timings = {}
+
+    #QUERY CANNOT BE EMPTY
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    relevant_results, cached, cache_key, quota_task = await prepare_query(request, current_user_id, timings)
+
+    if request.mode == "simple":
+        log_timings(current_user_id, request.mode, timings, started)
+        return format_simple_results(relevant_results)
+
+    #same question (or a paraphrase) over the same learnings + conversation -> reuse the answer, free
+    if cached is not None:
+        log_timings(current_user_id, "powered-cached", timings, started)
+        return {"response": cached, "cached": True}
+
+    # Powered mode
+    try:
+        final_prompt = await timed(timings, "prompt", build_powered_prompt(request, relevant_results, current_user_id))
+        response = await timed(timings, "llm", call_gpt4_llm(final_prompt))
+        if cache_key is not None:
+            response_cache.store(current_user_id, *cache_key, response)
+        log_timings(current_user_id, request.mode, timings, started)
         return {"response": response}
     except Exception as e:
         logger.error("LLM call failed:")
         logger.error(f"Error: {e}")
+        #refunds only a reservation that was actually taken
+        await release_quota(quota_task, current_user_id)
         raise HTTPException(status_code=500, detail="Failed to generate a response.")
+
+#ONE SERVER-SENT EVENT
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+#STREAMING RAG QUERY ENDPOINT (server-sent events)
+#events: "learnings" (retrieved results, sent as soon as retrieval finishes), then in powered mode
+#one "delta" per chunk of the answer, then "done" -- or "error" if the llm fails mid-stream
+@router.post("/rag/query/stream")
+async def query_rag_stream(
+    request: QueryRequest,
+    http_request: Request,
+    current_user_id: int = Depends(get_current_user_id)
+):
+    started = time.perf_counter()
+    timings = {}
+
+    #limit / validation / retrieval errors still come back as normal http errors
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    relevant_results, cached, cache_key, quota_task = await prepare_query(request, current_user_id, timings)
+
+    async def events():
+        yield sse_event("learnings", format_simple_results(relevant_results))
+        timings["first_event"] = round((time.perf_counter() - started) * 1000, 1)
+        if request.mode == "simple":
+            yield sse_event("done", {})
+            log_timings(current_user_id, request.mode, timings, started)
+            return
+        if cached is not None:
+            yield sse_event("delta", {"content": cached, "cached": True})
+            yield sse_event("done", {})
+            log_timings(current_user_id, "powered-cached", timings, started)
+            return
+
+        chunks = None
+        answer = []
+        try:
+            #inside the try: a failing prompt build refunds the reservation and ends with an "error" event too
+            final_prompt = await timed(timings, "prompt", build_powered_prompt(request, relevant_results, current_user_id))
+            #closing the generator (client went away -> starlette cancels the response) closes the
+            #upstream openAI stream too, so we stop paying for tokens nobody reads
+            chunks = stream_gpt4_llm(final_prompt)
+            llm_started = time.perf_counter()
+            async for delta in chunks:
+                if await http_request.is_disconnected():
+                    logger.info(f"Client disconnected, cancelling LLM stream for user {current_user_id}")
+                    return
+                if "llm_first_token" not in timings:
+                    timings["llm_first_token"] = round((time.perf_counter() - llm_started) * 1000, 1)
+                answer.append(delta)
+                yield sse_event("delta", {"content": delta})
+            yield sse_event("done", {})
+            if cache_key is not None:
+                response_cache.store(current_user_id, *cache_key, "".join(answer))
+            timings["llm"] = round((time.perf_counter() - llm_started) * 1000, 1)
+            log_timings(current_user_id, request.mode, timings, started)
+        except Exception as e:
+            logger.error("Powered stream failed:")
+            logger.error(f"Error: {e}")
+            await release_quota(quota_task, current_user_id)
+            yield sse_event("error", {"detail": "Failed to generate a response."})
+        finally:
+            if chunks is not None:
+                await chunks.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            #stop proxies from buffering the stream
+            "X-Accel-Buffering": "no"
+        }
+    )
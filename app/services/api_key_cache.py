@@ -0,0 +1,119 @@
+# app/services/api_key_cache.py
+
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+#resolved API keys are trusted for this long without asking the database. This is the revocation window: a key
+#regenerated / revoked on ANOTHER instance keeps working there for up to this many seconds (on the instance that
+#handled the change it stops right away). Kept short -> still absorbs a client's burst of calls with one lookup
+API_KEY_CACHE_TTL_SECONDS = float(os.getenv("API_KEY_CACHE_TTL_SECONDS", "5"))
+#unknown keys are rejected from memory for this long (a cli retry loop with a bad key doesn't hit the db)
+API_KEY_NEGATIVE_TTL_SECONDS = float(os.getenv("API_KEY_NEGATIVE_TTL_SECONDS", "30"))
+API_KEY_CACHE_MAX_ENTRIES = int(os.getenv("API_KEY_CACHE_MAX_ENTRIES", "10000"))
+#separate (smaller) bound for bad keys, so random keys can't push the good ones out
+API_KEY_NEGATIVE_MAX_ENTRIES = int(os.getenv("API_KEY_NEGATIVE_MAX_ENTRIES", "2000"))
+
+
+def token_digest(token: str) -> bytes:
+    #api_keys stores sha256(token) only -> a leaked table (or this cache) doesn't leak usable keys
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+class ApiKeyEntry:
+    def __init__(self, user_id: int, project_id: int, expires_at: float):
+        self.user_id = user_id
+        self.project_id = project_id
+        self.expires_at = expires_at
+
+
+class ApiKeyCache:
+    #token digest -> (user_id, project_id) with a TTL, plus a short-lived set of digests known to be invalid
+    def __init__(
+        self,
+        ttl: float = API_KEY_CACHE_TTL_SECONDS,
+        negative_ttl: float = API_KEY_NEGATIVE_TTL_SECONDS,
+        max_entries: int = API_KEY_CACHE_MAX_ENTRIES,
+        negative_max_entries: int = API_KEY_NEGATIVE_MAX_ENTRIES
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.negative_max_entries = negative_max_entries
+        self.enabled = ttl > 0
+        self._entries: OrderedDict[bytes, ApiKeyEntry] = OrderedDict()
+        self._invalid: OrderedDict[bytes, float] = OrderedDict() #digest -> expires_at
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, digest: bytes) -> Optional[ApiKeyEntry]:
+        entry = self._entries.get(digest)
+        if entry is not None:
+            if entry.expires_at > time.monotonic():
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry
+            del self._entries[digest]
+        self.misses += 1
+        return None
+
+    def is_invalid(self, digest: bytes) -> bool:
+        expires_at = self._invalid.get(digest)
+        if expires_at is None:
+            return False
+        if expires_at > time.monotonic():
+            self.negative_hits += 1
+            return True
+        del self._invalid[digest]
+        return False
+
+    def put(self, digest: bytes, user_id: int, project_id: int):
+        if not self.enabled:
+            return
+        self._invalid.pop(digest, None)
+        self._entries[digest] = ApiKeyEntry(user_id, project_id, time.monotonic() + self.ttl)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put_invalid(self, digest: bytes):
+        if not self.enabled or self.negative_ttl <= 0:
+            return
+        self._invalid[digest] = time.monotonic() + self.negative_ttl
+        self._invalid.move_to_end(digest)
+        while len(self._invalid) > self.negative_max_entries:
+            self._invalid.popitem(last=False)
+
+    def invalidate_project(self, user_id: int, project_id: int):
+        #the project's key was rotated / deleted -> the old key must stop working now
+        stale = [d for d, e in self._entries.items() if e.user_id == user_id and e.project_id == project_id]
+        for digest in stale:
+            del self._entries[digest]
+        self.invalidations += len(stale)
+
+    def clear(self):
+        self._entries.clear()
+        self._invalid.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "invalid_entries": len(self._invalid),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0
+        }
+
+
+api_key_cache = ApiKeyCache()
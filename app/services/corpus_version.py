@@ -0,0 +1,64 @@
+# app/services/corpus_version.py
+
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.db import database
+from app.models.corpus_versions import corpus_versions
+
+#the extension polls the same read endpoints over and over -> a client that sends back the ETag it got gets a 304
+#after one primary key lookup instead of the full query, as long as the user's corpus version hasn't moved.
+#bump the revision when the JSON of these endpoints changes shape, so old ETags stop matching
+ETAG_REVISION = "1"
+
+
+async def bump_corpus_version(user_id: int) -> int:
+    #call INSIDE the transaction that changes the user's learnings / favorites: the new version commits with them
+    query = (
+        pg_insert(corpus_versions)
+        .values(user_id=user_id, version=1)
+        .on_conflict_do_update(
+            index_elements=[corpus_versions.c.user_id],
+            set_={"version": corpus_versions.c.version + 1, "updated_at": text("(now() AT TIME ZONE 'utc')")}
+        )
+        .returning(corpus_versions.c.version)
+    )
+    row = await database.fetch_one(query)
+    return row["version"]
+
+
+async def get_corpus_version(user_id: int) -> int:
+    row = await database.fetch_one(select(corpus_versions.c.version).where(corpus_versions.c.user_id == user_id))
+    return row["version"] if row else 0
+
+
+def corpus_etag(user_id: int, version: int, request: Request) -> str:
+    #strong ETag: same user + version + URL (path, paging, fields) -> byte-identical body
+    variant = hashlib.sha256(f"{ETAG_REVISION}:{request.url.path}?{request.url.query}".encode("utf-8")).hexdigest()[:16]
+    return f'"{user_id}.{version}.{variant}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    #If-None-Match uses the weak comparison -> a W/ prefix added by a proxy still matches
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+
+async def not_modified(request: Request, response: Response, user_id: int) -> Optional[Response]:
+    #call before running the endpoint's query: sets the ETag on `response` and returns a 304 to send right away
+    #if the client's copy is current. The version is read first, so a body is never older than its ETag
+    version = await get_corpus_version(user_id)
+    headers = {
+        "ETag": corpus_etag(user_id, version, request),
+        #may be cached, but must be revalidated every time
+        "Cache-Control": "private, no-cache"
+    }
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -1,17 +1,93 @@
 #open AIs async client for API calls
 from openai import AsyncOpenAI
 import os
+import asyncio
+import numpy as np
 from dotenv import load_dotenv
+from app.services.embedding_cache import embedding_cache
+from app.models.vector import EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, NATIVE_DIMENSIONS
 
 load_dotenv()
 
 #client for the openAI API
 client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-#embeds the text into a vector (used when creating a new learning)
-async def embed(text: str) -> list[float]:
+#model + stored dimensions are configured in app/models/vector.py
+#EMBEDDING_KEY names the vectors we produce (cache key, reembed checkpoints): model, plus the dimensions if reduced
+EMBEDDING_KEY = EMBEDDING_MODEL if EMBEDDING_DIMENSIONS == NATIVE_DIMENSIONS.get(EMBEDDING_MODEL) else f"{EMBEDDING_MODEL}:{EMBEDDING_DIMENSIONS}"
+#inputs per embeddings API call (API max is 2048) and max API calls in flight for embed_many
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+#only sent when reduced (older models don't accept the parameter)
+def dimensions_args() -> dict:
+    if EMBEDDING_DIMENSIONS == NATIVE_DIMENSIONS.get(EMBEDDING_MODEL):
+        return {}
+    return {"dimensions": EMBEDDING_DIMENSIONS}
+
+#text that gets embedded for a learning: both description and code
+def learning_text(description: str, code_snippet: str) -> str:
+    return f"{description}\n\n{code_snippet}"
+
+#embeds the text into a float32 vector (used for rag queries)
+#repeat texts are served from the embedding cache instead of calling openAI again
+async def embed(text: str) -> np.ndarray:
+    cached = await embedding_cache.get(EMBEDDING_KEY, text)
+    if cached is not None:
+        return cached
+
     response = await client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
+        model=EMBEDDING_MODEL,
+        input=text,
+        **dimensions_args()
     )
-    return response.data[0].embedding
\ No newline at end of file
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    await embedding_cache.put(EMBEDDING_KEY, text, vector)
+    return vector
+
+
+#embeds many texts with multi-input API calls (used by the embedding worker and app.reembed)
+#cached texts are skipped, the rest go out in batches of batch_size with at most concurrency calls in flight.
+#with return_exceptions=True a failed batch puts its exception in place of each of its vectors (like asyncio.gather)
+#rate_limiter (optional): awaited before every API call; use_cache=False -> always call openAI, store nothing
+async def embed_many(
+    texts: list[str],
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    return_exceptions: bool = False,
+    rate_limiter=None,
+    use_cache: bool = True
+) -> list:
+    results = await embedding_cache.get_many(EMBEDDING_KEY, texts) if use_cache else [None] * len(texts)
+    pending = [i for i, vector in enumerate(results) if vector is None]
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_batch(batch: list[int]):
+        batch_texts = [texts[i] for i in batch]
+        async with semaphore:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            response = await client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=batch_texts,
+                **dimensions_args()
+            )
+        #response items carry the index of the input they belong to
+        vectors = [
+            np.asarray(item.embedding, dtype=np.float32)
+            for item in sorted(response.data, key=lambda item: item.index)
+        ]
+        if use_cache:
+            await embedding_cache.put_many(EMBEDDING_KEY, batch_texts, vectors)
+        for i, vector in zip(batch, vectors):
+            results[i] = vector
+
+    outcomes = await asyncio.gather(*(run_batch(b) for b in batches), return_exceptions=True)
+    for batch, outcome in zip(batches, outcomes):
+        if isinstance(outcome, Exception):
+            if not return_exceptions:
+                raise outcome
+            for i in batch:
+                results[i] = outcome
+    return results
@@ -0,0 +1,176 @@
+# app/services/embedding_cache.py
+
+import os
+import hashlib
+import logging
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.db import database
+from app.models.cached_embeddings import cached_embeddings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+#max number of embeddings kept in memory (1536 float32 ~ 6KB each -> 4096 entries ~ 25MB)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "4096"))
+#set to "false" to only use the in-memory tier
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "true").lower() == "true"
+
+
+def normalize_text(text: str) -> str:
+    #same text modulo unicode form / surrounding + repeated whitespace -> same key
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    #two tiers: in-process LRU (no I/O) in front of the cached_embeddings table (one indexed lookup)
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES, persist: bool = EMBEDDING_CACHE_PERSIST):
+        self.max_entries = max_entries
+        self.persist = persist
+        self._entries: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: tuple[str, str], vector: np.ndarray):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        #evict least recently used entries once over the bound
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        key = (model, text_hash(text))
+
+        vector = self._entries.get(key)
+        if vector is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return vector
+
+        if self.persist:
+            try:
+                row = await database.fetch_one(
+                    select(cached_embeddings.c.embedding).where(
+                        cached_embeddings.c.model == key[0],
+                        cached_embeddings.c.text_hash == key[1]
+                    )
+                )
+            except Exception as e:
+                #cache problems should never break embedding, just fall through to the API
+                logger.warning(f"Embedding cache lookup failed: {e}")
+                row = None
+            if row is not None:
+                #already a float32 array thanks to the binary vector codec
+                vector = row["embedding"]
+                self._remember(key, vector)
+                self.db_hits += 1
+                return vector
+
+        self.misses += 1
+        return None
+
+    async def get_many(self, model: str, texts: list[str]) -> list[Optional[np.ndarray]]:
+        #batch version of get(): one IN (...) lookup for everything not already in memory
+        keys = [(model, text_hash(t)) for t in texts]
+        in_memory = {}
+        for key in keys:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                in_memory[key] = vector
+
+        from_db = {}
+        missing = {key[1] for key in keys if key not in in_memory}
+        if missing and self.persist:
+            try:
+                rows = await database.fetch_all(
+                    select(cached_embeddings.c.text_hash, cached_embeddings.c.embedding).where(
+                        cached_embeddings.c.model == model,
+                        cached_embeddings.c.text_hash.in_(missing)
+                    )
+                )
+            except Exception as e:
+                logger.warning(f"Embedding cache lookup failed: {e}")
+                rows = []
+            for row in rows:
+                key = (model, row["text_hash"])
+                from_db[key] = row["embedding"]
+                self._remember(key, from_db[key])
+
+        results = []
+        for key in keys:
+            if key in in_memory:
+                self.memory_hits += 1
+                results.append(in_memory[key])
+            elif key in from_db:
+                self.db_hits += 1
+                results.append(from_db[key])
+            else:
+                self.misses += 1
+                results.append(None)
+        return results
+
+    async def put(self, model: str, text: str, vector: np.ndarray):
+        key = (model, text_hash(text))
+        self._remember(key, vector)
+
+        if self.persist:
+            try:
+                await database.execute(
+                    pg_insert(cached_embeddings).values(
+                        model=key[0],
+                        text_hash=key[1],
+                        embedding=vector
+                    ).on_conflict_do_nothing(index_elements=["model", "text_hash"])
+                )
+            except Exception as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+
+    async def put_many(self, model: str, texts: list[str], vectors: list[np.ndarray]):
+        rows = {}
+        for t, vector in zip(texts, vectors):
+            key = (model, text_hash(t))
+            self._remember(key, vector)
+            rows[key[1]] = {"model": model, "text_hash": key[1], "embedding": vector}
+
+        if self.persist and rows:
+            try:
+                await database.execute(
+                    pg_insert(cached_embeddings).values(list(rows.values()))
+                    .on_conflict_do_nothing(index_elements=["model", "text_hash"])
+                )
+            except Exception as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else 0.0
+        }
+
+
+#shared cache used by app.services.embedder
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,214 @@
+# app/services/embedding_queue.py
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, delete
+from app.db import database
+from app.models.embedding_jobs import embedding_jobs
+from app.services.embedder import embed_many, learning_text
+from app.services import learning_events
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+#how many jobs are claimed (and embedded with one multi-input call) at a time
+EMBEDDING_WORKER_BATCH_SIZE = int(os.getenv("EMBEDDING_WORKER_BATCH_SIZE", "64"))
+#how long the worker sleeps when the queue is empty (enqueue in this process wakes it early)
+EMBEDDING_WORKER_POLL_SECONDS = float(os.getenv("EMBEDDING_WORKER_POLL_SECONDS", "5"))
+#retry with exponential backoff: base * 2^attempts seconds, capped, until max attempts (then the job is dead)
+EMBEDDING_JOB_MAX_ATTEMPTS = int(os.getenv("EMBEDDING_JOB_MAX_ATTEMPTS", "8"))
+EMBEDDING_JOB_BACKOFF_SECONDS = float(os.getenv("EMBEDDING_JOB_BACKOFF_SECONDS", "5"))
+EMBEDDING_JOB_MAX_BACKOFF_SECONDS = float(os.getenv("EMBEDDING_JOB_MAX_BACKOFF_SECONDS", "900"))
+EMBEDDING_WORKER_ENABLED = os.getenv("EMBEDDING_WORKER_ENABLED", "true").lower() == "true"
+
+#how long a claimed job is left alone before another worker may take it over (the worker crashed / hung mid-batch)
+EMBEDDING_JOB_LEASE_SECONDS = float(os.getenv("EMBEDDING_JOB_LEASE_SECONDS", "300"))
+
+#claims a batch in ONE short statement (commits right away, no lock is held while openAI is called):
+#SKIP LOCKED -> several workers (or app instances) can pull from the queue without blocking each other,
+#next_attempt_at = lease end -> nobody else picks the jobs up while they are being embedded,
+#attempts + 1 up front -> a job that keeps killing the worker still runs out of attempts
+CLAIM_JOBS_SQL = """
+WITH claimed AS (
+    SELECT id
+    FROM embedding_jobs
+    WHERE attempts < :max_attempts AND next_attempt_at <= :now
+    ORDER BY id
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE embedding_jobs j
+SET attempts = j.attempts + 1, next_attempt_at = :lease_until
+FROM claimed, learnings l
+WHERE j.id = claimed.id AND l.id = j.learning_id
+RETURNING j.id AS job_id, j.learning_id, j.attempts,
+          l.user_id, l.description, l.code_snippet, l.function_name, l.library_name
+"""
+
+
+#write back, sent with asyncpg executemany (all rows pipelined in one round trip, also used by app.reembed)
+UPDATE_EMBEDDING_SQL = "UPDATE learnings SET embedding = $2 WHERE id = $1"
+RETRY_JOB_SQL = "UPDATE embedding_jobs SET next_attempt_at = $2, last_error = $3 WHERE id = $1"
+
+
+#adds a job per learning -> call inside the same transaction as the learning insert
+async def enqueue_embedding_jobs(learning_ids: list[int]):
+    if not learning_ids:
+        return
+    await database.execute(
+        embedding_jobs.insert().values([{"learning_id": learning_id} for learning_id in learning_ids])
+    )
+
+
+def backoff_seconds(attempts: int) -> float:
+    return min(EMBEDDING_JOB_BACKOFF_SECONDS * (2 ** attempts), EMBEDDING_JOB_MAX_BACKOFF_SECONDS)
+
+
+class EmbeddingWorker:
+    #background task inside the app that backfills learnings.embedding from the queue
+    def __init__(self):
+        self._task = None
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self.pending = 0
+        self.dead = 0
+        self.embedded_total = 0
+        self.failed_attempts_total = 0
+        self.batches_total = 0
+        self.last_batch_seconds = None
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=10)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+
+    def notify(self):
+        #new jobs were committed -> don't wait for the next poll
+        self._wake.set()
+
+    async def run(self):
+        logger.info("Embedding worker started")
+        while not self._stopping:
+            try:
+                claimed = await self.process_batch()
+            except Exception as e:
+                logger.error(f"Embedding worker batch failed: {e}")
+                claimed = 0
+
+            if claimed:
+                continue
+            #queue drained (or everything is backing off) -> refresh metrics and sleep
+            try:
+                await self.refresh_depth()
+            except Exception as e:
+                logger.warning(f"Could not read embedding queue depth: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=EMBEDDING_WORKER_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+        logger.info("Embedding worker stopped")
+
+    async def process_batch(self) -> int:
+        #claim (short, committed) -> embed (no transaction, no pooled connection held) -> write back (short transaction)
+        now = datetime.utcnow()
+        jobs = await database.fetch_all(CLAIM_JOBS_SQL, {
+            "max_attempts": EMBEDDING_JOB_MAX_ATTEMPTS,
+            "now": now,
+            "lease_until": now + timedelta(seconds=EMBEDDING_JOB_LEASE_SECONDS),
+            "batch_size": EMBEDDING_WORKER_BATCH_SIZE
+        })
+        if not jobs:
+            return 0
+
+        start = time.perf_counter()
+        vectors = await embed_many(
+            [learning_text(job["description"], job["code_snippet"]) for job in jobs],
+            return_exceptions=True
+        )
+
+        done = []
+        embedded = []
+        retries = []
+        for job, vector in zip(jobs, vectors):
+            if isinstance(vector, Exception):
+                self.failed_attempts_total += 1
+                #attempts was already counted when the job was claimed
+                retries.append((
+                    job["job_id"],
+                    datetime.utcnow() + timedelta(seconds=backoff_seconds(job["attempts"] - 1)),
+                    str(vector)[:1000]
+                ))
+                continue
+            done.append(job["job_id"])
+            embedded.append({
+                "id": job["learning_id"],
+                "user_id": job["user_id"],
+                "embedding": vector,
+                "description": job["description"],
+                "code_snippet": job["code_snippet"],
+                "function_name": job["function_name"],
+                "library_name": job["library_name"]
+            })
+
+        #the whole batch in a few round trips, whatever its size
+        async with database.transaction():
+            async with database.connection() as connection:
+                if embedded:
+                    await connection.raw_connection.executemany(
+                        UPDATE_EMBEDDING_SQL, [(row["id"], row["embedding"]) for row in embedded]
+                    )
+                if retries:
+                    await connection.raw_connection.executemany(RETRY_JOB_SQL, retries)
+            if done:
+                await database.execute(delete(embedding_jobs).where(embedding_jobs.c.id.in_(done)))
+
+        #committed -> the learnings are searchable now
+        learning_events.learnings_embedded(embedded)
+        self.embedded_total += len(done)
+        self.batches_total += 1
+        self.last_batch_seconds = round(time.perf_counter() - start, 3)
+        if len(done) < len(jobs):
+            logger.warning(f"Embedding worker: {len(jobs) - len(done)} of {len(jobs)} jobs failed, retrying with backoff")
+        return len(jobs)
+
+    async def refresh_depth(self):
+        row = await database.fetch_one(
+            select(
+                func.count().filter(embedding_jobs.c.attempts < EMBEDDING_JOB_MAX_ATTEMPTS).label("pending"),
+                func.count().filter(embedding_jobs.c.attempts >= EMBEDDING_JOB_MAX_ATTEMPTS).label("dead")
+            ).select_from(embedding_jobs)
+        )
+        self.pending = row["pending"]
+        self.dead = row["dead"]
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "pending": self.pending,
+            "dead": self.dead,
+            "embedded_total": self.embedded_total,
+            "failed_attempts_total": self.failed_attempts_total,
+            "batches_total": self.batches_total,
+            "last_batch_seconds": self.last_batch_seconds
+        }
+
+
+#started / stopped with the app in app/main.py
+embedding_worker = EmbeddingWorker()
@@ -0,0 +1,86 @@
+# app/services/facets.py
+
+from collections import Counter
+from sqlalchemy import select, update, delete, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.db import database
+from app.models.learning_facets import learning_facets
+
+#facet kind -> learnings column it counts
+FACET_COLUMNS = {"library": "library_name", "function": "function_name"}
+
+UTC_NOW = text("(now() AT TIME ZONE 'utc')")
+
+#recounts every facet from learnings. Writers are locked out while it runs (it only takes a GROUP BY) so a
+#learning added meanwhile is either counted here or added after, never lost or counted twice
+REBUILD_FACETS_SQL = [
+    "LOCK TABLE learning_facets IN SHARE ROW EXCLUSIVE MODE;",
+    "UPDATE learning_facets SET count = 0;",
+    """
+    INSERT INTO learning_facets (user_id, kind, name, count)
+    SELECT user_id, 'library', library_name, count(*) FROM learnings WHERE library_name IS NOT NULL GROUP BY user_id, library_name
+    UNION ALL
+    SELECT user_id, 'function', function_name, count(*) FROM learnings WHERE function_name IS NOT NULL GROUP BY user_id, function_name
+    ON CONFLICT (user_id, kind, name) DO UPDATE SET count = EXCLUDED.count;
+    """,
+    "DELETE FROM learning_facets WHERE count <= 0;",
+]
+
+
+def facet_counts(rows) -> Counter:
+    #learnings (anything with library_name / function_name) -> {(kind, name): how many}
+    counts = Counter()
+    for row in rows:
+        for kind, column in FACET_COLUMNS.items():
+            if row[column] is not None:
+                counts[(kind, row[column])] += 1
+    return counts
+
+
+async def add_facets(user_id: int, rows):
+    #call INSIDE the transaction that inserts the learnings
+    counts = facet_counts(rows)
+    if not counts:
+        return
+    #sorted -> concurrent writers lock the same facet rows in the same order (no deadlocks)
+    query = pg_insert(learning_facets).values([
+        {"user_id": user_id, "kind": kind, "name": name, "count": count}
+        for (kind, name), count in sorted(counts.items())
+    ])
+    query = query.on_conflict_do_update(
+        index_elements=[learning_facets.c.user_id, learning_facets.c.kind, learning_facets.c.name],
+        set_={"count": learning_facets.c.count + query.excluded.count, "last_used": UTC_NOW}
+    )
+    await database.execute(query)
+
+
+async def remove_facets(user_id: int, rows):
+    #call INSIDE the transaction that deletes the learnings (rows = the deleted learnings' library / function names)
+    counts = facet_counts(rows)
+    if not counts:
+        return
+    for (kind, name), count in sorted(counts.items()):
+        await database.execute(
+            update(learning_facets)
+            .where(learning_facets.c.user_id == user_id, learning_facets.c.kind == kind, learning_facets.c.name == name)
+            .values(count=learning_facets.c.count - count)
+        )
+    await database.execute(
+        delete(learning_facets).where(learning_facets.c.user_id == user_id, learning_facets.c.count <= 0)
+    )
+
+
+async def list_facets(user_id: int, kind: str) -> list:
+    #index-only scan of idx_learning_facets_user
+    query = (
+        select(learning_facets.c.name, learning_facets.c.count, learning_facets.c.last_used)
+        .where(learning_facets.c.user_id == user_id, learning_facets.c.kind == kind)
+        .order_by(learning_facets.c.name)
+    )
+    return await database.fetch_all(query)
+
+
+def rebuild_facets(conn):
+    #sync (migrations / python -m app.migrate --rebuild-facets)
+    for statement in REBUILD_FACETS_SQL:
+        conn.execute(text(statement))
@@ -0,0 +1,20 @@
+# app/services/learning_events.py
+
+#in-process state built from a user's learnings (in-memory vector index, ...) is kept fresh from here,
+#so write paths only have to report what changed
+from app.services.vector_index import vector_index
+from app.services.response_cache import response_cache
+
+
+#learnings got their embedding (embedding worker) -> rows carry id, user_id, embedding + metadata
+def learnings_embedded(rows: list[dict]):
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row["user_id"], []).append(row)
+    for user_id, user_rows in by_user.items():
+        vector_index.add(user_id, user_rows)
+
+
+def learnings_deleted(user_id: int, learning_ids: list[int]):
+    vector_index.remove(user_id, learning_ids)
+    response_cache.invalidate_learnings(user_id, learning_ids)
@@ -0,0 +1,204 @@
+# app/services/learning_pages.py
+
+import os
+import json
+import zlib
+import logging
+from typing import Optional
+from fastapi import HTTPException, Response
+from sqlalchemy import select, func, join, literal_column, Text
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from app.db import database
+from app.models.learnings import learnings
+from app.models.project import projects
+from app.services.queries import LEARNING_FIELDS
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+#page size when a client pages (sends ?cursor= without ?limit=); no limit and no cursor -> the whole list, as before
+#paging existed. Pages are keyset pages on id
+LEARNINGS_PAGE_SIZE = int(os.getenv("LEARNINGS_PAGE_SIZE", "500"))
+LEARNINGS_PAGE_MAX = int(os.getenv("LEARNINGS_PAGE_MAX", "1000"))
+#summary=true cuts code_snippet to this many characters (in SQL, so full snippets never leave postgres)
+SUMMARY_SNIPPET_CHARS = int(os.getenv("SUMMARY_SNIPPET_CHARS", "200"))
+
+#export: ndjson lines are sent in chunks of about this many bytes (the first row goes out on its own)
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", "65536"))
+
+#response header with the cursor for the next page, missing on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def parse_fields(fields: Optional[str], default: tuple) -> list[str]:
+    #fields=description,library_name -> ["id", "description", "library_name"] (id is always returned, it is the cursor)
+    if not fields:
+        return list(default)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in LEARNING_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)} (allowed: {', '.join(LEARNING_FIELDS)})")
+    return ["id"] + [field for field in dict.fromkeys(requested) if field != "id"]
+
+
+def learning_columns(fields: list[str], summary: bool) -> list:
+    columns = []
+    for field in fields:
+        if field == "code_snippet" and summary:
+            columns.append(func.left(learnings.c.code_snippet, SUMMARY_SNIPPET_CHARS).label("code_snippet"))
+            columns.append((func.length(learnings.c.code_snippet) > SUMMARY_SNIPPET_CHARS).label("code_snippet_truncated"))
+        else:
+            columns.append(learnings.c[field])
+    return columns
+
+
+async def fetch_learning_page(
+    response: Response,
+    conditions: list,
+    fields: list[str],
+    summary: bool = False,
+    limit: Optional[int] = None,
+    cursor: Optional[int] = None
+) -> list[dict]:
+    #one page of learnings matching conditions, ordered by id, starting after `cursor` (the last id of the previous page)
+    #-> the next cursor goes in the X-Next-Cursor header, so the body stays a plain list.
+    #neither limit nor cursor -> every matching learning (clients written before paging expect the full list)
+    columns = learning_columns(fields, summary)
+    keys = [column.key for column in columns]
+    query = select(*columns).where(*conditions)
+    if limit is None and cursor is None:
+        rows = await database.fetch_all(query.order_by(learnings.c.id))
+        return [{key: row[key] for key in keys} for row in rows]
+
+    limit = min(limit or LEARNINGS_PAGE_SIZE, LEARNINGS_PAGE_MAX)
+    if cursor is not None:
+        query = query.where(learnings.c.id > cursor)
+    #one extra row tells us whether there is a next page
+    query = query.order_by(learnings.c.id).limit(limit + 1)
+    rows = await database.fetch_all(query)
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = str(rows[-1]["id"])
+    return [{key: row[key] for key in keys} for row in rows]
+
+
+async def first_row(query):
+    #starts a server side cursor (database.iterate) and reads its first row -> (first row or None, the rest)
+    rows = database.iterate(query)
+    try:
+        return await rows.__anext__(), rows
+    except StopAsyncIteration:
+        return None, rows
+
+
+async def open_learnings_export(conditions: list, fields: list[str], summary: bool = False, cursor: Optional[int] = None, compress: bool = False):
+    #-> the body of an export. Like open_json_groups: the first row is read before the 200 goes out, so a failing
+    #query is a 500 rather than an empty "successful" export
+    columns = learning_columns(fields, summary)
+    keys = [column.key for column in columns]
+    query = select(*columns).where(*conditions)
+    if cursor is not None:
+        query = query.where(learnings.c.id > cursor)
+    first, rows = await first_row(query.order_by(learnings.c.id))
+    return export_learnings_ndjson(first, rows, keys, compress)
+
+
+async def export_learnings_ndjson(first, rows, keys: list[str], compress: bool = False):
+    #yields every matching learning as one JSON line, ordered by id, read through a server side cursor
+    #(database.iterate) -> memory stays flat however many learnings the user has
+    #compress=True -> one gzip stream, flushed at every chunk so the client can decode as it arrives
+
+    #wbits=31 -> gzip header + trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = []
+    size = 0
+    exported = 0
+    try:
+        if first is not None:
+            #the first row goes out on its own
+            line = json.dumps({key: first[key] for key in keys}, separators=(",", ":")) + "\n"
+            exported = 1
+            data = line.encode("utf-8")
+            yield compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else data
+            async for row in rows:
+                line = json.dumps({key: row[key] for key in keys}, separators=(",", ":")) + "\n"
+                buffer.append(line)
+                size += len(line)
+                exported += 1
+                if size >= EXPORT_CHUNK_BYTES:
+                    data = "".join(buffer).encode("utf-8")
+                    buffer, size = [], 0
+                    yield compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else data
+    except Exception:
+        #headers (200) are already sent -> all we can do is end the stream early, the client sees a short export
+        logger.exception(f"Learning export failed after {exported} rows")
+        raise
+    finally:
+        await rows.aclose()
+
+    data = "".join(buffer).encode("utf-8")
+    if compressor:
+        yield compressor.compress(data) + compressor.flush()
+    elif data:
+        yield data
+    logger.info(f"Exported {exported} learnings")
+
+
+#grouped endpoints: group name -> the column learnings are grouped by
+GROUP_KEYS = {
+    "library": ("library_name", learnings.c.library_name),
+    "function": ("function_name", learnings.c.function_name),
+    "project": ("project_name", projects.c.name),
+}
+
+
+def grouped_learnings_query(conditions: list, by: str, fields: list[str], summary: bool = False, with_count: bool = True):
+    #one row per group, built by postgres as JSON text: {"<key>": ..., "count": n, "learnings": [{...}, ...]}
+    #groups ordered by key, learnings by id -> python never materializes a learning
+    label, key = GROUP_KEYS[by]
+    pairs = []
+    for column in learning_columns(fields, summary):
+        #field names come from LEARNING_FIELDS, never from the client
+        pairs += [literal_column(f"'{column.key}'"), column]
+    learning_json = func.json_build_object(*pairs)
+    group = [literal_column(f"'{label}'"), key]
+    if with_count:
+        group += [literal_column("'count'"), func.count()]
+    group += [literal_column("'learnings'"), func.json_agg(aggregate_order_by(learning_json, learnings.c.id))]
+    source = join(learnings, projects, learnings.c.project_id == projects.c.id) if by == "project" else learnings
+    return (
+        select(func.json_build_object(*group).cast(Text))
+        .select_from(source)
+        .where(*conditions)
+        .group_by(key)
+        .order_by(key)
+    )
+
+
+async def open_json_groups(query):
+    #-> the body of a grouped response. The first group is read before the response starts, so a failing query
+    #(where nearly every error happens) raises here and the client gets a plain 500 instead of a 200 with cut off JSON
+    first, rows = await first_row(query)
+    return stream_json_groups(first, rows)
+
+
+async def stream_json_groups(first, rows):
+    #JSON array of the groups, sent one group at a time as postgres produces them (database.iterate)
+    yield b"["
+    groups = 0
+    try:
+        if first is not None:
+            yield first[0].encode("utf-8")
+            groups = 1
+            async for row in rows:
+                yield b"," + row[0].encode("utf-8")
+                groups += 1
+    except Exception:
+        #the 200 is already sent -> the body ends without its "]": invalid JSON the client can't take for a full answer
+        logger.exception(f"Grouped learnings failed after {groups} groups")
+        raise
+    finally:
+        await rows.aclose()
+    yield b"]"
@@ -27,4 +27,45 @@ async def call_gpt4_llm(prompt: str) -> str:
         return response.choices[0].message.content
     except Exception as e:
         print(f"Error from OpenAI: {e}")
-        raise
\ No newline at end of file
+        raise
+
+#streaming version: yields the answer chunk by chunk as the completion is generated
+#(used by /rag/query/stream). Closing the generator closes the upstream http stream.
+async def stream_gpt4_llm(prompt: str):
+    stream = await client.chat.completions.create(
+        model="gpt-4.1",
+        messages=[
+            {"role": "system", "content": "You are a helpful coding assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+        max_tokens=1024,
+        stream=True,
+    )
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.close()
+
+#short summary of older conversation turns (prompt budget compaction), cheap model. Runs within a powered query
+#(not counted against the quota on its own, at most once per new chunk of history: summaries are cached per prefix)
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-4.1-mini")
+
+async def summarize_conversation(previous_summary: str, transcript: str, max_tokens: int) -> str:
+    earlier = f"Summary so far:\n{previous_summary}\n\n" if previous_summary else ""
+    response = await client.chat.completions.create(
+        model=HISTORY_SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": "You summarize conversations between a user and a coding assistant."},
+            {"role": "user", "content": (
+                f"{earlier}New messages:\n{transcript}\n\n"
+                "Update the summary to cover everything above. Keep the user's goals, decisions, "
+                "names of files / functions / libraries and any unresolved questions. Be brief."
+            )}
+        ],
+        temperature=0.2,
+        max_tokens=max_tokens,
+    )
+    return response.choices[0].message.content or ""
@@ -0,0 +1,142 @@
+# app/services/passwords.py
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from passlib.hash import bcrypt
+from sqlalchemy import update
+from dotenv import load_dotenv
+from app.db import database
+from app.models.users import users
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+#bcrypt cost (log2 of the key expansion rounds): every +1 doubles the time of a hash AND of a login.
+#changing it re-hashes each user's password the next time they log in
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+#threads running bcrypt (it releases the GIL, so these run next to the event loop instead of blocking it).
+#kept below the core count so a login burst can't take every core from the requests already in flight.
+#0 = hash on the event loop (the old behaviour, only for comparing in app.benchmarks.login_burst)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+#hashes allowed to wait for a thread; beyond that signup / login answer 503 right away instead of queueing for seconds
+PASSWORD_HASH_MAX_WAITING = int(os.getenv("PASSWORD_HASH_MAX_WAITING", "32"))
+#queue / run time samples kept for the percentiles in stats()
+PASSWORD_HASH_SAMPLES = 1000
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def percentiles(samples) -> dict:
+    if not samples:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": round(ordered[-1], 2)}
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        rounds: int = BCRYPT_ROUNDS,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_waiting: int = PASSWORD_HASH_MAX_WAITING
+    ):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_waiting = max_waiting
+        #min / max desired rounds = rounds -> needs_update() is true for hashes made with any other cost (or an old $2a$ ident)
+        self._handler = bcrypt.using(rounds=rounds, min_desired_rounds=rounds, max_desired_rounds=rounds)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt") if workers > 0 else None
+        self.in_flight = 0
+        self.in_flight_peak = 0
+        self.hashes = 0
+        self.verifies = 0
+        self.rehashes = 0
+        self.rejected = 0
+        self._queue_ms = deque(maxlen=PASSWORD_HASH_SAMPLES)
+        self._run_ms = deque(maxlen=PASSWORD_HASH_SAMPLES)
+
+    async def _run(self, fn, *args):
+        submitted = time.perf_counter()
+        if self._executor is None:
+            result = fn(*args)
+            self._queue_ms.append(0.0)
+            self._run_ms.append((time.perf_counter() - submitted) * 1000)
+            return result
+        if self.in_flight >= self.workers + self.max_waiting:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+
+        def job():
+            started = time.perf_counter()
+            return started, fn(*args), time.perf_counter()
+
+        self.in_flight += 1
+        self.in_flight_peak = max(self.in_flight_peak, self.in_flight)
+        try:
+            started, result, finished = await asyncio.get_running_loop().run_in_executor(self._executor, job)
+        finally:
+            self.in_flight -= 1
+        self._queue_ms.append((started - submitted) * 1000)
+        self._run_ms.append((finished - started) * 1000)
+        return result
+
+    async def hash(self, password: str) -> str:
+        self.hashes += 1
+        return await self._run(self._handler.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        #verifies against the cost stored in `hashed`, whatever BCRYPT_ROUNDS is now
+        self.verifies += 1
+        return await self._run(self._handler.verify, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        #cheap: only parses the hash
+        return self._handler.needs_update(hashed)
+
+    def hash_blocking(self, password: str) -> str:
+        #for scripts (seeding, test data), never from a request handler
+        return self._handler.hash(password)
+
+    async def rehash(self, user_id: int, password: str, old_hash: str):
+        #after a successful login with an outdated hash (run as a background task, after the response).
+        #only replaces the hash the login was checked against -> a password changed meanwhile is kept
+        try:
+            new_hash = await self.hash(password)
+            await database.execute(
+                update(users).where(users.c.id == user_id, users.c.password == old_hash).values(password=new_hash)
+            )
+            self.rehashes += 1
+        except PasswordHasherBusy:
+            #busy: the next login tries again
+            pass
+        except Exception:
+            logger.exception("Rehashing password of user %s failed", user_id)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "max_waiting": self.max_waiting,
+            "in_flight": self.in_flight,
+            "in_flight_peak": self.in_flight_peak,
+            "hashes": self.hashes,
+            "verifies": self.verifies,
+            "rehashes": self.rehashes,
+            "rejected": self.rejected,
+            "queue_time": percentiles(self._queue_ms),
+            "run_time": percentiles(self._run_ms)
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,112 @@
+# app/services/project_ownership.py
+
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy import select
+from dotenv import load_dotenv
+from app.db import database
+from app.models.project import projects
+
+load_dotenv()
+
+#a user's project list is trusted for this long. Projects never change owner and there is no delete endpoint, so this
+#only bounds how long a project removed by hand (psql / user deletion) keeps passing ownership checks on this instance
+PROJECT_OWNERSHIP_TTL_SECONDS = float(os.getenv("PROJECT_OWNERSHIP_TTL_SECONDS", "300"))
+PROJECT_OWNERSHIP_MAX_USERS = int(os.getenv("PROJECT_OWNERSHIP_MAX_USERS", "5000"))
+
+PROJECT_COLUMNS = [projects.c.id, projects.c.name, projects.c.github_repo, projects.c.user_id]
+
+
+class OwnedProjects:
+    def __init__(self, rows: dict, expires_at: float):
+        self.rows = rows #project_id -> project row (dict)
+        self.expires_at = expires_at
+
+
+class ProjectOwnershipCache:
+    #user_id -> every project the user owns, loaded with ONE query (the same one /users/{id}/projects runs).
+    #(user_id, project_id) -> owned is answered from that, so the write / read paths don't each ask the database
+    def __init__(self, ttl: float = PROJECT_OWNERSHIP_TTL_SECONDS, max_users: int = PROJECT_OWNERSHIP_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.enabled = ttl > 0
+        self._users: OrderedDict[int, OwnedProjects] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.invalidations = 0
+
+    def _cached(self, user_id: int) -> Optional[OwnedProjects]:
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._users[user_id]
+            return None
+        self._users.move_to_end(user_id)
+        return entry
+
+    async def _load(self, user_id: int) -> OwnedProjects:
+        #uses index: idx_projects_user (a handful of short rows per user)
+        results = await database.fetch_all(
+            select(*PROJECT_COLUMNS).where(projects.c.user_id == user_id).order_by(projects.c.id)
+        )
+        entry = OwnedProjects({row["id"]: dict(row) for row in results}, time.monotonic() + self.ttl)
+        if self.enabled:
+            self._users[user_id] = entry
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return entry
+
+    async def list_projects(self, user_id: int) -> list:
+        entry = self._cached(user_id)
+        if entry is None:
+            self.misses += 1
+            entry = await self._load(user_id)
+        else:
+            self.hits += 1
+        return list(entry.rows.values())
+
+    async def get_project(self, user_id: int, project_id: int) -> Optional[dict]:
+        #-> the project's row if user_id owns it, else None
+        entry = self._cached(user_id)
+        if entry is not None and project_id in entry.rows:
+            self.hits += 1
+            return entry.rows[project_id]
+        if entry is None:
+            self.misses += 1
+        else:
+            #not in the cached list: may have been created on another instance since -> ask once more
+            self.refreshes += 1
+        entry = await self._load(user_id)
+        return entry.rows.get(project_id)
+
+    async def owns(self, user_id: int, project_id: int) -> bool:
+        return await self.get_project(user_id, project_id) is not None
+
+    def invalidate_user(self, user_id: int):
+        #call after creating / deleting one of the user's projects
+        if self._users.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._users.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.refreshes
+        return {
+            "enabled": self.enabled,
+            "users": len(self._users),
+            "projects": sum(len(entry.rows) for entry in self._users.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+project_ownership = ProjectOwnershipCache()
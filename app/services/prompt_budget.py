@@ -0,0 +1,204 @@
+# app/services/prompt_budget.py
+
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+from app.services.llm import summarize_conversation
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+#token budget for everything we send to the llm besides the fixed instructions
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+#conversation history never gets more than this (summary + verbatim turns)
+PROMPT_HISTORY_TOKEN_BUDGET = int(os.getenv("PROMPT_HISTORY_TOKEN_BUDGET", "2000"))
+#one code_snippet is cut past this
+PROMPT_SNIPPET_TOKEN_BUDGET = int(os.getenv("PROMPT_SNIPPET_TOKEN_BUDGET", "800"))
+#newest turns always kept verbatim (if they fit)
+PROMPT_RECENT_TURNS = int(os.getenv("PROMPT_RECENT_TURNS", "6"))
+#length of the rolling summary that replaces older turns
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))
+HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "2000"))
+#the summary is an extra (cheap model) llm call, part of the powered query that needed it: it is not metered
+#separately. false -> older turns are dropped ("(n earlier messages omitted)") instead of summarized
+HISTORY_SUMMARY_ENABLED = os.getenv("HISTORY_SUMMARY_ENABLED", "true").lower() == "true"
+
+#tiktoken is exact but may have to download its encoding file -> never loaded at import / on a request:
+#load_encoding() runs in a thread at startup, and until it succeeds tokens are estimated (~4 chars per token)
+PROMPT_TOKEN_ENCODING = os.getenv("PROMPT_TOKEN_ENCODING", "o200k_base")
+_encoding = None
+
+
+def load_encoding():
+    #(blocking) -> True if the exact tokenizer is in use
+    global _encoding
+    if _encoding is not None:
+        return True
+    try:
+        import tiktoken
+        _encoding = tiktoken.get_encoding(PROMPT_TOKEN_ENCODING)
+        return True
+    except Exception as e:
+        logger.warning(f"tiktoken encoding {PROMPT_TOKEN_ENCODING} unavailable, estimating prompt tokens: {e}")
+        return False
+
+TRUNCATION_MARKER = "\n... (truncated)"
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> tuple[str, bool]:
+    #-> (text that fits, whether it was cut); cuts at a line break when there is one close by
+    if count_tokens(text) <= max_tokens:
+        return text, False
+    keep = max(0, max_tokens - count_tokens(TRUNCATION_MARKER))
+    if _encoding is not None:
+        cut = _encoding.decode(_encoding.encode(text, disallowed_special=())[:keep])
+    else:
+        cut = text[:keep * 4]
+    newline = cut.rfind("\n")
+    if newline > len(cut) // 2:
+        cut = cut[:newline]
+    return cut + TRUNCATION_MARKER, True
+
+
+def format_turn(msg) -> str:
+    return f"{'User' if msg.is_user else 'Assistant'}: {msg.content}"
+
+
+class HistorySummaries:
+    #rolling summaries of conversation prefixes. Key = chained hash of the summarized turns, so when
+    #a conversation grows only the turns that newly fell out of the verbatim window get summarized
+    def __init__(self, max_entries: int = HISTORY_SUMMARY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.llm_calls = 0
+        self.failures = 0
+
+    @staticmethod
+    def prefix_keys(user_id: int, turns: list[str]) -> list[str]:
+        #keys[i] identifies turns[:i + 1]
+        keys = []
+        digest = hashlib.sha256(str(user_id).encode("utf-8")).hexdigest()
+        for turn in turns:
+            digest = hashlib.sha256((digest + turn).encode("utf-8")).hexdigest()
+            keys.append(digest)
+        return keys
+
+    def _put(self, key: str, summary: str):
+        self._entries[key] = summary
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def summarize(self, user_id: int, turns: list[str]) -> str:
+        keys = self.prefix_keys(user_id, turns)
+        #longest already summarized prefix
+        start, previous = 0, ""
+        for i in range(len(keys) - 1, -1, -1):
+            if keys[i] in self._entries:
+                start, previous = i + 1, self._entries[keys[i]]
+                self._entries.move_to_end(keys[i])
+                break
+        if start == len(turns):
+            self.hits += 1
+            return previous
+
+        self.llm_calls += 1
+        summary = await summarize_conversation(previous, "\n".join(turns[start:]), HISTORY_SUMMARY_MAX_TOKENS)
+        self._put(keys[-1], summary)
+        return summary
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "llm_calls": self.llm_calls,
+            "failures": self.failures,
+            "exact_token_counts": _encoding is not None
+        }
+
+
+history_summaries = HistorySummaries()
+
+
+def fit_snippets(relevant_results: list[dict], max_tokens: int = PROMPT_SNIPPET_TOKEN_BUDGET) -> tuple[list[dict], int, int]:
+    #-> (results with oversized code_snippets cut, tokens used, number of snippets cut)
+    fitted, used, truncated = [], 0, 0
+    for r in relevant_results:
+        code, cut = truncate_to_tokens(r["code_snippet"] or "", max_tokens)
+        truncated += cut
+        used += count_tokens(r["description"] or "") + count_tokens(code)
+        fitted.append({**r, "code_snippet": code})
+    return fitted, used, truncated
+
+
+async def compact_history(user_id: int, conversation_history: list, budget: int) -> tuple[str, dict]:
+    #-> (conversation text within budget, stats). Newest turns verbatim, older ones as a rolling summary
+    turns = [format_turn(msg) for msg in conversation_history]
+    counts = [count_tokens(t) for t in turns]
+    stats = {"history_turns": len(turns), "history_tokens_in": sum(counts), "summarized_turns": 0}
+
+    if sum(counts) <= budget:
+        stats["history_tokens_out"] = stats["history_tokens_in"]
+        return "\n".join(turns), stats
+
+    #walk back from the newest turn, keeping room for the summary of whatever is older
+    verbatim_budget = max(0, budget - HISTORY_SUMMARY_MAX_TOKENS)
+    keep, used = 0, 0
+    while keep < min(len(turns), PROMPT_RECENT_TURNS) and used + counts[-1 - keep] <= verbatim_budget:
+        used += counts[-1 - keep]
+        keep += 1
+    recent = turns[len(turns) - keep:]
+    if not recent and turns:
+        #even the last turn alone is too long -> keep its beginning
+        recent = [truncate_to_tokens(turns[-1], verbatim_budget)[0]]
+        keep = 1
+
+    older = turns[:len(turns) - keep]
+    summary = ""
+    if older and not HISTORY_SUMMARY_ENABLED:
+        summary = f"({len(older)} earlier messages omitted)"
+        stats["summarized_turns"] = len(older)
+    elif older:
+        try:
+            summary = await history_summaries.summarize(user_id, older)
+        except Exception as e:
+            history_summaries.failures += 1
+            logger.warning(f"History summary failed for user {user_id}: {e}")
+            summary = f"({len(older)} earlier messages omitted)"
+        summary, _ = truncate_to_tokens(summary, HISTORY_SUMMARY_MAX_TOKENS)
+        stats["summarized_turns"] = len(older)
+
+    parts = ([f"Summary of earlier conversation: {summary}"] if summary else []) + recent
+    text = "\n".join(parts)
+    stats["history_tokens_out"] = count_tokens(text)
+    return text, stats
+
+
+async def fit_prompt(user_id: int, query: str, conversation_history: list, relevant_results: list[dict]) -> tuple[str, list[dict], dict]:
+    #-> (conversation context, results to show, stats) so that query + snippets + history fit PROMPT_TOKEN_BUDGET
+    results, snippet_tokens, truncated = fit_snippets(relevant_results)
+    query_tokens = count_tokens(query)
+    history_budget = max(0, min(PROMPT_HISTORY_TOKEN_BUDGET, PROMPT_TOKEN_BUDGET - query_tokens - snippet_tokens))
+    conversation_context, stats = await compact_history(user_id, conversation_history, history_budget)
+    stats.update({
+        "query_tokens": query_tokens,
+        "snippet_tokens": snippet_tokens,
+        "snippets_truncated": truncated,
+        "total_tokens": query_tokens + snippet_tokens + stats["history_tokens_out"]
+    })
+    logger.info(
+        f"Prompt budget user={user_id} " + " ".join(f"{name}={value}" for name, value in stats.items())
+    )
+    return conversation_context, results, stats
@@ -0,0 +1,37 @@
+# app/services/queries.py
+
+#column sets + small lookups shared by the routers (project ownership lives in app/services/project_ownership.py).
+#Only retrieval (rag, vector index, embedding worker) needs learnings.embedding: ~6KB per row to send and decode,
+#so listings and ownership checks name their columns instead of select(learnings).
+#python -m app.audit_queries fails if a hot endpoint selects it again.
+from typing import Optional
+from sqlalchemy import select, join
+from app.db import database
+from app.models.learnings import learnings
+from app.models.project import projects
+
+#everything a client may see of a learning (never the embedding)
+LEARNING_FIELDS = ("id", "file_path", "function_name", "library_name", "description", "code_snippet", "project_id", "user_id")
+LEARNING_LIST_COLUMNS = [learnings.c[field] for field in LEARNING_FIELDS]
+#enough to decide who may change / delete a learning
+LEARNING_OWNER_COLUMNS = [learnings.c.id, learnings.c.project_id, projects.c.user_id.label("owner_id")]
+
+
+async def learning_owner(learning_id: int) -> Optional[dict]:
+    #-> {"id", "project_id", "owner_id"} (owner = user owning the learning's project) or None
+    row = await database.fetch_one(
+        select(*LEARNING_OWNER_COLUMNS)
+        .select_from(join(learnings, projects, learnings.c.project_id == projects.c.id))
+        .where(learnings.c.id == learning_id)
+    )
+    return None if row is None else {"id": row["id"], "project_id": row["project_id"], "owner_id": row["owner_id"]}
+
+
+async def allocate_learning_ids(count: int) -> list:
+    #multi-row inserts that must pair each input with its id: postgres doesn't promise INSERT ... RETURNING rows in
+    #VALUES order, so take the ids from the sequence first (ascending) and insert them explicitly
+    rows = await database.fetch_all(
+        "SELECT nextval(pg_get_serial_sequence('learnings', 'id')) AS id FROM generate_series(1, :count)",
+        {"count": count}
+    )
+    return sorted(row["id"] for row in rows)
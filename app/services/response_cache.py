@@ -0,0 +1,110 @@
+# app/services/response_cache.py
+
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+#powered mode answers reused for (near) identical questions -> no gpt call, no quota
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+#cosine similarity between query embeddings needed for a hit (paraphrases land around 0.93-0.98)
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+RESPONSE_CACHE_MAX_PER_USER = int(os.getenv("RESPONSE_CACHE_MAX_PER_USER", "50"))
+RESPONSE_CACHE_MAX_USERS = int(os.getenv("RESPONSE_CACHE_MAX_USERS", "1000"))
+
+
+def history_hash(conversation_history) -> str:
+    #answers depend on the conversation too -> only reuse them for the same history
+    payload = json.dumps([[msg.is_user, msg.content] for msg in conversation_history])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CachedResponse:
+    def __init__(self, query_vector: np.ndarray, learning_ids: frozenset, history: str, response: str):
+        self.query_vector = query_vector
+        self.learning_ids = learning_ids
+        self.history = history
+        self.response = response
+        self.created_at = time.monotonic()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+        ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS,
+        max_per_user: int = RESPONSE_CACHE_MAX_PER_USER,
+        max_users: int = RESPONSE_CACHE_MAX_USERS
+    ):
+        self.enabled = enabled
+        self.similarity = similarity
+        self.ttl_seconds = ttl_seconds
+        self.max_per_user = max_per_user
+        self.max_users = max_users
+        #user_id -> entries, oldest first; users in LRU order
+        self._users: OrderedDict[int, list[CachedResponse]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def lookup(self, user_id: int, query_vector, learning_ids: list[int], history: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        entries = self._users.get(user_id)
+        if entries:
+            now = time.monotonic()
+            entries[:] = [e for e in entries if now - e.created_at < self.ttl_seconds]
+            ids = frozenset(learning_ids)
+            candidates = [e for e in entries if e.learning_ids == ids and e.history == history]
+            if candidates:
+                query = self._unit(query_vector)
+                scores = np.stack([e.query_vector for e in candidates]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    self._users.move_to_end(user_id)
+                    self.hits += 1
+                    return candidates[best].response
+        self.misses += 1
+        return None
+
+    def store(self, user_id: int, query_vector, learning_ids: list[int], history: str, response: str):
+        if not self.enabled or not response:
+            return
+        entries = self._users.setdefault(user_id, [])
+        entries.append(CachedResponse(self._unit(query_vector), frozenset(learning_ids), history, response))
+        del entries[:-self.max_per_user]
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def invalidate_learnings(self, user_id: int, learning_ids: list[int]):
+        #an answer built from a deleted learning must not be served again
+        entries = self._users.get(user_id)
+        if entries:
+            deleted = set(learning_ids)
+            entries[:] = [e for e in entries if not (e.learning_ids & deleted)]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "users": len(self._users),
+            "entries": sum(len(entries) for entries in self._users.values()),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+#shared cache used by app/routers/rag.py
+response_cache = ResponseCache()
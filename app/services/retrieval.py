@@ -0,0 +1,268 @@
+# app/services/retrieval.py
+
+import os
+import re
+import math
+from sqlalchemy import select, text, literal, literal_column, func, or_, and_
+from app.db import database
+from app.models.learnings import learnings
+#search effort settings live with the storage config: app/db.py applies them to every pooled connection
+from app.models.vector import EMBEDDING_PRECISION, HNSW_EF_SEARCH, IVFFLAT_PROBES
+from app.services.vector_index import vector_index
+from dotenv import load_dotenv
+
+load_dotenv()
+
+#ONE metric for both the ANN index and the ORDER BY -> otherwise postgres can't use the index and seq-scans
+#cosine | l2 | inner_product (openAI embeddings are unit length, so all three rank the same)
+VECTOR_DISTANCE_METRIC = os.getenv("VECTOR_DISTANCE_METRIC", "cosine")
+#hnsw (better recall/latency, no training) | ivfflat
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+
+#keyword search next to the vector search (fused with reciprocal rank fusion)
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+#skip the openAI embedding when the keyword search is confident (e.g. the query IS a function name)
+LEXICAL_FAST_PATH_ENABLED = os.getenv("LEXICAL_FAST_PATH_ENABLED", "true").lower() == "true"
+#only short, identifier like queries ("useEffect", "pd.read_csv") qualify for the fast path
+LEXICAL_FAST_PATH_MAX_TERMS = int(os.getenv("LEXICAL_FAST_PATH_MAX_TERMS", "3"))
+#...and only when the best keyword hit is strong (normalized rank 0..1). 0.5 ~ the words are in the function / library
+#names; generic words that only show up in descriptions ("error handling") rank lower and still go to the vector search
+LEXICAL_FAST_PATH_MIN_RANK = float(os.getenv("LEXICAL_FAST_PATH_MIN_RANK", "0.5"))
+LEXICAL_CANDIDATES = int(os.getenv("LEXICAL_CANDIDATES", "10"))
+#standard rrf constant: dampens the weight of the very top ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+#metric -> (operator class for the index, comparator method on the Vector column)
+METRICS = {
+    "cosine": ("vector_cosine_ops", "cosine_distance"),
+    "l2": ("vector_l2_ops", "l2_distance"),
+    "inner_product": ("vector_ip_ops", "max_inner_product"),
+}
+
+if VECTOR_DISTANCE_METRIC not in METRICS:
+    raise ValueError(f"VECTOR_DISTANCE_METRIC must be one of {', '.join(METRICS)}")
+if VECTOR_INDEX_TYPE not in ("hnsw", "ivfflat"):
+    raise ValueError("VECTOR_INDEX_TYPE must be hnsw or ivfflat")
+
+
+def vector_index_sql(index_type: str = VECTOR_INDEX_TYPE, metric: str = VECTOR_DISTANCE_METRIC) -> str:
+    opclass = METRICS[metric][0]
+    if EMBEDDING_PRECISION == "float16":
+        #halfvec_cosine_ops, ...
+        opclass = opclass.replace("vector_", "halfvec_")
+    if index_type == "hnsw":
+        options = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+    else:
+        options = f"lists = {IVFFLAT_LISTS}"
+    return f"""
+        CREATE INDEX IF NOT EXISTS idx_learnings_embedding
+        ON learnings
+        USING {index_type} (embedding {opclass})
+        WITH ({options});
+    """
+
+
+def rebuild_vector_index(conn):
+    #(sync) used by init_db and app.migrate -> drops + recreates the index only, rows are untouched
+    conn.execute(text("DROP INDEX IF EXISTS idx_learnings_embedding;"))
+    conn.execute(text(vector_index_sql()))
+
+
+#ONE expression for both the GIN index and the WHERE clause (otherwise the index is not used).
+#'simple' config (no stemming / stop words) + punctuation -> spaces so code like pd.read_csv or
+#use_effect becomes plain words on both sides. Names weigh most, then description, then code.
+LEXICAL_DOCUMENT_SQL = (
+    "(setweight(to_tsvector('simple'::regconfig, regexp_replace(coalesce(function_name, '') || ' ' || coalesce(library_name, ''), '[^[:alnum:]]+', ' ', 'g')), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, regexp_replace(description, '[^[:alnum:]]+', ' ', 'g')), 'B') || "
+    "setweight(to_tsvector('simple'::regconfig, regexp_replace(code_snippet, '[^[:alnum:]]+', ' ', 'g')), 'C'))"
+)
+
+
+def lexical_index_sql() -> str:
+    return f"""
+        CREATE INDEX IF NOT EXISTS idx_learnings_search
+        ON learnings
+        USING gin ({LEXICAL_DOCUMENT_SQL});
+    """
+
+
+def create_lexical_index(conn):
+    #(sync) used by app.migrate
+    conn.execute(text(lexical_index_sql()))
+
+
+def query_terms(query: str) -> list[str]:
+    #same normalization as LEXICAL_DOCUMENT_SQL, only letters/digits -> safe to build a tsquery from
+    return list(dict.fromkeys(t.lower() for t in re.findall(r"[^\W_]+", query)))
+
+
+#user's learnings matching the query's words, best first. rank is normalized to 0..1 (rank / (rank + 1)),
+#all_terms = every query word matched, name_match = the query is the function / library name
+async def lexical_search(user_id: int, query: str, limit: int = LEXICAL_CANDIDATES) -> list[dict]:
+    terms = query_terms(query)
+    if not terms:
+        return []
+    document = literal_column(LEXICAL_DOCUMENT_SQL)
+    config = literal_column("'simple'::regconfig")
+    any_terms = func.to_tsquery(config, " | ".join(terms))
+    every_term = func.to_tsquery(config, " & ".join(terms))
+    needle = query.strip().lower()
+    rank = func.ts_rank_cd(document, any_terms, 32).label("rank")
+    #coalesce: NULL names would otherwise sort first (DESC puts NULLs first)
+    name_match = func.coalesce(or_(
+        func.lower(learnings.c.function_name) == needle,
+        func.lower(learnings.c.library_name) == needle,
+        #"pd.read_csv" / "React.useEffect" -> qualified call of the function. right() instead of LIKE: the stored name
+        #is not a pattern ("_" in read_csv would match any character)
+        and_(
+            func.length(learnings.c.function_name) > 0,
+            func.right(literal(needle), func.length(learnings.c.function_name) + 1) == literal(".") + func.lower(learnings.c.function_name)
+        )
+    ), False).label("name_match")
+    rows = await database.fetch_all(
+        select(
+            learnings.c.id,
+            learnings.c.description,
+            learnings.c.code_snippet,
+            learnings.c.function_name,
+            learnings.c.library_name,
+            rank,
+            document.op("@@")(every_term).label("all_terms"),
+            name_match
+        )
+        .where(learnings.c.user_id == user_id, document.op("@@")(any_terms))
+        .order_by(name_match.desc(), rank.desc())
+        .limit(limit)
+    )
+    return [
+        {
+            "id": r["id"],
+            "description": r["description"],
+            "code_snippet": r["code_snippet"],
+            "function_name": r["function_name"],
+            "library_name": r["library_name"],
+            "rank": 1.0 if r["name_match"] else float(r["rank"]),
+            "all_terms": bool(r["all_terms"]),
+            "name_match": bool(r["name_match"])
+        }
+        for r in rows
+    ]
+
+
+def lexical_is_confident(query: str, rows: list[dict]) -> bool:
+    #the keyword results alone are good enough -> no embedding, no vector search
+    if not LEXICAL_FAST_PATH_ENABLED or not rows:
+        return False
+    if rows[0]["name_match"]:
+        return True
+    return (
+        len(query_terms(query)) <= LEXICAL_FAST_PATH_MAX_TERMS
+        and rows[0]["all_terms"]
+        and rows[0]["rank"] >= LEXICAL_FAST_PATH_MIN_RANK
+    )
+
+
+def lexical_results(rows: list[dict], limit: int = 3) -> list[dict]:
+    #keyword hits in the shape of search_learnings; "similarity" is derived from the rank so the rag
+    #cutoff and match % still apply (name match -> 0 = 100%, every word matched -> always under the cutoff)
+    return [
+        {
+            "id": r["id"],
+            "description": r["description"],
+            "code_snippet": r["code_snippet"],
+            "function_name": r["function_name"],
+            "library_name": r["library_name"],
+            "similarity": (1 - r["rank"]) * (1.0 if r["all_terms"] else 2.0)
+        }
+        for r in rows[:limit]
+    ]
+
+
+def reciprocal_rank_fusion(vector_rows: list[dict], lexical_rows: list[dict], limit: int = 3, k: int = RRF_K) -> list[dict]:
+    #score = sum of 1 / (k + rank) over both lists; keeps the vector similarity when a row has one
+    scores, rows = {}, {}
+    for results in (vector_rows, lexical_results(lexical_rows, len(lexical_rows))):
+        for position, r in enumerate(results):
+            scores[r["id"]] = scores.get(r["id"], 0.0) + 1.0 / (k + position + 1)
+            rows.setdefault(r["id"], r)
+    best = sorted(scores, key=lambda learning_id: scores[learning_id], reverse=True)[:limit]
+    return [rows[learning_id] for learning_id in best]
+
+
+def distance_expression(query_vector):
+    return getattr(learnings.c.embedding, METRICS[VECTOR_DISTANCE_METRIC][1])(query_vector)
+
+
+def to_l2_distance(distance: float, metric: str = VECTOR_DISTANCE_METRIC) -> float:
+    #rag relevance cutoff + match % were tuned on l2 distance -> convert (exact for unit vectors)
+    if metric == "cosine":
+        return math.sqrt(max(0.0, 2 * distance))
+    if metric == "inner_product":
+        #<#> is the NEGATIVE inner product
+        return math.sqrt(max(0.0, 2 + 2 * distance))
+    return distance
+
+
+def _with_similarity(rows) -> list[dict]:
+    return [
+        {
+            "id": r["id"],
+            "description": r["description"],
+            "code_snippet": r["code_snippet"],
+            "function_name": r["function_name"],
+            "library_name": r["library_name"],
+            "similarity": to_l2_distance(r["distance"])
+        }
+        for r in rows
+    ]
+
+
+#top-k learnings of a user closest to the query vector
+#rows carry "similarity" = l2-equivalent distance (smaller is closer)
+async def search_learnings(user_id: int, query_vector, limit: int = 3, ef_search: int = HNSW_EF_SEARCH, probes: int = IVFFLAT_PROBES) -> list[dict]:
+    #small corpora: exact search in memory (None -> disabled or corpus too large -> postgres)
+    rows = await vector_index.search(user_id, query_vector, limit, VECTOR_DISTANCE_METRIC)
+    if rows is not None:
+        return _with_similarity(rows)
+
+    distance = distance_expression(query_vector).label("distance")
+
+    def nearest(order_by):
+        return (
+            select(
+                learnings.c.id,
+                learnings.c.description,
+                learnings.c.code_snippet,
+                learnings.c.function_name,
+                learnings.c.library_name,
+                distance
+            )
+            .where(learnings.c.user_id == user_id, learnings.c.embedding.isnot(None))
+            .order_by(order_by)
+            .limit(limit)
+        )
+
+    query = nearest(distance)
+    overrides = {}
+    if VECTOR_INDEX_TYPE == "hnsw" and ef_search != HNSW_EF_SEARCH:
+        overrides["hnsw.ef_search"] = int(ef_search)
+    if VECTOR_INDEX_TYPE == "ivfflat" and probes != IVFFLAT_PROBES:
+        overrides["ivfflat.probes"] = int(probes)
+    if overrides:
+        #non-default effort (benchmarks / tuning): SET LOCAL only lasts for this transaction
+        async with database.transaction():
+            for name, value in overrides.items():
+                await database.execute(f"SET LOCAL {name} = {value}")
+            rows = await database.fetch_all(query)
+    else:
+        rows = await database.fetch_all(query)
+
+    if len(rows) < limit:
+        #the user has fewer embedded learnings than that, or the index ran out of candidates after the user_id filter
+        #(no iterative scan on this server) -> exact scan of the user's rows: "distance + 0" can't use the ann index
+        rows = await database.fetch_all(nearest(distance_expression(query_vector) + 0))
+    #relaxed_order may return the k rows slightly out of order
+    return _with_similarity(sorted(rows, key=lambda r: r["distance"]))
@@ -0,0 +1,203 @@
+# app/services/usage.py
+
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.db import database
+from app.models.usage_limits import usage_limits
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MONTHLY_QUERY_LIMIT = 15
+#"true" -> count in memory and flush increments in batches (no db round trip per powered query).
+#the limit is then enforced per app instance, so only use it with a single instance
+USAGE_WRITE_BEHIND = os.getenv("USAGE_WRITE_BEHIND", "false").lower() == "true"
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "5"))
+#how often rows of previous months are deleted
+USAGE_SWEEP_SECONDS = float(os.getenv("USAGE_SWEEP_SECONDS", "3600"))
+
+
+def current_month_key() -> str:
+    return datetime.utcnow().strftime("%Y-%m")
+
+
+class UsageMeter:
+    def __init__(self, limit: int = MONTHLY_QUERY_LIMIT, write_behind: bool = USAGE_WRITE_BEHIND):
+        self.limit = limit
+        self.write_behind = write_behind
+        #(user_id, month_key) -> count including unflushed increments (write behind only: this process is then the
+        #only writer, so it is the real count; otherwise the usage_limits row is)
+        self._counts: dict[tuple[int, str], int] = {}
+        #(user_id, month_key) -> increments not yet written (write behind only, refunds are negative)
+        self._pending: dict[tuple[int, str], int] = {}
+        self._task = None
+        self._stopping = asyncio.Event()
+        self.flushes = 0
+
+    async def _fetch(self, key: tuple[int, str]) -> int:
+        #uses index: unique_user_month
+        result = await database.fetch_one(
+            select(usage_limits.c.powered_queries_count).where(
+                usage_limits.c.user_id == key[0],
+                usage_limits.c.month_key == key[1]
+            )
+        )
+        return (result["powered_queries_count"] or 0) if result else 0
+
+    async def _load(self, key: tuple[int, str]) -> int:
+        count = await self._fetch(key)
+        #increments made while the lookup was in flight win
+        return self._counts.setdefault(key, count)
+
+    async def current(self, user_id: int) -> int:
+        key = (user_id, current_month_key())
+        if not self.write_behind:
+            #other workers / instances reserve and refund too -> only the row is current
+            return await self._fetch(key)
+        if key in self._counts:
+            return self._counts[key]
+        return await self._load(key)
+
+    async def reserve(self, user_id: int) -> Optional[int]:
+        #takes one powered query from this month's quota -> new count, or None if the limit is reached
+        key = (user_id, current_month_key())
+
+        if self.write_behind:
+            count = self._counts[key] if key in self._counts else await self._load(key)
+            if count >= self.limit:
+                return None
+            self._counts[key] = count + 1
+            self._pending[key] = self._pending.get(key, 0) + 1
+            return count + 1
+
+        #one statement on unique_user_month: creates the month row or increments it only while under
+        #the limit -> no race between two requests, no row returned when the limit is reached
+        query = pg_insert(usage_limits).values(
+            user_id=user_id,
+            month_key=key[1],
+            powered_queries_count=1
+        )
+        query = query.on_conflict_do_update(
+            constraint="unique_user_month",
+            set_={"powered_queries_count": usage_limits.c.powered_queries_count + 1},
+            where=usage_limits.c.powered_queries_count < self.limit
+        ).returning(usage_limits.c.powered_queries_count)
+        result = await database.fetch_one(query)
+        if result is None:
+            return None
+        return result["powered_queries_count"]
+
+    async def refund(self, user_id: int):
+        #gives back a reserved query (the llm call failed, the user got no answer)
+        key = (user_id, current_month_key())
+        if self.write_behind:
+            if key in self._counts:
+                self._counts[key] = max(0, self._counts[key] - 1)
+            self._pending[key] = self._pending.get(key, 0) - 1
+            return
+
+        await database.execute(
+            update(usage_limits).where(
+                usage_limits.c.user_id == user_id,
+                usage_limits.c.month_key == key[1],
+                usage_limits.c.powered_queries_count > 0
+            ).values(
+                powered_queries_count=usage_limits.c.powered_queries_count - 1
+            )
+        )
+
+    async def flush(self):
+        #writes pending increments with ONE multi-row upsert
+        pending = {key: delta for key, delta in self._pending.items() if delta}
+        self._pending.clear()
+        if not pending:
+            return
+        try:
+            increments = {key: delta for key, delta in pending.items() if delta > 0}
+            if increments:
+                query = pg_insert(usage_limits).values([
+                    {"user_id": user_id, "month_key": month_key, "powered_queries_count": delta}
+                    for (user_id, month_key), delta in increments.items()
+                ])
+                query = query.on_conflict_do_update(
+                    constraint="unique_user_month",
+                    set_={"powered_queries_count": usage_limits.c.powered_queries_count + query.excluded.powered_queries_count}
+                )
+                await database.execute(query)
+            #net refunds (rare) only ever apply to rows that already exist
+            for (user_id, month_key), delta in pending.items():
+                if delta < 0:
+                    await database.execute(
+                        update(usage_limits).where(
+                            usage_limits.c.user_id == user_id,
+                            usage_limits.c.month_key == month_key
+                        ).values(
+                            powered_queries_count=func.greatest(usage_limits.c.powered_queries_count + delta, 0)
+                        )
+                    )
+            self.flushes += 1
+        except Exception:
+            #put them back so the next flush retries
+            for key, delta in pending.items():
+                self._pending[key] = self._pending.get(key, 0) + delta
+            raise
+
+    async def sweep(self):
+        #previous months are never read again
+        month_key = current_month_key()
+        await database.execute(delete(usage_limits).where(usage_limits.c.month_key < month_key))
+        for key in [k for k in self._counts if k[1] != month_key]:
+            self._counts.pop(key, None)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        last_sweep = 0.0
+        while not self._stopping.is_set():
+            try:
+                if self.write_behind:
+                    await self.flush()
+                if loop.time() - last_sweep >= USAGE_SWEEP_SECONDS:
+                    await self.sweep()
+                    last_sweep = loop.time()
+            except Exception as e:
+                logger.error(f"Usage meter background work failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=USAGE_FLUSH_SECONDS if self.write_behind else USAGE_SWEEP_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        #don't lose counts on shutdown
+        if self.write_behind:
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Final usage flush failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "write_behind": self.write_behind,
+            "tracked_users": len(self._counts),
+            "pending_increments": sum(self._pending.values()),
+            "flushes": self.flushes
+        }
+
+
+#shared meter used by app/routers/rag.py (started / stopped with the app)
+usage_meter = UsageMeter()
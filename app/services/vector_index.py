@@ -0,0 +1,260 @@
+# app/services/vector_index.py
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from sqlalchemy import select
+from app.db import database
+from app.models.learnings import learnings
+from app.models.vector import as_float32
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+#optional: serve /rag/query for small corpora from memory instead of a postgres round trip
+VECTOR_INDEX_IN_MEMORY = os.getenv("VECTOR_INDEX_IN_MEMORY", "false").lower() == "true"
+#users with more embedded learnings than this stay on postgres (hnsw index)
+VECTOR_INDEX_MAX_ROWS_PER_USER = int(os.getenv("VECTOR_INDEX_MAX_ROWS_PER_USER", "5000"))
+#total memory for all loaded users, least recently used users are evicted past this
+VECTOR_INDEX_MEMORY_BUDGET_MB = int(os.getenv("VECTOR_INDEX_MEMORY_BUDGET_MB", "256"))
+#upper bound on staleness when several app instances write (invalidation is only in-process)
+VECTOR_INDEX_TTL_SECONDS = int(os.getenv("VECTOR_INDEX_TTL_SECONDS", "300"))
+
+#what a search result needs besides the vector
+META_FIELDS = ("description", "code_snippet", "function_name", "library_name")
+
+
+class UserIndex:
+    #one user's embedded learnings: contiguous float32 matrix + parallel ids / metadata
+    def __init__(self, ids: np.ndarray, matrix: np.ndarray, meta: list[dict]):
+        self.ids = ids
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.meta = meta
+        #precomputed for l2 / cosine so a search is a single matrix-vector product
+        self.norms = np.linalg.norm(self.matrix, axis=1) if len(ids) else np.zeros(0, dtype=np.float32)
+        self.loaded_at = time.monotonic()
+        self.nbytes = self.matrix.nbytes + self.ids.nbytes + self.norms.nbytes + sum(
+            len(m["description"] or "") + len(m["code_snippet"] or "") + 64 for m in meta
+        )
+        #writes since the matrix was built, folded in once by the next search (not one O(n) copy per learning)
+        self.pending_rows: dict[int, dict] = {}
+        self.pending_removed: set[int] = set()
+
+    @property
+    def size(self) -> int:
+        return len(self.ids) + len(self.pending_rows)
+
+    def compacted(self) -> "UserIndex":
+        replaced = self.pending_removed | set(self.pending_rows)
+        keep = [i for i, learning_id in enumerate(self.ids) if int(learning_id) not in replaced]
+        rows = list(self.pending_rows.values())
+        updated = UserIndex(
+            ids=np.concatenate([self.ids[keep], np.array([r["id"] for r in rows], dtype=np.int64)]),
+            matrix=np.vstack([self.matrix[keep]] + [as_float32(r["embedding"]) for r in rows]),
+            meta=[self.meta[i] for i in keep] + [{f: r[f] for f in META_FIELDS} for r in rows]
+        )
+        updated.loaded_at = self.loaded_at
+        return updated
+
+    def distances(self, query: np.ndarray, metric: str) -> np.ndarray:
+        dots = self.matrix @ query
+        if metric == "cosine":
+            return 1.0 - dots / np.maximum(self.norms * np.linalg.norm(query), 1e-12)
+        if metric == "inner_product":
+            return -dots
+        return np.sqrt(np.maximum(self.norms ** 2 + float(query @ query) - 2 * dots, 0.0))
+
+    def top_k(self, query: np.ndarray, k: int, metric: str) -> list[tuple[int, float]]:
+        n = len(self.ids)
+        if n == 0:
+            return []
+        dist = self.distances(query, metric)
+        k = min(k, n)
+        #argpartition is O(n), only the k winners get sorted
+        candidates = np.argpartition(dist, k - 1)[:k] if k < n else np.arange(n)
+        order = candidates[np.argsort(dist[candidates])]
+        return [(int(i), float(dist[i])) for i in order]
+
+
+class TooLarge:
+    #marker for a user with more than max_rows_per_user embedded learnings (searched in postgres). Kept in the same
+    #LRU as the indexes, so these are evicted with everything else instead of piling up
+    nbytes = 64
+
+    def __init__(self):
+        self.loaded_at = time.monotonic()
+
+
+class InMemoryVectorIndex:
+    def __init__(
+        self,
+        enabled: bool = VECTOR_INDEX_IN_MEMORY,
+        max_rows_per_user: int = VECTOR_INDEX_MAX_ROWS_PER_USER,
+        memory_budget_bytes: int = VECTOR_INDEX_MEMORY_BUDGET_MB * 1024 * 1024,
+        ttl_seconds: int = VECTOR_INDEX_TTL_SECONDS
+    ):
+        self.enabled = enabled
+        self.max_rows_per_user = max_rows_per_user
+        self.memory_budget_bytes = memory_budget_bytes
+        self.ttl_seconds = ttl_seconds
+        #user_id -> UserIndex | TooLarge, least recently used first
+        self._users: OrderedDict[int, object] = OrderedDict()
+        #loads in flight (one per user, shared by concurrent searches) -> only ever as many entries as running loads
+        self._loading: dict[int, asyncio.Future] = {}
+        #users written to while their load was in flight -> that load is thrown away instead of installed
+        self._stale_loads: set[int] = set()
+        self.bytes_used = 0
+        self.hits = 0
+        self.loads = 0
+        self.compactions = 0
+        self.fallbacks = 0
+        self.evictions = 0
+
+    def _drop(self, user_id: int):
+        entry = self._users.pop(user_id, None)
+        if entry is not None:
+            self.bytes_used -= entry.nbytes
+
+    def _install(self, user_id: int, entry):
+        self._drop(user_id)
+        self._users[user_id] = entry
+        self.bytes_used += entry.nbytes
+        #evict least recently used users until back under budget (never the one just installed)
+        while self.bytes_used > self.memory_budget_bytes and len(self._users) > 1:
+            oldest = next(iter(self._users))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _changed(self, user_id: int):
+        if user_id in self._loading:
+            self._stale_loads.add(user_id)
+
+    async def _load(self, user_id: int):
+        rows = await database.fetch_all(
+            select(learnings.c.id, learnings.c.embedding, *[learnings.c[f] for f in META_FIELDS])
+            .where(learnings.c.user_id == user_id, learnings.c.embedding.isnot(None))
+            .limit(self.max_rows_per_user + 1)
+        )
+        if len(rows) > self.max_rows_per_user:
+            entry = TooLarge()
+        else:
+            dim = len(rows[0]["embedding"]) if rows else 0
+            entry = UserIndex(
+                ids=np.array([r["id"] for r in rows], dtype=np.int64),
+                matrix=np.vstack([as_float32(r["embedding"]) for r in rows]) if rows else np.zeros((0, dim), dtype=np.float32),
+                meta=[{f: r[f] for f in META_FIELDS} for r in rows]
+            )
+            self.loads += 1
+        if user_id in self._stale_loads:
+            self._stale_loads.discard(user_id)
+        else:
+            self._install(user_id, entry)
+        return entry
+
+    def _fresh(self, user_id: int):
+        entry = self._users.get(user_id)
+        if entry is not None and time.monotonic() - entry.loaded_at < self.ttl_seconds:
+            self._users.move_to_end(user_id)
+            return entry
+        return None
+
+    async def get(self, user_id: int) -> Optional[UserIndex]:
+        #None -> this user should be searched in postgres
+        entry = self._fresh(user_id)
+        if entry is None:
+            pending = self._loading.get(user_id)
+            if pending is None:
+                self._stale_loads.discard(user_id)
+                pending = asyncio.ensure_future(self._load(user_id))
+                self._loading[user_id] = pending
+                pending.add_done_callback(lambda _: self._loading.pop(user_id, None))
+            #shield: a cancelled request doesn't cancel the load other searches are waiting on
+            entry = await asyncio.shield(pending)
+        if isinstance(entry, TooLarge):
+            return None
+        if entry.pending_rows or entry.pending_removed:
+            installed = self._users.get(user_id) is entry
+            entry = entry.compacted()
+            self.compactions += 1
+            if installed:
+                self._install(user_id, entry)
+        return entry
+
+    async def search(self, user_id: int, query_vector, limit: int, metric: str) -> Optional[list[dict]]:
+        #rows shaped like the postgres search with the RAW metric distance, or None to fall back
+        if not self.enabled:
+            return None
+        try:
+            index = await self.get(user_id)
+        except Exception as e:
+            logger.warning(f"In-memory vector index load failed for user {user_id}: {e}")
+            index = None
+        if index is None:
+            self.fallbacks += 1
+            return None
+
+        self.hits += 1
+        query = np.asarray(query_vector, dtype=np.float32)
+        return [
+            {"id": int(index.ids[i]), **index.meta[i], "distance": distance}
+            for i, distance in index.top_k(query, limit, metric)
+        ]
+
+    def add(self, user_id: int, rows: list[dict]):
+        #newly embedded learnings -> queued on a loaded user (folded in by its next search), otherwise the next load
+        #picks them up
+        if not self.enabled:
+            return
+        self._changed(user_id)
+        index = self._users.get(user_id)
+        if not isinstance(index, UserIndex):
+            return
+        for r in rows:
+            index.pending_rows[int(r["id"])] = r
+            index.pending_removed.discard(int(r["id"]))
+        if index.size > self.max_rows_per_user:
+            self._drop(user_id)
+
+    def remove(self, user_id: int, learning_ids: list[int]):
+        if not self.enabled:
+            return
+        self._changed(user_id)
+        index = self._users.get(user_id)
+        if not isinstance(index, UserIndex):
+            return
+        for learning_id in learning_ids:
+            index.pending_rows.pop(int(learning_id), None)
+            index.pending_removed.add(int(learning_id))
+
+    def invalidate(self, user_id: Optional[int] = None):
+        #drop one user (or everyone, e.g. after a re-embed) -> reloaded lazily
+        if user_id is None:
+            self._stale_loads.update(self._loading)
+            self._users.clear()
+            self.bytes_used = 0
+            return
+        self._changed(user_id)
+        self._drop(user_id)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "users_loaded": len(self._users),
+            "bytes_used": self.bytes_used,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "loads": self.loads,
+            "compactions": self.compactions,
+            "evictions": self.evictions
+        }
+
+
+#shared index used by app.services.retrieval
+vector_index = InMemoryVectorIndex()